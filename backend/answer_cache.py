@@ -0,0 +1,197 @@
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a question"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+class SharedStream:
+    """
+    Deltas of one in-flight streamed answer, replayable by any number of
+    followers: each gets everything produced so far, then the rest as it
+    arrives, and the producer's error if it fails. followers counts the
+    callers still reading it.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task: Optional[asyncio.Future] = None
+        self.followers = 0
+
+    def append(self, delta: str) -> None:
+        self.parts.append(delta)
+        self._changed.set()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.done = True
+        self.error = error
+        self._changed.set()
+
+    async def follow(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class AnswerCache:
+    """
+    TTL + LRU cache of generated answers with single-flight deduplication.
+
+    Entries are keyed on the normalized question plus a knowledge-base version
+    stamp, so any upload or delete makes older answers unreachable instead of
+    stale. Concurrent callers asking the same question share one in-flight
+    computation, which keeps running while any of them still waits for it
+    (so the caller that started it can go away) and is cancelled once the
+    last one has; failures are propagated to every waiter and never cached.
+    stream() does the same for streamed answers: callers that arrive while
+    an answer is streaming replay its deltas instead of starting another
+    generation.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[str, float]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        # Callers awaiting each in-flight computation
+        self._waiters: Dict[asyncio.Future, int] = {}
+        self._streams: Dict[Tuple[str, Hashable], SharedStream] = {}
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "coalesced": 0, "abandoned": 0}
+
+    def key(self, question: str, version: Hashable) -> Tuple[str, Hashable]:
+        return normalize_question(question), version
+
+    def get(self, question: str, version: Hashable) -> Optional[str]:
+        key = self.key(question, version)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    def put(self, question: str, version: Hashable, answer: str) -> None:
+        key = self.key(question, version)
+        self._entries[key] = (answer, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self, question: str, version: Hashable, compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        answer = self.get(question, version)
+        if answer is not None:
+            self.stats["hits"] += 1
+            return answer
+
+        key = self.key(question, version)
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            # The computation runs as its own task so that no single caller
+            # being cancelled tears it down for the others
+            in_flight = asyncio.ensure_future(compute())
+            self._in_flight[key] = in_flight
+
+            def finished(task: asyncio.Future) -> None:
+                if self._in_flight.get(key) is task:
+                    del self._in_flight[key]
+                if not task.cancelled() and task.exception() is None:
+                    self.put(question, version, task.result())
+
+            in_flight.add_done_callback(finished)
+        self._waiters[in_flight] = self._waiters.get(in_flight, 0) + 1
+        try:
+            return await asyncio.shield(in_flight)
+        finally:
+            self._waiters[in_flight] -= 1
+            if not self._waiters[in_flight]:
+                del self._waiters[in_flight]
+                if not in_flight.done():
+                    # Nobody is left to use the answer; stop paying for it
+                    self._abandon(key, in_flight)
+
+    async def stream(
+        self, question: str, version: Hashable, produce: Callable[[], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Yield a cached answer whole, or the deltas of the one in-flight stream for this question"""
+        answer = self.get(question, version)
+        if answer is not None:
+            self.stats["hits"] += 1
+            yield answer
+            return
+
+        key = self.key(question, version)
+        shared = self._streams.get(key)
+        if shared is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            shared = SharedStream()
+            self._streams[key] = shared
+
+            async def run() -> None:
+                try:
+                    async for delta in produce():
+                        shared.append(delta)
+                except asyncio.CancelledError as e:
+                    shared.finish(e)
+                    raise
+                except Exception as e:
+                    shared.finish(e)
+                else:
+                    self.put(question, version, "".join(shared.parts))
+                    shared.finish()
+                finally:
+                    if self._streams.get(key) is shared:
+                        del self._streams[key]
+
+            # Like get_or_compute, generation outlives the caller that started it
+            # but not the last caller still following it
+            shared.task = asyncio.ensure_future(run())
+
+        shared.followers += 1
+        try:
+            async for delta in shared.follow():
+                yield delta
+        finally:
+            shared.followers -= 1
+            if not shared.followers and not shared.done:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+                self._abandon(key, shared.task)
+
+    def _abandon(self, key: Tuple[str, Hashable], task: asyncio.Future) -> None:
+        """Cancel a computation every caller has given up on, so later callers start afresh"""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        task.cancel()
+        self.stats["abandoned"] += 1
+
+    def info(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "inFlight": len(self._in_flight) + len(self._streams), **self.stats}
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AssistanceWorker:
+    """
+    Per-session background producer of assistance suggestions.
+
+    The transcript receive loop only calls submit() and moves on, so a slow
+    model never delays partial transcripts. Finals arriving within
+    coalesce_seconds of each other are answered with a single request, and
+    newer speech arriving while a request is in flight supersedes it: the
+    stale request is cancelled and restarted with the combined text (at most
+    max_supersede times in a row, so a talkative caller still gets answers).
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[Any]],
+        send: Callable[[Any], Awaitable[None]],
+        max_queue: int = 16,
+        coalesce_seconds: float = 0.4,
+        max_supersede: int = 2,
+        max_chars: int = 2000,
+    ):
+        self.generate = generate
+        self.send = send
+        self.coalesce_seconds = coalesce_seconds
+        self.max_supersede = max_supersede
+        self.max_chars = max_chars
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"submitted": 0, "coalesced": 0, "superseded": 0, "dropped": 0, "completed": 0}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def submit(self, text: str) -> None:
+        """Queue a final utterance without waiting; the oldest is dropped when the queue is full"""
+        self.stats["submitted"] += 1
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.stats["dropped"] += 1
+        self._queue.put_nowait(text)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _combine(self, texts: List[str]) -> str:
+        combined = " ".join(t.strip() for t in texts if t.strip())
+        if len(combined) > self.max_chars:
+            combined = combined[-self.max_chars:]
+        return combined
+
+    async def _collect(self, pending: List[str]) -> None:
+        """Gather further finals that arrive within the coalescing window"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.coalesce_seconds
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                self.stats["coalesced"] += 1
+            except asyncio.TimeoutError:
+                return
+
+    async def _run(self) -> None:
+        pending: List[str] = []
+        superseded_in_row = 0
+        while True:
+            if not pending:
+                pending.append(await self._queue.get())
+            await self._collect(pending)
+            text = self._combine(pending)
+            pending = []
+
+            request = asyncio.create_task(self.generate(text))
+            cancelled = False
+            try:
+                while not request.done():
+                    newer = asyncio.create_task(self._queue.get())
+                    await asyncio.wait({request, newer}, return_when=asyncio.FIRST_COMPLETED)
+                    if not newer.done():
+                        newer.cancel()
+                        await asyncio.gather(newer, return_exceptions=True)
+                    if newer.done() and not newer.cancelled():
+                        pending.append(newer.result())
+                        if not request.done() and superseded_in_row < self.max_supersede:
+                            # Newer speech makes this suggestion stale; restart with everything said
+                            request.cancel()
+                            await asyncio.gather(request, return_exceptions=True)
+                            pending.insert(0, text)
+                            superseded_in_row += 1
+                            self.stats["superseded"] += 1
+                            cancelled = True
+                            break
+            except asyncio.CancelledError:
+                request.cancel()
+                raise
+            if cancelled:
+                continue
+
+            superseded_in_row = 0
+            try:
+                suggestion = request.result()
+            except Exception as e:
+                logger.error(f"Assistance generation failed: {str(e)}")
+                logger.error(traceback.format_exc())
+                continue
+            try:
+                await self.send(suggestion)
+                self.stats["completed"] += 1
+            except Exception as e:
+                logger.error(f"Error sending assistance: {str(e)}")
@@ -0,0 +1,51 @@
+import threading
+from typing import Any, Callable, Optional
+
+# boto3 sessions are not thread-safe, so clients are built one at a time.
+# Reentrant because a resource's factory may build the resource it hangs off.
+_build_lock = threading.RLock()
+
+
+class LazyClient:
+    """
+    A boto3 client or resource built on first use.
+
+    Building a client loads and parses its service model, which is the bulk
+    of import-time cost; deferring it keeps startup fast and lets the warm-up
+    phase build the clients off the event loop, before any request needs
+    them. Attribute access is forwarded to the real client, so a LazyClient
+    can be handed to code that expects one.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str = ""):
+        self._factory = factory
+        self._name = name
+        self._client: Optional[Any] = None
+
+    def get(self) -> Any:
+        client = self._client
+        if client is None:
+            with _build_lock:
+                if self._client is None:
+                    self._client = self._factory()
+                client = self._client
+        return client
+
+    @property
+    def built(self) -> bool:
+        return self._client is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get(), name)
+
+    def close(self) -> None:
+        """Close the connection pool if the client was ever built"""
+        with _build_lock:
+            client, self._client = self._client, None
+        # Resources close through their low-level client
+        client = getattr(getattr(client, "meta", None), "client", client)
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+    def __repr__(self) -> str:
+        return f"<LazyClient {self._name or self._factory!r} built={self.built}>"
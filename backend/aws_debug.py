@@ -0,0 +1,100 @@
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable
+
+# True while handling a request that asked for AWS wire logging
+aws_wire_debug: contextvars.ContextVar[bool] = contextvars.ContextVar("aws_wire_debug", default=False)
+
+WIRE_LOGGERS = ("botocore", "boto3")
+
+
+class WireDebugFilter(logging.Filter):
+    """Lets warnings and errors through, and debug/info only for opted-in requests"""
+
+    def __init__(self, quiet_level: int):
+        super().__init__()
+        self.quiet_level = quiet_level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.quiet_level or aws_wire_debug.get()
+
+
+class WireDebug:
+    """
+    Per-request botocore/boto3 DEBUG logging.
+
+    The loggers sit at WARNING, so normal traffic doesn't even build debug
+    records. While at least one opted-in request is running they drop to
+    DEBUG, and a filter keyed on a context variable only lets through records
+    emitted on behalf of those requests. Work handed to executors must run
+    via in_context() so the variable follows it onto the worker thread.
+    """
+
+    def __init__(self, quiet_level: int = logging.WARNING):
+        self.quiet_level = quiet_level
+        self._active = 0
+        self._lock = threading.Lock()
+        self._handler = logging.StreamHandler()
+        self._handler.setLevel(logging.DEBUG)
+        self._handler.addFilter(WireDebugFilter(quiet_level))
+        self._handler.setFormatter(logging.Formatter("%(asctime)s %(name)s [%(levelname)s] %(message)s"))
+
+    def install(self) -> None:
+        for name in WIRE_LOGGERS:
+            logger = logging.getLogger(name)
+            logger.setLevel(self.quiet_level)
+            # Wire records only go to the filtered handler, never to root
+            logger.addHandler(self._handler)
+            logger.propagate = False
+
+    @contextmanager
+    def enabled(self):
+        token = aws_wire_debug.set(True)
+        with self._lock:
+            self._active += 1
+            if self._active == 1:
+                for name in WIRE_LOGGERS:
+                    logging.getLogger(name).setLevel(logging.DEBUG)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                if self._active == 0:
+                    for name in WIRE_LOGGERS:
+                        logging.getLogger(name).setLevel(self.quiet_level)
+            aws_wire_debug.reset(token)
+
+
+def in_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Bind fn to the caller's context variables, for run_in_executor"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class WireDebugMiddleware:
+    """
+    ASGI middleware turning on AWS wire logging for requests that carry the
+    X-Debug-AWS: 1 header (or ?debug_aws=1, for browser websockets). Being
+    plain ASGI, it covers streamed response bodies and websocket sessions too.
+    """
+
+    def __init__(self, app, wire_debug: WireDebug):
+        self.app = app
+        self.wire_debug = wire_debug
+
+    @staticmethod
+    def _requested(scope) -> bool:
+        for name, value in scope.get("headers", []):
+            if name == b"x-debug-aws":
+                return value.lower() in (b"1", b"true")
+        return b"debug_aws=1" in scope.get("query_string", b"").split(b"&")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and self._requested(scope):
+            with self.wire_debug.enabled():
+                await self.app(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,193 @@
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from aws_debug import in_context
+
+logger = logging.getLogger(__name__)
+
+# Lower values are admitted first
+PRIORITY_LIVE = 0
+PRIORITY_CHAT = 1
+PRIORITY_BACKGROUND = 2
+
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"}
+RETRYABLE_CODES = THROTTLING_CODES | {"ServiceUnavailableException", "ModelNotReadyException", "InternalServerException"}
+
+
+def error_code(error: BaseException) -> Optional[str]:
+    if isinstance(error, ClientError):
+        return error.response.get('Error', {}).get('Code')
+    return None
+
+
+def is_throttling(error: BaseException) -> bool:
+    return error_code(error) in THROTTLING_CODES
+
+
+class BedrockLimiter:
+    """
+    Process-wide admission control for Bedrock calls.
+
+    A call needs both a token from a token bucket (rate_per_second, up to
+    burst saved up) and one of the in-flight slots. The slot count adapts
+    AIMD-style: each success grows it by 1/limit (about one slot per round of
+    calls) up to max_in_flight, and throttling halves it, at most once per
+    decrease_interval so a burst of rejections counts as one signal.
+    Throttled and transient failures are retried with full-jitter exponential
+    backoff. Waiters are admitted in priority order, so live-call assistance
+    overtakes queued chatbot traffic. Calls run on the limiter's own thread
+    pool rather than the event loop's default executor.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float = 10.0,
+        burst: int = 10,
+        max_in_flight: int = 16,
+        min_in_flight: int = 1,
+        decrease_factor: float = 0.5,
+        decrease_interval: float = 1.0,
+        max_retries: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+    ):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.min_in_flight = min_in_flight
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = float(max_in_flight)
+        self.in_flight = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="bedrock")
+        self.stats: Dict[str, int] = {"admitted": 0, "throttled": 0, "retried": 0, "failed": 0}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_second)
+        self._refilled_at = now
+
+    def _has_capacity(self) -> bool:
+        if self.in_flight >= max(self.min_in_flight, int(self.limit)):
+            return False
+        if not self.rate_per_second:
+            return True
+        self._refill()
+        return self._tokens >= 1
+
+    def _admit(self) -> None:
+        if self.rate_per_second:
+            self._tokens -= 1
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+
+    def _dispatch(self) -> None:
+        while self._waiters:
+            if self._waiters[0][2].done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            if not self._has_capacity():
+                break
+            _, _, waiter = heapq.heappop(self._waiters)
+            self._admit()
+            waiter.set_result(None)
+        if self._waiters and self._wakeup is None and self.in_flight < int(self.limit) and self.rate_per_second:
+            # Out of tokens rather than slots: come back when the next one accrues
+            delay = max(0.0, (1 - self._tokens) / self.rate_per_second)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    async def acquire(self, priority: int = PRIORITY_CHAT) -> None:
+        if not self._waiters and self._has_capacity():
+            self._admit()
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), waiter))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Admitted just as the caller went away; hand the slot back
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _on_success(self) -> None:
+        self.limit = min(self.max_in_flight, self.limit + 1 / self.limit)
+
+    def _on_throttle(self) -> None:
+        self.stats["throttled"] += 1
+        now = time.monotonic()
+        if now - self._decreased_at >= self.decrease_interval:
+            self._decreased_at = now
+            self.limit = max(self.min_in_flight, self.limit * self.decrease_factor)
+            logger.warning(f"Bedrock throttling; in-flight limit lowered to {int(self.limit)}")
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, fn: Callable[[], Any], priority: int = PRIORITY_CHAT) -> Any:
+        """Run a blocking Bedrock call under admission control, retrying throttles and transient errors"""
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            await self.acquire(priority)
+            future = loop.run_in_executor(self._executor, in_context(fn))
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The thread can't be interrupted, so its slot is held until it finishes
+                future.add_done_callback(lambda _: self.release())
+                raise
+            except Exception as e:
+                self.release()
+                if is_throttling(e):
+                    self._on_throttle()
+                if error_code(e) not in RETRYABLE_CODES or attempt >= self.max_retries:
+                    self.stats["failed"] += 1
+                    raise
+                self.stats["retried"] += 1
+                await asyncio.sleep(self.backoff(attempt))
+                attempt += 1
+                continue
+            self.release()
+            self._on_success()
+            return result
+
+    def info(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "limit": int(self.limit),
+            "inFlight": self.in_flight,
+            "waiting": sum(1 for _, _, waiter in self._waiters if not waiter.done()),
+            "tokens": round(self._tokens, 2),
+            **self.stats,
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
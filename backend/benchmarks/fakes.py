@@ -0,0 +1,219 @@
+"""
+In-process stand-ins for the AWS clients the backend uses, so the chat/RAG
+path can be benchmarked without an AWS account. Each fake implements only the
+calls the backend makes and can add a fixed simulated service latency.
+"""
+import io
+import json
+import time
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+from embeddings import HashingEmbedder
+
+
+def _not_found(operation: str, key: str) -> ClientError:
+    return ClientError({"Error": {"Code": "NoSuchKey", "Message": f"{key} not found"}}, operation)
+
+
+class FakeS3Client:
+    """Dict-backed S3 client covering the calls made by S3Storage"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self._uploads: Dict[str, Dict[int, bytes]] = {}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _store(self, key: str, body: bytes, content_type: Optional[str]) -> str:
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with self._lock:
+            self.objects[key] = {
+                "Body": body,
+                "ETag": etag,
+                "ContentType": content_type or "binary/octet-stream",
+                "LastModified": datetime.now(timezone.utc),
+            }
+        return etag
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, **kwargs):
+        self._call("PutObject")
+        body = Body if isinstance(Body, bytes) else Body.read()
+        return {"ETag": self._store(Key, body, ContentType)}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self._call("GetObject")
+        obj = self.objects.get(Key)
+        if obj is None:
+            raise _not_found("GetObject", Key)
+        return {"Body": io.BytesIO(obj["Body"]), "ETag": obj["ETag"], "ContentLength": len(obj["Body"])}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call("HeadObject")
+        obj = self.objects.get(Key)
+        if obj is None:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(obj["Body"]), "ETag": obj["ETag"], "LastModified": obj["LastModified"]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._call("DeleteObject")
+        with self._lock:
+            self.objects.pop(Key, None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", MaxKeys=1000, ContinuationToken=None, **kwargs):
+        self._call("ListObjectsV2")
+        keys = sorted(k for k in self.objects if k.startswith(Prefix) and (ContinuationToken is None or k > ContinuationToken))
+        page = keys[:MaxKeys]
+        response = {
+            "Contents": [
+                {
+                    "Key": key,
+                    "Size": len(self.objects[key]["Body"]),
+                    "ETag": self.objects[key]["ETag"],
+                    "LastModified": self.objects[key]["LastModified"],
+                }
+                for key in page
+            ],
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://fake-s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+    def head_bucket(self, Bucket, **kwargs):
+        self._call("HeadBucket")
+        return {}
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        self._call("CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._call("UploadPart")
+        self._uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+        self._call("CompleteMultipartUpload")
+        parts = self._uploads.pop(UploadId)
+        body = b"".join(parts[part["PartNumber"]] for part in MultipartUpload["Parts"])
+        return {"ETag": self._store(Key, body, kwargs.get("ContentType"))}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call("AbortMultipartUpload")
+        self._uploads.pop(UploadId, None)
+        return {}
+
+
+class FakeBedrockRuntime:
+    """
+    Titan-shaped bedrock-runtime client. Text generation sleeps for
+    latency_seconds plus per_token_seconds per output token; embedding
+    requests are answered by the local hashing embedder.
+    """
+
+    def __init__(self, latency_seconds: float = 0.05, per_token_seconds: float = 0.0, output_tokens: int = 60):
+        self.latency_seconds = latency_seconds
+        self.per_token_seconds = per_token_seconds
+        self.output_tokens = output_tokens
+        self.embedder = HashingEmbedder()
+        self.prompt_chars: List[int] = []
+        self._lock = threading.Lock()
+
+    def _answer(self, body: Dict[str, Any]) -> List[str]:
+        with self._lock:
+            self.prompt_chars.append(len(body.get("inputText", "")))
+        return [f"token{i} " for i in range(self.output_tokens)]
+
+    def invoke_model(self, modelId, body, accept=None, contentType=None):
+        request = json.loads(body)
+        if "textGenerationConfig" not in request:
+            embedding = self.embedder.embed([request["inputText"]])[0].tolist()
+            return {"body": io.BytesIO(json.dumps({"embedding": embedding}).encode())}
+        tokens = self._answer(request)
+        time.sleep(self.latency_seconds + self.per_token_seconds * len(tokens))
+        response = {"results": [{"outputText": "".join(tokens), "tokenCount": len(tokens)}]}
+        return {"body": io.BytesIO(json.dumps(response).encode())}
+
+    def invoke_model_with_response_stream(self, modelId, body, accept=None, contentType=None):
+        tokens = self._answer(json.loads(body))
+        time.sleep(self.latency_seconds)
+
+        def events():
+            for token in tokens:
+                if self.per_token_seconds:
+                    time.sleep(self.per_token_seconds)
+                yield {"chunk": {"bytes": json.dumps({"outputText": token}).encode()}}
+
+        return {"body": events()}
+
+
+class _FakeDynamoClient:
+    def __init__(self, table: "FakeDynamoTable"):
+        self.table = table
+
+    def batch_write_item(self, RequestItems):
+        self.table._call()
+        unprocessed = {}
+        for name, requests in RequestItems.items():
+            for request in requests:
+                self.table._write(request["PutRequest"]["Item"])
+        return {"UnprocessedItems": unprocessed}
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeDynamoTable:
+    """Stands in for a boto3 DynamoDB Table resource (put_item, query, batch writes)"""
+
+    def __init__(self, name: str, hash_key: str, range_key: Optional[str] = None, latency_seconds: float = 0.0):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.latency_seconds = latency_seconds
+        self.items: Dict[Any, Dict[str, Any]] = {}
+        self.meta = _Meta(_FakeDynamoClient(self))
+        self._lock = threading.Lock()
+
+    def _call(self) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def _write(self, item: Dict[str, Any]) -> None:
+        key = (item[self.hash_key], item.get(self.range_key) if self.range_key else None)
+        with self._lock:
+            self.items[key] = dict(item)
+
+    def put_item(self, Item):
+        self._call()
+        self._write(Item)
+        return {}
+
+    def query(self, KeyConditionExpression, ExclusiveStartKey=None, **kwargs):
+        self._call()
+        value = KeyConditionExpression.get_expression()["values"][1]
+        items = [item for (hash_value, _), item in self.items.items() if hash_value == value]
+        if self.range_key:
+            items.sort(key=lambda item: item[self.range_key])
+        return {"Items": items}
@@ -0,0 +1,94 @@
+"""
+Synthetic knowledge base for benchmarks: plain-text and PDF documents of
+configurable sizes built from a fixed vocabulary, plus questions that share
+terms with specific documents so retrieval has real work to do.
+"""
+import random
+from dataclasses import dataclass
+from typing import List, Sequence
+
+TOPICS = [
+    "refund", "warranty", "shipping", "invoice", "subscription", "password", "router", "billing",
+    "delivery", "upgrade", "cancellation", "installation", "battery", "firmware", "account", "discount",
+]
+WORDS = """
+customer order policy days support agent request replacement device payment plan service
+contact number email address days weeks month annual premium standard basic charge fee
+credit card bank transfer receipt tracking courier package damaged missing return label
+reset login security verification code settings network signal outage technician visit
+""".split()
+
+
+@dataclass
+class SyntheticDocument:
+    name: str
+    content: bytes
+    content_type: str
+    topic: str
+    words: int
+
+
+def paragraph(rng: random.Random, topic: str, words: int) -> str:
+    out = []
+    for i in range(words):
+        out.append(topic if i % 12 == 0 else rng.choice(WORDS))
+    return " ".join(out).capitalize() + "."
+
+
+def make_pdf(pages: Sequence[str]) -> bytes:
+    """Minimal valid PDF with one Helvetica text line per page"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(len(pages)))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+    for i, text in enumerate(pages):
+        escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        stream = f"BT /F1 10 Tf 40 760 Td ({escaped}) Tj ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {4 + 2 * i} 0 R "
+            f"/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica >> >> >> >>"
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def generate_knowledge_base(
+    documents: int,
+    pdf_fraction: float = 0.3,
+    words_per_document: Sequence[int] = (300, 1500, 6000),
+    words_per_page: int = 300,
+    seed: int = 7,
+) -> List[SyntheticDocument]:
+    """documents of mixed sizes (cycled through words_per_document), pdf_fraction of them as PDFs"""
+    rng = random.Random(seed)
+    generated = []
+    for i in range(documents):
+        topic = TOPICS[i % len(TOPICS)]
+        words = words_per_document[i % len(words_per_document)]
+        if rng.random() < pdf_fraction:
+            pages = [paragraph(rng, topic, min(words_per_page, words - start)) for start in range(0, words, words_per_page)]
+            generated.append(SyntheticDocument(f"doc-{i:05d}-{topic}.pdf", make_pdf(pages), "application/pdf", topic, words))
+        else:
+            paragraphs = [paragraph(rng, topic, min(100, words - start)) for start in range(0, words, 100)]
+            text = "\n\n".join(paragraphs)
+            generated.append(SyntheticDocument(f"doc-{i:05d}-{topic}.txt", text.encode("utf-8"), "text/plain", topic, words))
+    return generated
+
+
+def generate_questions(count: int, seed: int = 11) -> List[str]:
+    """Distinct questions, so the answer cache never short-circuits a measurement"""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        topic = rng.choice(TOPICS)
+        questions.append(f"What does the {topic} policy say about {rng.choice(WORDS)} and {rng.choice(WORDS)} for case {i}?")
+    return questions
@@ -0,0 +1,309 @@
+"""
+Chat/RAG benchmark against in-process AWS fakes.
+
+Grows a synthetic knowledge base through the configured sizes and, at each
+size, measures document parsing, upload + ingest, retrieval, prompt building
+and end-to-end /api/chat latency at each concurrency level, plus transcript
+write-behind throughput. Results are printed (or written with --output) as
+JSON so runs can be compared over time.
+
+    cd backend
+    python -m benchmarks.run --kb-sizes 10,100,500 --concurrency 1,8,32 --output bench.json
+
+The Bedrock limiter's token bucket is disabled by default here
+(BEDROCK_RATE_PER_SECOND=0) so the numbers reflect the service rather than
+the configured quota; set the environment variables to benchmark a
+production configuration.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('S3_BUCKET_NAME', 'benchmark')
+os.environ.setdefault('STORAGE_BACKEND', 's3')
+os.environ.setdefault('TRANSCRIBE_BACKEND', 'fake')
+os.environ.setdefault('BEDROCK_MODEL_ID', 'amazon.titan-text-express-v1')
+os.environ.setdefault('BEDROCK_RATE_PER_SECOND', '0')
+os.environ.setdefault('BEDROCK_MAX_IN_FLIGHT', '64')
+
+from benchmarks.fakes import FakeBedrockRuntime, FakeDynamoTable, FakeS3Client
+from benchmarks.kb_generator import generate_knowledge_base, generate_questions
+
+
+def summarize(samples: Sequence[float]) -> Dict[str, Any]:
+    """Latency percentiles in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": percentile(50),
+        "p90_ms": percentile(90),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+async def run_concurrently(
+    call: Callable[[Any], Awaitable[Any]], items: Sequence[Any], concurrency: int
+) -> Dict[str, Any]:
+    """Run call over items with concurrency workers; latency stats plus throughput"""
+    latencies: List[float] = []
+    queue = list(reversed(items))
+
+    async def worker():
+        while queue:
+            item = queue.pop()
+            started = time.perf_counter()
+            await call(item)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    wall = time.perf_counter() - started
+    return {**summarize(latencies), "concurrency": concurrency, "wall_s": round(wall, 3),
+            "throughput_per_s": round(len(items) / wall, 2) if wall else None}
+
+
+def measure_parsing(documents) -> Dict[str, Any]:
+    from ingest import extract_pdf_pages, normalize_text
+
+    by_type: Dict[str, List[float]] = {}
+    total_bytes = 0
+    started = time.perf_counter()
+    for document in documents:
+        t0 = time.perf_counter()
+        if document.content_type == "application/pdf":
+            text = extract_pdf_pages(document.content)
+        else:
+            text = document.content.decode("utf-8")
+        normalize_text(text)
+        by_type.setdefault(document.content_type, []).append(time.perf_counter() - t0)
+        total_bytes += len(document.content)
+    wall = time.perf_counter() - started
+    return {
+        **{content_type: summarize(samples) for content_type, samples in by_type.items()},
+        "mb_per_s": round(total_bytes / wall / 1e6, 3) if wall else None,
+    }
+
+
+async def measure_upload_ingest(main, client, documents, concurrency: int) -> Dict[str, Any]:
+    file_ids = []
+
+    async def upload(document):
+        while True:
+            response = await client.post(
+                "/api/upload", files={"file": (document.name, document.content, document.content_type)}
+            )
+            if response.status_code != 503:
+                break
+            # Ingest queue full; back off like a client would
+            await asyncio.sleep(0.05)
+        response.raise_for_status()
+        file_ids.append(response.json()["ingest"]["file_id"])
+
+    started = time.perf_counter()
+    uploads = await run_concurrently(upload, documents, concurrency)
+    pending = set(file_ids)
+    while pending:
+        for file_id in list(pending):
+            job = main.ingest_pipeline.get_job(file_id)
+            if job is None or job.status in ("ready", "skipped", "failed"):
+                pending.discard(file_id)
+        await asyncio.sleep(0.01)
+    if main.kb_snapshots is not None:
+        # Retrieval reads the shared snapshot, so wait for the version with these documents
+        expected = len(main.kb_catalog)
+        while (snapshot := await main.kb_snapshots.current_async()) is None or len(snapshot.documents) < expected:
+            await asyncio.sleep(0.01)
+    wall = time.perf_counter() - started
+    jobs = [main.ingest_pipeline.get_job(file_id) for file_id in file_ids]
+    ingest_latencies = [job.finished_at - job.created_at for job in jobs if job and job.finished_at]
+    return {
+        "upload": uploads,
+        "ingest": summarize(ingest_latencies),
+        "failed": sum(1 for job in jobs if job and job.status == "failed"),
+        "documents_per_s": round(len(documents) / wall, 2) if wall else None,
+    }
+
+
+async def measure_retrieval(main, questions: Sequence[str]) -> Dict[str, Any]:
+    latencies, pack_latencies, build_latencies, prompt_tokens = [], [], [], []
+    started = time.perf_counter()
+    await main.retrieve_candidates(questions[0])
+    cold = time.perf_counter() - started
+    for question in questions:
+        t0 = time.perf_counter()
+        candidates = await main.retrieve_candidates(question)
+        t1 = time.perf_counter()
+        overhead = main.format_assistance_prompt(question, "")
+        packed = main.context_packer.pack(candidates or [], overhead)
+        t2 = time.perf_counter()
+        main.build_assistance_request(question, packed.passages)
+        t3 = time.perf_counter()
+        latencies.append(t1 - t0)
+        pack_latencies.append(t2 - t1)
+        build_latencies.append(t3 - t2)
+        prompt_tokens.append(packed.tokens)
+    return {
+        "retrieval_cold_ms": round(cold * 1000, 3),
+        "retrieval": summarize(latencies),
+        "context_packing": summarize(pack_latencies),
+        "prompt_build": summarize(build_latencies),
+        "context_tokens_mean": round(sum(prompt_tokens) / len(prompt_tokens), 1) if prompt_tokens else 0,
+    }
+
+
+async def measure_chat(main, client, questions: Sequence[str], concurrency: int, stream: bool) -> Dict[str, Any]:
+    async def ask(question):
+        if stream:
+            async with client.stream("POST", "/api/chat/stream", json={"message": question}) as response:
+                response.raise_for_status()
+                async for _ in response.aiter_bytes():
+                    pass
+        else:
+            response = await client.post("/api/chat", json={"message": question})
+            response.raise_for_status()
+
+    return await run_concurrently(ask, questions, concurrency)
+
+
+async def measure_transcript_persistence(segments: int) -> Dict[str, Any]:
+    from transcript_store import DynamoTable, TranscriptWriter
+
+    table = DynamoTable(FakeDynamoTable("CallTranscriptSegments", "ConversationId", "Sequence"), "ConversationId", "Sequence")
+    writer = TranscriptWriter(table, "benchmark-call", flush_seconds=0.05)
+    writer.start()
+    started = time.perf_counter()
+    for i in range(segments):
+        writer.append(f"segment {i} of the benchmark call")
+        if i % 25 == 0:
+            await asyncio.sleep(0)
+    await writer.close()
+    wall = time.perf_counter() - started
+    table.close()
+    return {"segments": segments, "wall_s": round(wall, 3),
+            "segments_per_s": round(segments / wall, 1) if wall else None, **writer.stats}
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    import main
+    from answer_cache import AnswerCache
+
+    # Per-request logging would dominate the measurements
+    for name in ("", "botocore", "main"):
+        logging.getLogger(name).setLevel(args.log_level)
+
+    main.storage.client = FakeS3Client(latency_seconds=args.s3_latency_ms / 1000)
+    main.bedrock_runtime = FakeBedrockRuntime(
+        latency_seconds=args.bedrock_latency_ms / 1000,
+        per_token_seconds=args.bedrock_token_ms / 1000,
+    )
+    # Every measured question must reach Bedrock
+    main.answer_cache = AnswerCache(max_entries=0)
+
+    sizes = sorted(int(size) for size in args.kb_sizes.split(","))
+    concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+    documents = generate_knowledge_base(sizes[-1], pdf_fraction=args.pdf_fraction, seed=args.seed)
+    questions = iter(generate_questions(args.requests * (len(concurrency_levels) * 2 + 1) * len(sizes), seed=args.seed))
+
+    results = []
+    started = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120) as client:
+            # Measurements start once warm-up is done, as a load balancer would
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(0.01)
+            startup = {"ready_s": round(time.perf_counter() - started, 3), "warmup": main.readiness["warmup"]}
+            loaded = 0
+            for size in sizes:
+                batch = documents[loaded:size]
+                loaded = size
+                result: Dict[str, Any] = {"kb_documents": size, "kb_bytes": sum(len(d.content) for d in documents[:size])}
+                result["parsing"] = measure_parsing(batch)
+                result["upload_ingest"] = await measure_upload_ingest(main, client, batch, args.upload_concurrency)
+                result.update(await measure_retrieval(main, [next(questions) for _ in range(args.requests)]))
+                result["chat"] = []
+                for concurrency in concurrency_levels:
+                    for stream in (False, True):
+                        sample = [next(questions) for _ in range(args.requests)]
+                        prompts_before = len(main.bedrock_runtime.prompt_chars)
+                        chat = await measure_chat(main, client, sample, concurrency, stream)
+                        prompt_chars = main.bedrock_runtime.prompt_chars[prompts_before:]
+                        chat["endpoint"] = "/api/chat/stream" if stream else "/api/chat"
+                        chat["prompt_chars_mean"] = round(sum(prompt_chars) / len(prompt_chars), 1) if prompt_chars else 0
+                        result["chat"].append(chat)
+                results.append(result)
+                print(f"kb={size}: chat p50 {result['chat'][0].get('p50_ms')} ms", file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "retriever": main.RETRIEVER,
+            "args": vars(args),
+        },
+        "startup": startup,
+        "transcript_persistence": await measure_transcript_persistence(args.segments),
+        "results": results,
+    }
+
+
+def main_cli(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kb-sizes", default="10,100", help="comma-separated knowledge-base sizes (documents)")
+    parser.add_argument("--concurrency", default="1,8", help="comma-separated chat concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="requests per measurement")
+    parser.add_argument("--upload-concurrency", type=int, default=8)
+    parser.add_argument("--pdf-fraction", type=float, default=0.3)
+    parser.add_argument("--bedrock-latency-ms", type=float, default=50)
+    parser.add_argument("--bedrock-token-ms", type=float, default=0)
+    parser.add_argument("--s3-latency-ms", type=float, default=0)
+    parser.add_argument("--segments", type=int, default=2000, help="transcript segments for the persistence benchmark")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    encoded = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(encoded + "\n")
+    else:
+        print(encoded)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,439 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr
+
+from aws_debug import in_context
+from metrics import span
+from transcript_store import Table
+
+logger = logging.getLogger(__name__)
+
+# 2: UTC watermarks and abandoned calls
+CHECKPOINT_VERSION = 2
+
+# Headers written before they were stamped in UTC carry naive local times.
+# String filters are widened by the largest UTC offset so they still match
+# both forms; the exact comparison happens on the parsed times.
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+# Upper bounds (seconds) of the duration and talk-time histogram buckets
+DURATION_BUCKETS = (30, 60, 120, 300, 600, 900, 1800, 3600, 7200)
+# Upper bounds of the talk-time / duration ratio buckets
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+# Only what the aggregates read; Timestamp and Status are reserved words
+SCAN_PROJECTION = {
+    'ProjectionExpression': 'ConversationId, #ts, #st, EndedAt, SegmentCount, TalkSeconds',
+    'ExpressionAttributeNames': {'#ts': 'Timestamp', '#st': 'Status'},
+}
+
+
+class Summary:
+    """Count, total, min, max and a fixed-bucket histogram of a value; mergeable"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One count per bucket plus the overflow above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+
+    def add(self, value: float) -> None:
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other: "Summary") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        for value in (other.minimum, other.maximum):
+            if value is not None:
+                self.minimum = value if self.minimum is None else min(self.minimum, value)
+                self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (the maximum for the overflow bucket)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[index] if index < len(self.buckets) else self.maximum
+        return self.maximum
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else None,
+            "min": self.minimum,
+            "max": self.maximum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{f"le{bound:g}": count for bound, count in zip(self.buckets, self.counts)},
+                "over": self.counts[-1],
+            },
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"counts": self.counts, "count": self.count, "total": self.total, "min": self.minimum, "max": self.maximum}
+
+    @classmethod
+    def from_dict(cls, buckets: Tuple[float, ...], data: Dict[str, Any]) -> "Summary":
+        summary = cls(buckets)
+        if len(data.get("counts", [])) == len(summary.counts):
+            summary.counts = list(data["counts"])
+            summary.count = data["count"]
+            summary.total = data["total"]
+            summary.minimum = data["min"]
+            summary.maximum = data["max"]
+        return summary
+
+
+def _parse_time(value: Any) -> Optional[datetime]:
+    """A header time in UTC; naive (older) values are taken as local time"""
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _filter_bound(moment: datetime) -> str:
+    """A string lower bound for header times after moment, whichever form they are in"""
+    return (moment - MAX_UTC_OFFSET).replace(tzinfo=None).isoformat()
+
+
+class CallStats:
+    """
+    Incremental aggregates over CallConversations headers. Days and hours
+    are UTC.
+
+    add() folds in one item and keeps no reference to it, so memory stays
+    bounded by the number of distinct days however many calls are scanned.
+    Partials built on different scan segments (or on different runs) combine
+    with merge(), and to_dict()/from_dict() round-trip through a checkpoint.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.statuses: Dict[str, int] = {}
+        self.by_day: Dict[str, int] = {}
+        self.by_hour = [0] * 24
+        self.duration = Summary(DURATION_BUCKETS)
+        self.talk = Summary(DURATION_BUCKETS)
+        self.talk_ratio = Summary(RATIO_BUCKETS)
+        self.segments = 0
+        # Calls recorded before talk time was stored on the header
+        self.without_talk_time = 0
+
+    def add(self, item: Dict[str, Any]) -> None:
+        self.calls += 1
+        status = str(item.get("Status", "unknown"))
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.segments += int(item.get("SegmentCount") or 0)
+        started = _parse_time(item.get("Timestamp"))
+        if started is not None:
+            day = started.date().isoformat()
+            self.by_day[day] = self.by_day.get(day, 0) + 1
+            self.by_hour[started.hour] += 1
+        ended = _parse_time(item.get("EndedAt"))
+        duration = (ended - started).total_seconds() if started and ended else None
+        if duration is not None and duration >= 0:
+            self.duration.add(duration)
+        else:
+            duration = None
+        if item.get("TalkSeconds") is None:
+            self.without_talk_time += 1
+            return
+        # DynamoDB hands numbers back as Decimal
+        talk = float(item["TalkSeconds"])
+        self.talk.add(talk)
+        if duration:
+            self.talk_ratio.add(min(talk / duration, 1.0))
+
+    def merge(self, other: "CallStats") -> None:
+        self.calls += other.calls
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        for day, count in other.by_day.items():
+            self.by_day[day] = self.by_day.get(day, 0) + count
+        self.by_hour = [a + b for a, b in zip(self.by_hour, other.by_hour)]
+        self.duration.merge(other.duration)
+        self.talk.merge(other.talk)
+        self.talk_ratio.merge(other.talk_ratio)
+        self.segments += other.segments
+        self.without_talk_time += other.without_talk_time
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "statuses": self.statuses,
+            "byDay": dict(sorted(self.by_day.items())),
+            "byHour": self.by_hour,
+            "durationSeconds": self.duration.report(),
+            "talkSeconds": self.talk.report(),
+            "talkRatio": self.talk_ratio.report(),
+            "segments": self.segments,
+            "withoutTalkTime": self.without_talk_time,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "statuses": self.statuses,
+            "byDay": self.by_day,
+            "byHour": self.by_hour,
+            "duration": self.duration.to_dict(),
+            "talk": self.talk.to_dict(),
+            "talkRatio": self.talk_ratio.to_dict(),
+            "segments": self.segments,
+            "withoutTalkTime": self.without_talk_time,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CallStats":
+        stats = cls()
+        stats.calls = data.get("calls", 0)
+        stats.statuses = dict(data.get("statuses", {}))
+        stats.by_day = dict(data.get("byDay", {}))
+        stats.by_hour = list(data.get("byHour", stats.by_hour))
+        stats.duration = Summary.from_dict(DURATION_BUCKETS, data.get("duration", {}))
+        stats.talk = Summary.from_dict(DURATION_BUCKETS, data.get("talk", {}))
+        stats.talk_ratio = Summary.from_dict(RATIO_BUCKETS, data.get("talkRatio", {}))
+        stats.segments = data.get("segments", 0)
+        stats.without_talk_time = data.get("withoutTalkTime", 0)
+        return stats
+
+
+class CallAnalytics:
+    """
+    Call volume, duration and talk-time analytics over CallConversations.
+
+    A run is a parallel Scan: the table is split into total_segments
+    segments, each paged through on its own thread of a workers-sized pool
+    and folded into a per-segment CallStats, so no more than a page per
+    segment is ever held in memory. The partials are merged at the end.
+
+    Finished calls (those with EndedAt) go into a checkpoint of aggregates
+    plus a watermark. A Scan still reads every item, but the next run's
+    filter only returns calls that ended after the watermark, or are still
+    open, and they are merged into the checkpointed totals instead of
+    starting over. The watermark trails the run's start by settle_seconds so
+    headers still being written are picked up next time; calls already
+    counted inside that window are remembered by id so they are not counted
+    twice. Open calls are reported from each run but not checkpointed, since
+    they will change. A call still open open_call_max_seconds after it
+    started (the process died before it ended) is counted once as
+    "abandoned" and left out of later runs.
+    """
+
+    def __init__(
+        self,
+        table: Table,
+        load_checkpoint: Callable[[], Awaitable[Optional[Dict[str, Any]]]],
+        save_checkpoint: Callable[[Dict[str, Any]], Awaitable[None]],
+        total_segments: int = 8,
+        workers: int = 4,
+        page_size: int = 1000,
+        settle_seconds: float = 300.0,
+        open_call_max_seconds: float = 6 * 3600.0,
+        interval_seconds: float = 0.0,
+    ):
+        self.table = table
+        self.load_checkpoint = load_checkpoint
+        self.save_checkpoint = save_checkpoint
+        self.total_segments = max(1, total_segments)
+        self.workers = max(1, workers)
+        self.page_size = page_size
+        self.settle_seconds = settle_seconds
+        self.open_call_max_seconds = open_call_max_seconds
+        self.interval_seconds = interval_seconds
+        self.report: Optional[Dict[str, Any]] = None
+        self.running: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Run on a schedule when interval_seconds is set"""
+        if self.interval_seconds > 0:
+            self._task = asyncio.create_task(self._schedule())
+
+    async def stop(self) -> None:
+        for task in (self._task, self.running):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _schedule(self) -> None:
+        while True:
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            await asyncio.sleep(self.interval_seconds)
+
+    def trigger(self, full: bool = False) -> asyncio.Task:
+        """Start a run in the background, or return the one already in progress"""
+        if self.running is None or self.running.done():
+            self.running = asyncio.create_task(self._run(full))
+            # Failures are logged and kept in last_error; nobody may await a background run
+            self.running.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self.running
+
+    async def run(self, full: bool = False) -> Dict[str, Any]:
+        return await asyncio.shield(self.trigger(full))
+
+    async def latest(self) -> Optional[Dict[str, Any]]:
+        """The last report, falling back to the checkpoint another worker or run left behind"""
+        if self.report is None:
+            checkpoint = await self.load_checkpoint()
+            if checkpoint is not None and checkpoint.get("version") == CHECKPOINT_VERSION:
+                self.report = self._report(checkpoint, None, None)
+        return self.report
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running is not None and not self.running.done(),
+            "lastError": self.last_error,
+            "totalSegments": self.total_segments,
+            "workers": self.workers,
+        }
+
+    async def _run(self, full: bool) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            with span("call_analytics", "full" if full else "incremental"):
+                checkpoint = None if full else await self.load_checkpoint()
+                if checkpoint is not None and checkpoint.get("version") != CHECKPOINT_VERSION:
+                    checkpoint = None
+                report = await self._scan(checkpoint, started)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Call analytics run failed: {str(e)}")
+            raise
+        self.last_error = None
+        self.report = report
+        run = report["lastRun"]
+        logger.info(
+            f"Call analytics: {run['scanned']} items scanned, {run['counted']} new calls "
+            f"in {run['seconds']}s over {run['segments']} segments"
+        )
+        return report
+
+    async def _scan(self, checkpoint: Optional[Dict[str, Any]], started: float) -> Dict[str, Any]:
+        watermark = _parse_time(checkpoint["watermark"]) if checkpoint else None
+        abandoned_through = _parse_time(checkpoint["abandonedThrough"]) if checkpoint else None
+        counted_ids = set(checkpoint.get("recent", [])) if checkpoint else set()
+        now = datetime.now(timezone.utc)
+        next_watermark = now - timedelta(seconds=self.settle_seconds)
+        if watermark is not None and watermark > next_watermark:
+            next_watermark = watermark
+        next_abandoned_through = now - timedelta(seconds=self.open_call_max_seconds)
+        if abandoned_through is not None and abandoned_through > next_abandoned_through:
+            next_abandoned_through = abandoned_through
+
+        scan_kwargs = dict(SCAN_PROJECTION, Limit=self.page_size)
+        if watermark is not None:
+            scan_kwargs['FilterExpression'] = (
+                (Attr('EndedAt').not_exists() & Attr('Timestamp').gt(_filter_bound(abandoned_through)))
+                | Attr('EndedAt').gt(_filter_bound(watermark))
+            )
+
+        def scan_segment(segment: int):
+            finished, open_calls, recent, scanned = CallStats(), CallStats(), [], 0
+            for page in self.table.scan_pages(segment, self.total_segments, **scan_kwargs):
+                scanned += len(page)
+                for item in page:
+                    started = _parse_time(item.get("Timestamp"))
+                    ended = _parse_time(item.get("EndedAt"))
+                    if ended is None:
+                        # Abandoned calls before abandoned_through were counted by an earlier run
+                        if abandoned_through is not None and (started is None or started <= abandoned_through):
+                            continue
+                        if started is None or started <= next_abandoned_through:
+                            finished.add({**item, "Status": "abandoned"})
+                        else:
+                            open_calls.add(item)
+                        continue
+                    # The filter is widened for older headers (and the in-memory table ignores it)
+                    if watermark is not None and ended <= watermark:
+                        continue
+                    # A call that ended after being counted as abandoned is not counted again
+                    if abandoned_through is not None and started is not None and started <= abandoned_through:
+                        continue
+                    conversation_id = item.get("ConversationId")
+                    if ended > next_watermark:
+                        recent.append(conversation_id)
+                    if conversation_id not in counted_ids:
+                        finished.add(item)
+            return finished, open_calls, recent, scanned
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="call-analytics")
+        loop = asyncio.get_running_loop()
+        partials = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, in_context(scan_segment), segment)
+            for segment in range(self.total_segments)
+        ])
+
+        totals = CallStats.from_dict(checkpoint["stats"]) if checkpoint else CallStats()
+        open_calls, recent, scanned, counted = CallStats(), [], 0, 0
+        for finished, segment_open, segment_recent, segment_scanned in partials:
+            counted += finished.calls
+            totals.merge(finished)
+            open_calls.merge(segment_open)
+            recent.extend(segment_recent)
+            scanned += segment_scanned
+
+        checkpoint = {
+            "version": CHECKPOINT_VERSION,
+            "watermark": next_watermark.isoformat(),
+            "abandonedThrough": next_abandoned_through.isoformat(),
+            "recent": recent,
+            "stats": totals.to_dict(),
+            "updatedAt": now.isoformat(),
+        }
+        await self.save_checkpoint(checkpoint)
+        return self._report(checkpoint, open_calls, {
+            "incremental": watermark is not None,
+            "scanned": scanned,
+            "counted": counted,
+            "segments": self.total_segments,
+            "seconds": round(time.perf_counter() - started, 3),
+        })
+
+    @staticmethod
+    def _report(checkpoint: Dict[str, Any], open_calls: Optional[CallStats], run: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        return {
+            "generatedAt": checkpoint.get("updatedAt"),
+            "completeThrough": checkpoint["watermark"],
+            "finished": CallStats.from_dict(checkpoint["stats"]).report(),
+            "open": open_calls.report() if open_calls is not None else None,
+            "lastRun": run,
+        }
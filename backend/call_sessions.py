@@ -0,0 +1,258 @@
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+import aiohttp
+from botocore.auth import SigV4QueryAuth
+from botocore.awsrequest import AWSRequest
+
+logger = logging.getLogger(__name__)
+
+# RFC 6455 "Try Again Later": the server is temporarily at capacity
+CLOSE_TRY_AGAIN_LATER = 1013
+
+
+class CallCapacityExceeded(Exception):
+    """Raised when a new call can neither be admitted nor queued"""
+
+
+class AudioBuffer:
+    """
+    Bounded FIFO of audio chunks between the client socket and the upstream
+    stream, so a slow upstream never stalls reads from the browser. Past
+    max_bytes the oldest chunks are dropped (and counted): audio that far
+    behind is no use for live assistance, and one stalled call must not grow
+    without bound.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.dropped_bytes = 0
+        self.total_bytes = 0
+        self._chunks: Deque[bytes] = deque()
+        self._ready = asyncio.Event()
+        self._closed = False
+
+    def put(self, chunk: bytes) -> None:
+        if self._closed:
+            return
+        # Coalesced chunks are views into a buffer that is reused for the next
+        # chunk, so keep a copy (bytes() of a bytes object is free)
+        chunk = bytes(chunk)
+        self._chunks.append(chunk)
+        self.bytes += len(chunk)
+        self.total_bytes += len(chunk)
+        while self.bytes > self.max_bytes and len(self._chunks) > 1:
+            dropped = self._chunks.popleft()
+            self.bytes -= len(dropped)
+            self.dropped_bytes += len(dropped)
+        self._ready.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Next chunk, or None once the buffer is closed and drained"""
+        while not self._chunks:
+            if self._closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        chunk = self._chunks.popleft()
+        self.bytes -= len(chunk)
+        return chunk
+
+    def close(self) -> None:
+        self._closed = True
+        self._ready.set()
+
+
+class CallSession:
+    """Book-keeping for one admitted call"""
+
+    def __init__(self, call_id: str, client: str, waited_seconds: float, max_audio_buffer_bytes: int):
+        self.call_id = call_id
+        self.client = client
+        self.waited_seconds = waited_seconds
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.audio = AudioBuffer(max_audio_buffer_bytes)
+        self.stats: Dict[str, int] = {"partials": 0, "finals": 0}
+        # Seconds of audio sent upstream, and of it the span covered by final results
+        self.audio_seconds = 0.0
+        self.talk_seconds = 0.0
+        # Live sizes of the call's other bounded queues, registered by the handler
+        self._gauges: Dict[str, Callable[[], int]] = {}
+
+    def watch(self, name: str, gauge: Callable[[], int]) -> None:
+        self._gauges[name] = gauge
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "id": self.call_id,
+            "client": self.client,
+            "startedAt": self.started_at,
+            "durationSeconds": round(time.monotonic() - self._started, 1),
+            "waitedSeconds": round(self.waited_seconds, 3),
+            "audioBytes": self.audio.total_bytes,
+            "audioBufferedBytes": self.audio.bytes,
+            "audioDroppedBytes": self.audio.dropped_bytes,
+            "audioSeconds": round(self.audio_seconds, 1),
+            "talkSeconds": round(self.talk_seconds, 1),
+            **self.stats,
+            **{name: gauge() for name, gauge in self._gauges.items()},
+        }
+
+
+class CallSessionManager:
+    """
+    Process-wide owner of live transcription calls.
+
+    Holds the one aiohttp session (and connector) used for every upstream
+    Transcribe websocket, and the AWS credentials, resolved once and
+    refreshed by botocore only when they near expiry, so a new call costs a
+    presign and a connect rather than a session setup and a provider-chain
+    lookup.
+
+    At most max_calls run at once. Up to max_queued further calls wait, first
+    come first served, for at most queue_timeout seconds; anything beyond
+    that is refused with CallCapacityExceeded so excess load is rejected
+    instead of degrading every call.
+    """
+
+    def __init__(
+        self,
+        session,
+        region: str,
+        max_calls: int = 50,
+        max_queued: int = 10,
+        queue_timeout: float = 10.0,
+        max_audio_buffer_bytes: int = 512 * 1024,
+        presign_expires: int = 300,
+    ):
+        self.session = session
+        self.region = region
+        self.max_calls = max_calls
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.max_audio_buffer_bytes = max_audio_buffer_bytes
+        self.presign_expires = presign_expires
+        self.calls: Dict[str, CallSession] = {}
+        self._slots = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._credentials = None
+        self._http: Optional[aiohttp.ClientSession] = None
+        self.stats: Dict[str, int] = {"admitted": 0, "waited": 0, "rejected": 0, "timedOut": 0, "completed": 0}
+
+    @property
+    def http(self) -> aiohttp.ClientSession:
+        if self._http is None or self._http.closed:
+            # Each upstream websocket holds its own connection, so the limit
+            # follows the call capacity; DNS and TLS context are shared
+            self._http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_calls, ttl_dns_cache=300),
+            )
+        return self._http
+
+    def credentials(self):
+        if self._credentials is None:
+            self._credentials = self.session.get_credentials()
+        return self._credentials.get_frozen_credentials()
+
+    def transcribe_url(self, sample_rate: int, language_code: str = 'en-US', media_encoding: str = 'pcm') -> str:
+        """Presigned URL for the Transcribe streaming websocket API"""
+        request = AWSRequest(
+            method='GET',
+            url=f'wss://transcribestreaming.{self.region}.amazonaws.com:8443/stream-transcription-websocket',
+            params={
+                'language-code': language_code,
+                'media-encoding': media_encoding,
+                'sample-rate': str(sample_rate),
+            },
+        )
+        SigV4QueryAuth(self.credentials(), 'transcribe', self.region, expires=self.presign_expires).add_auth(request)
+        return request.url
+
+    async def admit(
+        self,
+        call_id: str,
+        client: str = "",
+        on_queued: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> CallSession:
+        """Admit a call, waiting in the queue if needed; pair with release()"""
+        started = time.monotonic()
+        if self._slots >= self.max_calls or self._waiters:
+            if len(self._waiters) >= self.max_queued or self.queue_timeout <= 0:
+                self.stats["rejected"] += 1
+                raise CallCapacityExceeded(f"{self._slots} calls in progress and {len(self._waiters)} waiting")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            self.stats["waited"] += 1
+            try:
+                if on_queued is not None:
+                    await on_queued(len(self._waiters))
+                await asyncio.wait({waiter}, timeout=max(0.0, self.queue_timeout - (time.monotonic() - started)))
+            except BaseException:
+                # A slot handed over while we were being cancelled goes to the next caller
+                if waiter.done() and not waiter.cancelled():
+                    self._release_slot()
+                else:
+                    waiter.cancel()
+                    self._discard(waiter)
+                raise
+            if not waiter.done() or waiter.cancelled():
+                waiter.cancel()
+                self._discard(waiter)
+                self.stats["timedOut"] += 1
+                self.stats["rejected"] += 1
+                raise CallCapacityExceeded(f"No call slot within {self.queue_timeout}s")
+            # release() handed its slot straight to this waiter
+        else:
+            self._slots += 1
+        call = CallSession(call_id, client, time.monotonic() - started, self.max_audio_buffer_bytes)
+        self.calls[call_id] = call
+        self.stats["admitted"] += 1
+        return call
+
+    def release(self, call: CallSession) -> None:
+        if self.calls.pop(call.call_id, None) is None:
+            return
+        call.audio.close()
+        self.stats["completed"] += 1
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._slots -= 1
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def info(self) -> Dict[str, Any]:
+        """Capacity summary, cheap enough for a load balancer to poll"""
+        return {
+            "live": self._slots,
+            "capacity": self.max_calls,
+            "available": max(0, self.max_calls - self._slots),
+            "queued": len(self._waiters),
+            "maxQueued": self.max_queued,
+            **self.stats,
+        }
+
+    def calls_info(self) -> List[Dict[str, Any]]:
+        return [call.info() for call in list(self.calls.values())]
+
+    async def close(self) -> None:
+        for waiter in self._waiters:
+            waiter.cancel()
+        self._waiters.clear()
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
@@ -0,0 +1,169 @@
+import time
+import base64
+import bisect
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from storage import ObjectInfo, Storage
+
+logger = logging.getLogger(__name__)
+
+
+def encode_cursor(key: str) -> str:
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class KnowledgeBaseCatalog:
+    """
+    In-memory catalog of the objects under a storage prefix.
+
+    Built once from a full paginated listing, then kept current by the upload
+    and delete endpoints (upsert/remove) plus a periodic background reconcile
+    that picks up out-of-band changes. Keys are kept sorted so pages are a
+    bisect plus a slice, and totals are maintained incrementally, so serving a
+    page costs the same regardless of bucket size. Presigned URLs are cached
+    until shortly before they expire.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        prefix: str,
+        presign_expires_in: int = 3600,
+        presign_refresh_margin: int = 300,
+        reconcile_seconds: float = 300.0,
+    ):
+        self.storage = storage
+        self.prefix = prefix
+        self.presign_expires_in = presign_expires_in
+        self.presign_refresh_margin = presign_refresh_margin
+        self.reconcile_seconds = reconcile_seconds
+        self.version = 0
+        self.total_size = 0
+        self._objects: Dict[str, ObjectInfo] = {}
+        self._keys: List[str] = []
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        self._loaded = False
+        self._reconciling = False
+        self._pending: Dict[str, Optional[ObjectInfo]] = {}
+        self._load_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    async def ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if not self._loaded:
+                await self.reconcile()
+
+    async def reconcile(self) -> None:
+        """Replace the catalog with a fresh full listing"""
+        # Uploads and deletes that land while the listing is in flight are
+        # replayed on top of it so they aren't lost
+        self._reconciling = True
+        self._pending = {}
+        try:
+            objects = await self.storage.list(self.prefix)
+        finally:
+            self._reconciling = False
+        fresh = {obj.key: obj for obj in objects if obj.key != self.prefix}
+        for key, obj in self._pending.items():
+            if obj is None:
+                fresh.pop(key, None)
+            else:
+                fresh[key] = obj
+        self._pending = {}
+        changed = fresh.keys() != self._objects.keys() or any(
+            self._objects[key].etag != obj.etag for key, obj in fresh.items()
+        )
+        self._objects = fresh
+        self._keys = sorted(fresh)
+        self.total_size = sum(obj.size for obj in fresh.values())
+        for key in [k for k in self._urls if k not in fresh]:
+            del self._urls[key]
+        if changed or not self._loaded:
+            self.version += 1
+        self._loaded = True
+
+    def upsert(self, obj: ObjectInfo) -> None:
+        if self._reconciling:
+            self._pending[obj.key] = obj
+        previous = self._objects.get(obj.key)
+        if previous is None:
+            bisect.insort(self._keys, obj.key)
+        else:
+            self.total_size -= previous.size
+        self._objects[obj.key] = obj
+        self.total_size += obj.size
+        self.version += 1
+
+    def remove(self, key: str) -> None:
+        if self._reconciling:
+            self._pending[key] = None
+        previous = self._objects.pop(key, None)
+        self._urls.pop(key, None)
+        if previous is None:
+            return
+        del self._keys[bisect.bisect_left(self._keys, key)]
+        self.total_size -= previous.size
+        self.version += 1
+
+    def get(self, key: str) -> Optional[ObjectInfo]:
+        return self._objects.get(key)
+
+    def listing(self) -> List[Tuple[str, str]]:
+        return [(key, self._objects[key].etag) for key in self._keys]
+
+    def page(self, cursor: Optional[str] = None, limit: int = 100) -> Tuple[List[ObjectInfo], Optional[str]]:
+        """Return up to limit objects after cursor, and the cursor for the next page"""
+        start = 0
+        if cursor:
+            start = bisect.bisect_right(self._keys, decode_cursor(cursor))
+        keys = self._keys[start:start + limit]
+        next_cursor = encode_cursor(keys[-1]) if start + limit < len(self._keys) else None
+        return [self._objects[key] for key in keys], next_cursor
+
+    async def presigned_url(self, key: str) -> str:
+        cached = self._urls.get(key)
+        now = time.time()
+        if cached is not None and cached[1] - now > self.presign_refresh_margin:
+            return cached[0]
+        url = await self.storage.presign(key, expires_in=self.presign_expires_in)
+        self._urls[key] = (url, now + self.presign_expires_in)
+        return url
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            try:
+                if self._loaded:
+                    await asyncio.sleep(self.reconcile_seconds)
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Catalog reconcile for {self.prefix} failed: {str(e)}")
+                await asyncio.sleep(min(self.reconcile_seconds, 30))
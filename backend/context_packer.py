@@ -0,0 +1,118 @@
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional, Sequence, Tuple
+
+from retrieval import TOKEN_PATTERN
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative token estimate for English text.
+
+    Subword tokenizers average roughly four characters or three quarters of
+    a word per token; taking the larger of the two keeps numbers, codes and
+    long words from being undercounted.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), math.ceil(len(text.split()) * 4 / 3))
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[Tuple[str, ...]]:
+    words = TOKEN_PATTERN.findall(text.lower())
+    if len(words) < size:
+        return frozenset([tuple(words)]) if words else frozenset()
+    return frozenset(tuple(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def similarity(a: FrozenSet, b: FrozenSet) -> float:
+    """Overlap of two shingle sets relative to the smaller one, so a passage
+    contained in a longer one counts as a duplicate"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+@dataclass
+class PackedContext:
+    passages: List[str] = field(default_factory=list)
+    tokens: int = 0
+    budget: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+
+
+class ContextPacker:
+    """
+    Chooses which retrieved passages go into a prompt.
+
+    Candidates arrive best-first; each is taken if it fits in what is left of
+    the budget and isn't a near-duplicate of one already taken (overlapping
+    chunk windows, the same paragraph in two documents). The budget is the
+    smaller of budget_tokens and what the model's context window leaves after
+    the prompt scaffolding and max_output_tokens, so prompt size stays bounded
+    however large the knowledge base grows. Token counts and shingle sets are
+    cached per passage text, since the same chunks are retrieved repeatedly.
+    """
+
+    def __init__(
+        self,
+        context_window: int = 8000,
+        max_output_tokens: int = 512,
+        budget_tokens: Optional[int] = None,
+        duplicate_threshold: float = 0.8,
+        max_cached: int = 20000,
+    ):
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.budget_tokens = budget_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, Tuple[int, Optional[FrozenSet]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, text: str, with_shingles: bool) -> Tuple[int, Optional[FrozenSet]]:
+        with self._lock:
+            entry = self._cache.get(text)
+            if entry is not None:
+                self._cache.move_to_end(text)
+                if entry[1] is not None or not with_shingles:
+                    return entry
+        tokens = entry[0] if entry is not None else estimate_tokens(text)
+        entry = (tokens, shingles(text) if with_shingles else None)
+        with self._lock:
+            self._cache[text] = entry
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return entry
+
+    def count(self, text: str) -> int:
+        return self._entry(text, False)[0]
+
+    def available(self, overhead_tokens: int) -> int:
+        budget = self.context_window - self.max_output_tokens - overhead_tokens
+        if self.budget_tokens is not None:
+            budget = min(budget, self.budget_tokens)
+        return max(0, budget)
+
+    def pack(self, candidates: Sequence[str], overhead: str = "", separator: str = "\n\n") -> PackedContext:
+        """Greedily pack best-first candidates into the budget left by overhead (the prompt without context)"""
+        packed = PackedContext(budget=self.available(estimate_tokens(overhead)))
+        separator_tokens = estimate_tokens(separator)
+        taken: List[FrozenSet] = []
+        for text in candidates:
+            tokens, text_shingles = self._entry(text, True)
+            cost = tokens + (separator_tokens if packed.passages else 0)
+            if packed.tokens + cost > packed.budget:
+                packed.over_budget += 1
+                continue
+            if any(similarity(text_shingles, other) >= self.duplicate_threshold for other in taken):
+                packed.duplicates += 1
+                continue
+            packed.passages.append(text)
+            packed.tokens += cost
+            taken.append(text_shingles)
+        return packed
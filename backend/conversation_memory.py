@@ -0,0 +1,102 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    """
+    Bounded rolling context for one live call.
+
+    The last window_turns final utterances are kept verbatim. Once fold_turns
+    more have accumulated beyond the window, the turns beyond it are folded
+    into a running summary by summarize(previous_summary, turns) in the
+    background, so the summary is only recomputed at window boundaries, never
+    per utterance. Turns waiting to be folded stay visible until the new
+    summary lands, and if summarizing fails they are appended to the summary
+    as-is. Turns and the summary are both truncated, so render() has a fixed
+    upper bound however long the call runs.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, List[str]], Awaitable[str]],
+        window_turns: int = 6,
+        fold_turns: int = 6,
+        max_turn_chars: int = 500,
+        max_summary_chars: int = 1500,
+    ):
+        self.summarize = summarize
+        self.window_turns = window_turns
+        self.fold_turns = fold_turns
+        self.max_turn_chars = max_turn_chars
+        self.max_summary_chars = max_summary_chars
+        self.summary = ""
+        self.revision = 0
+        self._recent: Deque[str] = deque()
+        self._folding: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"turns": 0, "summaries": 0, "failed": 0}
+
+    def add(self, text: str) -> None:
+        text = text.strip()
+        if not text:
+            return
+        if len(text) > self.max_turn_chars:
+            text = text[:self.max_turn_chars]
+        self._recent.append(text)
+        self.revision += 1
+        self.stats["turns"] += 1
+        self._maybe_fold()
+
+    def _maybe_fold(self) -> None:
+        if self._task is not None or len(self._recent) < self.window_turns + self.fold_turns:
+            return
+        # Everything beyond the verbatim window; more than fold_turns if turns
+        # piled up while the previous fold was running
+        self._folding = [self._recent.popleft() for _ in range(len(self._recent) - self.window_turns)]
+        self._task = asyncio.create_task(self._fold(self._folding))
+
+    async def _fold(self, turns: List[str]) -> None:
+        try:
+            summary = await self.summarize(self.summary, turns)
+            self.stats["summaries"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Conversation summary failed: {str(e)}")
+            self.stats["failed"] += 1
+            summary = " ".join([self.summary] + turns).strip()
+        if len(summary) > self.max_summary_chars:
+            # Keep the most recent part of an overlong summary
+            summary = summary[-self.max_summary_chars:]
+        self.summary = summary.strip()
+        self._folding = []
+        self._task = None
+        self.revision += 1
+        self._maybe_fold()
+
+    def render(self, question: str = "") -> str:
+        """
+        Summary and recent turns as prompt text, or "" before anything was
+        said. The newest turns that make up question are left out, since the
+        prompt carries them as the question itself.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of earlier conversation: {self.summary}")
+        # Capped so a slow summarizer can't let the verbatim part grow
+        turns = (self._folding + list(self._recent))[-(self.window_turns + self.fold_turns):]
+        while question and turns and turns[-1] in question:
+            turns.pop()
+        if turns:
+            parts.append("Recent conversation:\n" + "\n".join(f"- {turn}" for turn in turns))
+        return "\n\n".join(parts)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,213 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from retrieval import Chunk, chunk_text, tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder:
+    """Turns a batch of texts into an (n, dimension) float32 matrix"""
+
+    dimension: int = 0
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic local embedder based on signed feature hashing of tokens.
+
+    Needs no network access, so it stands in for Bedrock in tests and
+    benchmarks while still ranking lexically similar chunks together.
+    """
+
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in tokenize(text):
+                digest = hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                sign = 1.0 if value & 1 else -1.0
+                matrix[row, (value >> 1) % self.dimension] += sign
+        return matrix
+
+
+class BedrockEmbedder(Embedder):
+    """Embeds texts with a Titan embedding model, fanning a batch out over a small thread pool"""
+
+    def __init__(self, client, model_id: str, max_workers: int = 8):
+        self.client = client
+        self.model_id = model_id
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bedrock-embed')
+
+    def _embed_one(self, text: str) -> List[float]:
+        response = self.client.invoke_model(
+            modelId=self.model_id,
+            body=json.dumps({"inputText": text}),
+            accept='application/json',
+            contentType='application/json'
+        )
+        return json.loads(response['body'].read())['embedding']
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = list(self._executor.map(self._embed_one, texts))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if matrix.size:
+            self.dimension = matrix.shape[1]
+        return matrix
+
+
+class EmbeddingCache:
+    """LRU cache of normalized chunk vectors keyed by a hash of the chunk text"""
+
+    def __init__(self, max_entries: int = 200_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get(self, digest: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._vectors.get(digest)
+            if vector is not None:
+                self._vectors.move_to_end(digest)
+            return vector
+
+    def put(self, digest: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._vectors[digest] = vector
+            self._vectors.move_to_end(digest)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class DenseIndex:
+    """
+    Cosine-similarity index over chunk embeddings.
+
+    All vectors live in one contiguous float32 matrix, so a query is a single
+    matrix-vector product followed by a partial sort. Removing a document
+    compacts its rows out of the matrix. Exposes the same add/remove/sync/search
+    surface as BM25Index.
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        cache: Optional[EmbeddingCache] = None,
+        chunk_words: int = 200,
+        overlap_words: int = 40,
+        batch_size: int = 32,
+    ):
+        self.embedder = embedder
+        self.cache = cache or EmbeddingCache()
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._matrix: Optional[np.ndarray] = None
+        self._rows: List[Chunk] = []
+        self._doc_versions: Dict[str, str] = {}
+        self._next_chunk_id = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def has_document(self, doc_id: str, version: Optional[str] = None) -> bool:
+        with self._lock:
+            if doc_id not in self._doc_versions:
+                return False
+            return version is None or self._doc_versions[doc_id] == version
+
+    def embed_chunks(self, texts: List[str]) -> np.ndarray:
+        """Embed texts in batches, reusing cached vectors for previously seen chunk content"""
+        digests = [EmbeddingCache.content_hash(t) for t in texts]
+        vectors: List[Optional[np.ndarray]] = [self.cache.get(d) for d in digests]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            embedded = normalize_rows(self.embedder.embed([texts[i] for i in batch]))
+            for i, vector in zip(batch, embedded):
+                self.cache.put(digests[i], vector)
+                vectors[i] = vector
+        if not vectors:
+            return np.zeros((0, self.embedder.dimension), dtype=np.float32)
+        return np.vstack(vectors).astype(np.float32, copy=False)
+
+    def _append(self, doc_id: str, version: str, texts: List[str], vectors: np.ndarray) -> None:
+        self.remove_document(doc_id)
+        if len(texts):
+            count = len(self._rows)
+            if self._matrix is None:
+                self._matrix = np.zeros((max(64, len(texts)), vectors.shape[1]), dtype=np.float32)
+            elif count + len(texts) > self._matrix.shape[0]:
+                capacity = max(self._matrix.shape[0] * 2, count + len(texts))
+                grown = np.zeros((capacity, self._matrix.shape[1]), dtype=np.float32)
+                grown[:count] = self._matrix[:count]
+                self._matrix = grown
+            self._matrix[count:count + len(texts)] = vectors
+            for position, text in enumerate(texts):
+                self._rows.append(Chunk(self._next_chunk_id, doc_id, position, text, len(text.split())))
+                self._next_chunk_id += 1
+        self._doc_versions[doc_id] = version
+
+    def add_document(self, doc_id: str, text: str, version: str = "") -> None:
+        texts = chunk_text(text, self.chunk_words, self.overlap_words)
+        vectors = self.embed_chunks(texts)
+        with self._lock:
+            self._append(doc_id, version, texts, vectors)
+
+    def remove_document(self, doc_id: str) -> None:
+        with self._lock:
+            if self._doc_versions.pop(doc_id, None) is None:
+                return
+            keep = [i for i, chunk in enumerate(self._rows) if chunk.doc_id != doc_id]
+            if len(keep) == len(self._rows):
+                return
+            self._matrix[:len(keep)] = self._matrix[keep]
+            self._rows = [self._rows[i] for i in keep]
+
+    def sync(self, documents: Iterable[Tuple[str, str, str]]) -> None:
+        """Bring the index in line with [(doc_id, version, text)], embedding only changed documents"""
+        documents = list(documents)
+        with self._lock:
+            stale = [(d, v, t) for d, v, t in documents if not self.has_document(d, v)]
+            live = {d for d, _, _ in documents}
+            for doc_id in [d for d in self._doc_versions if d not in live]:
+                self.remove_document(doc_id)
+        # Embedding can be slow (network), so it runs without holding the lock
+        for doc_id, version, text in stale:
+            self.add_document(doc_id, text, version)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, Chunk]]:
+        query_vector = normalize_rows(self.embedder.embed([query]))[0]
+        with self._lock:
+            count = len(self._rows)
+            if not count:
+                return []
+            scores = self._matrix[:count] @ query_vector
+            k = min(top_k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), self._rows[i]) for i in top]
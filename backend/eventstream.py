@@ -0,0 +1,119 @@
+import struct
+import zlib
+from typing import Dict, Iterator, Tuple
+
+# AWS event stream framing: a 12-byte prelude (total length, headers length,
+# prelude CRC32), the headers, the payload and a trailing CRC32 of everything
+# before it. All integers are big-endian.
+PRELUDE_LENGTH = 12
+MESSAGE_CRC_LENGTH = 4
+HEADER_TYPE_STRING = 7
+
+
+def encode_headers(headers: Dict[str, str]) -> bytes:
+    encoded = bytearray()
+    for name, value in headers.items():
+        name_bytes = name.encode('utf-8')
+        value_bytes = value.encode('utf-8')
+        encoded += struct.pack('>B', len(name_bytes)) + name_bytes
+        encoded += struct.pack('>BH', HEADER_TYPE_STRING, len(value_bytes)) + value_bytes
+    return bytes(encoded)
+
+
+def encode_message(header_bytes: bytes, payload) -> bytes:
+    """Frame pre-encoded headers and a payload (any bytes-like object) as one event stream message"""
+    headers_length = len(header_bytes)
+    total_length = PRELUDE_LENGTH + headers_length + len(payload) + MESSAGE_CRC_LENGTH
+    message = bytearray(total_length)
+    struct.pack_into('>II', message, 0, total_length, headers_length)
+    struct.pack_into('>I', message, 8, zlib.crc32(memoryview(message)[:8]))
+    message[PRELUDE_LENGTH:PRELUDE_LENGTH + headers_length] = header_bytes
+    message[PRELUDE_LENGTH + headers_length:-MESSAGE_CRC_LENGTH] = payload
+    struct.pack_into('>I', message, total_length - MESSAGE_CRC_LENGTH, zlib.crc32(memoryview(message)[:-MESSAGE_CRC_LENGTH]))
+    return bytes(message)
+
+
+# Headers are identical for every audio event, so they are encoded once
+AUDIO_EVENT_HEADERS = encode_headers({
+    ':content-type': 'application/octet-stream',
+    ':event-type': 'AudioEvent',
+    ':message-type': 'event',
+})
+
+
+def encode_audio_event(chunk) -> bytes:
+    return encode_message(AUDIO_EVENT_HEADERS, chunk)
+
+
+def decode_message(data: bytes) -> Tuple[Dict[str, str], bytes]:
+    """Parse one event stream message, verifying both CRCs"""
+    if len(data) < PRELUDE_LENGTH + MESSAGE_CRC_LENGTH:
+        raise ValueError("Event stream message too short")
+    total_length, headers_length, prelude_crc = struct.unpack_from('>III', data, 0)
+    if total_length != len(data):
+        raise ValueError(f"Event stream length mismatch: {total_length} != {len(data)}")
+    if zlib.crc32(data[:8]) != prelude_crc:
+        raise ValueError("Event stream prelude CRC mismatch")
+    (message_crc,) = struct.unpack_from('>I', data, total_length - MESSAGE_CRC_LENGTH)
+    if zlib.crc32(data[:-MESSAGE_CRC_LENGTH]) != message_crc:
+        raise ValueError("Event stream message CRC mismatch")
+
+    headers = {}
+    offset = PRELUDE_LENGTH
+    end = PRELUDE_LENGTH + headers_length
+    while offset < end:
+        name_length = data[offset]
+        name = data[offset + 1:offset + 1 + name_length].decode('utf-8')
+        offset += 1 + name_length
+        header_type = data[offset]
+        if header_type != HEADER_TYPE_STRING:
+            raise ValueError(f"Unsupported event stream header type {header_type}")
+        (value_length,) = struct.unpack_from('>H', data, offset + 1)
+        headers[name] = data[offset + 3:offset + 3 + value_length].decode('utf-8')
+        offset += 3 + value_length
+    return headers, bytes(data[end:total_length - MESSAGE_CRC_LENGTH])
+
+
+class AudioFrameCoalescer:
+    """
+    Packs small PCM frames into fixed-size chunks in one preallocated buffer.
+
+    The browser worklet posts a frame per render quantum; sending each one
+    upstream costs a message and a header encode apiece, so frames are
+    gathered until chunk_bytes (e.g. 100 ms of audio) are buffered.
+    """
+
+    def __init__(self, chunk_bytes: int):
+        self.chunk_bytes = chunk_bytes
+        self._buffer = bytearray(chunk_bytes)
+        self._view = memoryview(self._buffer)
+        self._filled = 0
+
+    @staticmethod
+    def chunk_size(sample_rate: int, chunk_ms: int, sample_width: int = 2) -> int:
+        # Keep whole samples so a chunk never splits a 16-bit value
+        samples = max(1, sample_rate * chunk_ms // 1000)
+        return samples * sample_width
+
+    def feed(self, data: bytes) -> Iterator[memoryview]:
+        """
+        Add a frame and yield every chunk it completes.
+
+        Yielded views alias the internal buffer and are only valid until the
+        generator is resumed, so callers must encode or copy them right away.
+        """
+        data = memoryview(data)
+        while len(data):
+            take = min(len(data), self.chunk_bytes - self._filled)
+            self._view[self._filled:self._filled + take] = data[:take]
+            self._filled += take
+            data = data[take:]
+            if self._filled == self.chunk_bytes:
+                self._filled = 0
+                yield self._view
+
+    def flush(self) -> bytes:
+        """Return and clear whatever partial chunk is buffered"""
+        remainder = bytes(self._view[:self._filled])
+        self._filled = 0
+        return remainder
@@ -0,0 +1,298 @@
+import io
+import os
+import re
+import time
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    """Raised when the ingest queue is at capacity and cannot accept another document"""
+
+
+# --- Extraction helpers (run inside the process pool, so they must stay top-level) ---
+
+def split_pdf(
+    pdf_content: bytes, max_pages: int, pages_per_task: int, deadline: Optional[float] = None
+) -> Tuple[int, bool, List[bytes]]:
+    """
+    Split the first max_pages pages into PDFs of pages_per_task pages each,
+    so every extraction task is sent only its own pages. Returns the page
+    count used, whether the document was truncated, and the parts. Like
+    extract_pdf_pages it stops by itself past deadline, raising TimeoutError.
+    """
+    reader = PdfReader(io.BytesIO(pdf_content))
+    page_count = len(reader.pages)
+    used = min(page_count, max_pages)
+    parts = []
+    for start in range(0, used, pages_per_task):
+        writer = PdfWriter()
+        for index in range(start, min(start + pages_per_task, used)):
+            if deadline is not None and time.time() > deadline:
+                raise TimeoutError(f"Splitting stopped at page {index} of {used}")
+            writer.add_page(reader.pages[index])
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        parts.append(buffer.getvalue())
+    return used, page_count > max_pages, parts
+
+
+def extract_pdf_pages(pdf_content: bytes, deadline: Optional[float] = None) -> str:
+    """
+    Extract the text of every page of a PDF. Past deadline (a time.time()
+    value) the remaining pages are skipped: a task already running in the
+    pool cannot be cancelled from outside, so it has to stop by itself.
+    """
+    reader = PdfReader(io.BytesIO(pdf_content))
+    text = []
+    for index in range(len(reader.pages)):
+        if deadline is not None and time.time() > deadline:
+            break
+        try:
+            text.append(reader.pages[index].extract_text() or "")
+        except Exception as e:
+            text.append("")
+            logger.warning(f"Could not extract page {index}: {str(e)}")
+    return "\n".join(text)
+
+
+_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]")
+_HYPHEN_BREAK = re.compile(r"(\w)-\n(\w)")
+_INLINE_SPACE = re.compile(r"[ \t\u00a0]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_text(text: str) -> str:
+    """Strip control characters, re-join hyphenated line breaks and collapse whitespace"""
+    text = _CONTROL_CHARS.sub(" ", text.replace("\r\n", "\n").replace("\r", "\n"))
+    text = _HYPHEN_BREAK.sub(r"\1\2", text)
+    text = _INLINE_SPACE.sub(" ", text)
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+@dataclass
+class IngestJob:
+    file_id: str
+    key: str
+    etag: str
+    status: str = "queued"
+    pages: int = 0
+    truncated: bool = False
+    chars: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+class IngestPipeline:
+    """
+    Background ingest for knowledge-base uploads.
+
+    Each document goes through extraction (PDF pages fanned out over a process
+    pool so parsing never holds the server's GIL), normalization, a text
+    sidecar write and finally on_ready, which hands the text to the query-time
+    caches. The queue is bounded and every document is capped at max_pages
+    pages and timeout_seconds of extraction, so a single huge PDF cannot
+    monopolize the workers. A document deleted (forgotten) while it is being
+    ingested gets no sidecar. A failed document is retried the next time a
+    query asks for it (request_backfill).
+    """
+
+    def __init__(
+        self,
+        load_content: Callable[[str], Awaitable[bytes]],
+        write_sidecar: Callable[[str, str], Awaitable[None]],
+        on_ready: Callable[[str, str, str], Awaitable[None]],
+        max_queue: int = 64,
+        workers: int = 2,
+        process_workers: Optional[int] = None,
+        max_pages: int = 500,
+        pages_per_task: int = 25,
+        timeout_seconds: float = 120.0,
+        max_jobs_retained: int = 1000,
+        delete_sidecar: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.load_content = load_content
+        self.write_sidecar = write_sidecar
+        self.delete_sidecar = delete_sidecar
+        self.on_ready = on_ready
+        self.max_queue = max_queue
+        self.workers = workers
+        self.process_workers = process_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.max_pages = max_pages
+        self.pages_per_task = pages_per_task
+        self.timeout_seconds = timeout_seconds
+        self.max_jobs_retained = max_jobs_retained
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._backfill: Optional[Callable[[str], Awaitable[None]]] = None
+        self._backfill_pending = set()
+        # Bumped whenever a document becomes queryable; part of the knowledge-base version
+        self.completed = 0
+
+    async def start(self, backfill: Optional[Callable[[str], Awaitable[None]]] = None) -> None:
+        """Start the worker tasks; backfill(key) is used to ingest objects that have no sidecar yet"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._pool = ProcessPoolExecutor(max_workers=self.process_workers)
+        self._backfill = backfill
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Ingest pipeline started with {self.workers} workers and {self.process_workers} extraction processes")
+
+    async def warm_up(self) -> None:
+        """Spawn the extraction processes now instead of on the first upload"""
+        if self._pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[
+            loop.run_in_executor(self._pool, normalize_text, "") for _ in range(self.process_workers)
+        ])
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def full(self) -> bool:
+        return self._queue is not None and self._queue.full()
+
+    def get_job(self, file_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(file_id)
+
+    def forget(self, file_id: str) -> None:
+        """Drop a job; if it is still running, its result is discarded"""
+        self.jobs.pop(file_id, None)
+
+    def _current(self, job: IngestJob) -> bool:
+        # Deleted documents are forgotten, re-uploads replace the job
+        return self.jobs.get(job.file_id) is job
+
+    def submit(self, key: str, etag: str) -> IngestJob:
+        """Queue a stored object for ingest; its content is only loaded once a worker picks it up"""
+        if self._queue is None:
+            raise RuntimeError("Ingest pipeline has not been started")
+        file_id = os.path.basename(key)
+        job = IngestJob(file_id=file_id, key=key, etag=etag)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestQueueFull(f"Ingest queue is full ({self.max_queue} documents pending)")
+        self.jobs[file_id] = job
+        while len(self.jobs) > self.max_jobs_retained:
+            self.jobs.popitem(last=False)
+        return job
+
+    def _has_job(self, key: str) -> bool:
+        # A failed job wrote no sidecar; it stays visible to status polls but doesn't block a retry
+        job = self.jobs.get(os.path.basename(key))
+        return job is not None and job.status != "failed"
+
+    def request_backfill(self, key: str) -> None:
+        """Thread-safe: ask the pipeline to ingest an existing object that has no sidecar"""
+        if self._loop is None or self._backfill is None:
+            return
+        if self._has_job(key):
+            return
+        self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._run_backfill(key)))
+
+    async def _run_backfill(self, key: str) -> None:
+        if self._has_job(key) or key in self._backfill_pending:
+            return
+        self._backfill_pending.add(key)
+        try:
+            await self._backfill(key)
+        except IngestQueueFull:
+            logger.info(f"Ingest queue full; backfill of {key} deferred")
+        except Exception as e:
+            logger.error(f"Backfill of {key} failed: {str(e)}")
+        finally:
+            self._backfill_pending.discard(key)
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._process(job)
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"Ingest of {job.key} failed: {str(e)}")
+                logger.error(traceback.format_exc())
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
+
+    async def _process(self, job: IngestJob) -> None:
+        job.status = "extracting"
+        content = await self.load_content(job.key)
+        if job.key.lower().endswith('.pdf'):
+            try:
+                with span("pdf_extract"):
+                    text = await asyncio.wait_for(self._extract_pdf(job, content), self.timeout_seconds)
+            except (asyncio.TimeoutError, TimeoutError):
+                raise RuntimeError(f"Extraction exceeded {self.timeout_seconds:.0f}s limit")
+        else:
+            try:
+                text = content.decode('utf-8')
+            except UnicodeDecodeError:
+                # Still write an (empty) sidecar so queries don't keep asking for one
+                job.error = "Not a PDF or UTF-8 text document"
+                text = ""
+
+        job.status = "indexing"
+        # Regex work on a large document would hold the event loop
+        text = await asyncio.get_running_loop().run_in_executor(self._pool, normalize_text, text)
+        job.chars = len(text)
+        if not self._current(job):
+            job.status = "cancelled"
+            logger.info(f"Ingest of {job.key} abandoned: document deleted or replaced")
+            return
+        await self.write_sidecar(job.key, text)
+        if not self._current(job):
+            # Deleted while the sidecar was being written
+            if self.delete_sidecar is not None:
+                await self.delete_sidecar(job.key)
+            job.status = "cancelled"
+            return
+        await self.on_ready(job.key, job.etag, text)
+        self.completed += 1
+        job.status = "ready" if job.error is None else "skipped"
+        logger.info(f"Ingested {job.key}: {job.pages} pages, {job.chars} chars")
+
+    async def _extract_pdf(self, job: IngestJob, content: bytes) -> str:
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + self.timeout_seconds
+        # The split runs under the same deadline as the page extraction
+        job.pages, job.truncated, parts = await loop.run_in_executor(
+            self._pool, split_pdf, content, self.max_pages, self.pages_per_task, deadline
+        )
+        futures = [loop.run_in_executor(self._pool, extract_pdf_pages, part, deadline) for part in parts]
+        try:
+            texts = await asyncio.gather(*futures)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        return "\n".join(texts)
@@ -0,0 +1,185 @@
+import asyncio
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentCache:
+    """
+    Process-wide cache of extracted knowledge-base text.
+
+    Entries are keyed by (S3 key, ETag) so a re-uploaded object under the same
+    key is never served stale, and are evicted least-recently-used once the
+    total cached text exceeds max_bytes. The object listing itself is cached
+    as well and only refreshed after revalidate_seconds or an explicit
+    invalidate(), so steady-state lookups touch neither S3 nor the PDF parser.
+
+    A document larger than max_bytes cannot be cached. It keeps a size-only
+    entry instead, so the warning is logged once per version rather than on
+    every query, and stats() reports how many such documents are loaded
+    from storage each time.
+
+    A document with no text yet (still being ingested, or its ingest failed)
+    is remembered as missing for revalidate_seconds, so queries don't ask
+    storage for it every time; put() of its text clears that at once.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, revalidate_seconds: float = 300.0):
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._sizes: Dict[Tuple[str, str], int] = {}
+        # Size-only entries for documents too large to cache
+        self._oversized: Dict[Tuple[str, str], int] = {}
+        # Versions load_text had no text for, until their retry time
+        self._missing: Dict[Tuple[str, str], float] = {}
+        self._total_bytes = 0
+        self._listing: Optional[List[Tuple[str, str]]] = None
+        self._listed_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.oversized_loads = 0
+
+    def get(self, key: str, etag: str) -> Optional[str]:
+        with self._lock:
+            entry_key = (key, etag)
+            text = self._entries.get(entry_key)
+            if text is None:
+                self.misses += 1
+                if entry_key in self._oversized:
+                    self.oversized_loads += 1
+                return None
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return text
+
+    def put(self, key: str, etag: str, text: str) -> None:
+        size = len(text.encode('utf-8'))
+        with self._lock:
+            # Drop any older version of the same key before inserting
+            for stale in [k for k in self._entries if k[0] == key and k[1] != etag]:
+                self._remove(stale)
+            for stale in [k for k in self._oversized if k[0] == key and k[1] != etag]:
+                del self._oversized[stale]
+            for stale in [k for k in self._missing if k[0] == key]:
+                del self._missing[stale]
+            entry_key = (key, etag)
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            if size > self.max_bytes:
+                if entry_key not in self._oversized:
+                    self._oversized[entry_key] = size
+                    logger.warning(
+                        f"Document {key} ({size} bytes) exceeds the {self.max_bytes}-byte cache capacity; "
+                        f"it will be loaded from storage on every query"
+                    )
+                return
+            self._entries[entry_key] = text
+            self._sizes[entry_key] = size
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def _remove(self, entry_key: Tuple[str, str]) -> None:
+        self._entries.pop(entry_key, None)
+        self._total_bytes -= self._sizes.pop(entry_key, 0)
+
+    def listing(self) -> Optional[List[Tuple[str, str]]]:
+        """Return the cached (key, etag) listing, or None if it needs revalidating."""
+        with self._lock:
+            if self._listing is None:
+                return None
+            if time.monotonic() - self._listed_at > self.revalidate_seconds:
+                return None
+            return list(self._listing)
+
+    def set_listing(self, listing: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            self._listing = list(listing)
+            self._listed_at = time.monotonic()
+            live = set(listing)
+            for stale in [k for k in self._entries if k not in live]:
+                self._remove(stale)
+            for stale in [k for k in self._oversized if k not in live]:
+                del self._oversized[stale]
+            for stale in [k for k in self._missing if k not in live]:
+                del self._missing[stale]
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Force the next lookup to re-list; optionally drop all versions of key."""
+        with self._lock:
+            self._listing = None
+            if key is not None:
+                for stale in [k for k in self._entries if k[0] == key]:
+                    self._remove(stale)
+                for stale in [k for k in self._oversized if k[0] == key]:
+                    del self._oversized[stale]
+                for stale in [k for k in self._missing if k[0] == key]:
+                    del self._missing[stale]
+
+    async def get_documents(
+        self,
+        list_objects: Callable[[], Awaitable[List[Tuple[str, str]]]],
+        load_text: Callable[[str], Awaitable[Optional[str]]],
+    ) -> List[Tuple[str, str, str]]:
+        """
+        Return [(key, etag, text)] for every document in the knowledge base.
+
+        list_objects returns the current [(key, etag)] listing and is only
+        called when the cached listing has expired or been invalidated.
+        load_text fetches and extracts a single key and is only called on a
+        cache miss.
+        """
+        listing = self.listing()
+        if listing is None:
+            listing = await list_objects()
+            self.set_listing(listing)
+
+        texts = {key: self.get(key, etag) for key, etag in listing}
+        misses = [(key, etag) for key, etag in listing if texts[key] is None and not self._known_missing(key, etag)]
+        if misses:
+            # Cache misses are loaded concurrently rather than one round trip at a time
+            loaded = await asyncio.gather(*(load_text(key) for key, _ in misses))
+            for (key, etag), text in zip(misses, loaded):
+                if text is not None:
+                    self.put(key, etag, text)
+                else:
+                    with self._lock:
+                        self._missing[(key, etag)] = time.monotonic() + self.revalidate_seconds
+                texts[key] = text
+
+        documents = []
+        for key, etag in listing:
+            text = texts[key]
+            if text is not None and text.strip():
+                documents.append((key, etag, text))
+        return documents
+
+    def _known_missing(self, key: str, etag: str) -> bool:
+        with self._lock:
+            retry_at = self._missing.get((key, etag))
+            if retry_at is None:
+                return False
+            if retry_at <= time.monotonic():
+                del self._missing[(key, etag)]
+                return False
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "oversized": len(self._oversized),
+                "oversizedLoads": self.oversized_loads,
+                "missing": len(self._missing),
+            }
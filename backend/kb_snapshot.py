@@ -0,0 +1,552 @@
+import os
+import json
+import math
+import mmap
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from retrieval import Chunk, bm25_scores, chunk_spans, tokenize
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"KBSNAP01"
+# magic, then the offset and length of the JSON header at the end of the file
+PREAMBLE = struct.Struct("<8sQQ")
+ALIGNMENT = 64
+POINTER_FILE = "CURRENT"
+LOCK_FILE = "writer.lock"
+
+
+def listing_digest(listing: Sequence[Tuple[str, str]], **params: Any) -> str:
+    """Identity of a knowledge base: its sorted (key, etag) listing plus the chunking/index parameters"""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8"))
+    for key, etag in sorted(listing):
+        digest.update(f"\0{key}\0{etag}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass
+class SnapshotDocument:
+    doc_id: str
+    version: str
+    text_offset: int
+    text_length: int
+    first_chunk: int
+    chunk_count: int
+
+
+class KnowledgeBaseSnapshot:
+    """
+    One published snapshot, memory-mapped read-only.
+
+    The file holds the processed knowledge base as flat arrays: the
+    whitespace-normalized text of every document in one UTF-8 blob, chunk
+    byte offsets into it, a CSR inverted index (sorted vocabulary, postings
+    and term frequencies) and, for dense snapshots, the normalized chunk
+    vectors. Arrays are numpy views straight onto the mapping, so every
+    worker that opens the same file shares its pages through the OS page
+    cache instead of holding a private copy. Only the small JSON header
+    (document table and array layout) is parsed into process memory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_offset, header_length = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a knowledge-base snapshot")
+        header = json.loads(self._mmap[header_offset:header_offset + header_length])
+        self.header = header
+        self.version: int = header["version"]
+        self.digest: str = header["digest"]
+        self.kind: str = header["kind"]
+        self.params: Dict[str, Any] = header["params"]
+        self.missing: List[str] = header["missing"]
+        self.total_length: int = header["total_length"]
+        self.documents = [SnapshotDocument(**doc) for doc in header["documents"]]
+        self._by_key = {(doc.doc_id, doc.version): doc for doc in self.documents}
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, spec in header["arrays"].items():
+            count = math.prod(spec["shape"])
+            array = np.frombuffer(self._mmap, dtype=spec["dtype"], count=count, offset=spec["offset"])
+            self.arrays[name] = array.reshape(spec["shape"])
+
+    def __len__(self) -> int:
+        return len(self.arrays["chunk_doc"])
+
+    @property
+    def size(self) -> int:
+        return len(self._mmap)
+
+    def prefetch(self) -> None:
+        """Ask the OS to read the whole file into the page cache ahead of use"""
+        if hasattr(self._mmap, "madvise") and hasattr(mmap, "MADV_WILLNEED"):
+            self._mmap.madvise(mmap.MADV_WILLNEED)
+
+    def _text(self, start: int, stop: int) -> str:
+        return self.arrays["text"][start:stop].tobytes().decode("utf-8")
+
+    def document(self, doc_id: str, version: str) -> Optional[SnapshotDocument]:
+        return self._by_key.get((doc_id, version))
+
+    def document_text(self, doc: SnapshotDocument) -> str:
+        return self._text(doc.text_offset, doc.text_offset + doc.text_length)
+
+    def chunk(self, index: int) -> Chunk:
+        doc = self.documents[int(self.arrays["chunk_doc"][index])]
+        text = self._text(int(self.arrays["chunk_start"][index]), int(self.arrays["chunk_stop"][index]))
+        return Chunk(index, doc.doc_id, index - doc.first_chunk, text, int(self.arrays["chunk_length"][index]))
+
+    def _term_id(self, term: bytes) -> int:
+        """Binary search of the sorted vocabulary, without materializing it"""
+        blob, offsets = self.arrays["terms"], self.arrays["term_offsets"]
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = blob[offsets[mid]:offsets[mid + 1]].tobytes()
+            if candidate < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(offsets) - 1 and blob[offsets[lo]:offsets[lo + 1]].tobytes() == term:
+            return lo
+        return -1
+
+    def search(
+        self,
+        query: str,
+        top_k: int = 5,
+        embed_query: Optional[Callable[[str], np.ndarray]] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> List[Tuple[float, Chunk]]:
+        """BM25 over the inverted index, or cosine similarity for dense snapshots (needs embed_query)"""
+        count = len(self)
+        if not count:
+            return []
+        if self.kind == "dense":
+            scores = self.arrays["vectors"] @ embed_query(query)
+        else:
+            scores = self._bm25_scores(query, k1, b)
+            if scores is None:
+                return []
+        k = min(top_k, count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunk(int(i))) for i in top if self.kind == "dense" or scores[i] > 0]
+
+    def _bm25_scores(self, query: str, k1: float, b: float) -> Optional[np.ndarray]:
+        postings, chunks, frequencies = self.arrays["posting_offsets"], self.arrays["posting_chunks"], self.arrays["posting_tf"]
+        lengths = self.arrays["chunk_length"]
+
+        def term_postings():
+            for term in set(tokenize(query)):
+                term_id = self._term_id(term.encode("utf-8"))
+                if term_id >= 0:
+                    start, stop = postings[term_id], postings[term_id + 1]
+                    ids = chunks[start:stop]
+                    yield ids, frequencies[start:stop].astype(np.float64), lengths[ids].astype(np.float64)
+
+        return bm25_scores(term_postings(), len(self), len(self), self.total_length, k1, b)
+
+
+def write_snapshot(
+    path: str,
+    version: int,
+    digest: str,
+    documents: Sequence[Tuple[str, str, str]],
+    missing: Sequence[str] = (),
+    chunk_words: int = 200,
+    overlap_words: int = 40,
+    embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+    previous: Optional[KnowledgeBaseSnapshot] = None,
+) -> None:
+    """
+    Write [(doc_id, version, text)] as a snapshot file at path. With embed
+    (normalized vectors for a list of chunk texts) the snapshot is dense;
+    vectors of documents unchanged since previous are copied, not re-embedded.
+    """
+    params = {"chunk_words": chunk_words, "overlap_words": overlap_words}
+    kind = "dense" if embed is not None else "bm25"
+    text_parts: List[bytes] = []
+    doc_table: List[SnapshotDocument] = []
+    chunk_doc: List[int] = []
+    chunk_start: List[int] = []
+    chunk_stop: List[int] = []
+    chunk_length: List[int] = []
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    vector_parts: List[np.ndarray] = []
+    reusable = previous is not None and previous.kind == kind and previous.params == params
+    text_offset = 0
+    total_length = 0
+
+    for doc_index, (doc_id, doc_version, text) in enumerate(documents):
+        words = text.split()
+        encoded = [word.encode("utf-8") for word in words]
+        # Byte offset of every word in the normalized text, so a chunk is a
+        # contiguous slice of it
+        word_offsets = []
+        position = text_offset
+        for word in encoded:
+            word_offsets.append(position)
+            position += len(word) + 1
+        first_chunk = len(chunk_doc)
+        texts = []
+        for start, stop in chunk_spans(len(words), chunk_words, overlap_words):
+            chunk_body = " ".join(words[start:stop])
+            terms = tokenize(chunk_body)
+            chunk_id = len(chunk_doc)
+            chunk_doc.append(doc_index)
+            chunk_start.append(word_offsets[start])
+            chunk_stop.append(word_offsets[stop - 1] + len(encoded[stop - 1]))
+            if kind == "dense":
+                chunk_length.append(stop - start)
+                texts.append(chunk_body)
+            else:
+                chunk_length.append(len(terms))
+                total_length += len(terms)
+                frequencies: Dict[str, int] = {}
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0) + 1
+                for term, tf in frequencies.items():
+                    postings.setdefault(term, []).append((chunk_id, tf))
+        normalized = b" ".join(encoded)
+        text_parts.append(normalized)
+        doc_table.append(SnapshotDocument(doc_id, doc_version, text_offset, len(normalized), first_chunk, len(chunk_doc) - first_chunk))
+        text_offset += len(normalized)
+        if kind == "dense" and texts:
+            old = previous.document(doc_id, doc_version) if reusable else None
+            if old is not None and old.chunk_count == len(texts):
+                vector_parts.append(np.asarray(previous.arrays["vectors"][old.first_chunk:old.first_chunk + old.chunk_count]))
+            else:
+                vector_parts.append(np.asarray(embed(texts), dtype=np.float32))
+
+    arrays: Dict[str, np.ndarray] = {
+        "text": np.frombuffer(b"".join(text_parts), dtype=np.uint8),
+        "chunk_doc": np.asarray(chunk_doc, dtype=np.int32),
+        "chunk_start": np.asarray(chunk_start, dtype=np.int64),
+        "chunk_stop": np.asarray(chunk_stop, dtype=np.int64),
+        "chunk_length": np.asarray(chunk_length, dtype=np.int32),
+    }
+    if kind == "dense":
+        dimension = vector_parts[0].shape[1] if vector_parts else 0
+        arrays["vectors"] = np.vstack(vector_parts) if vector_parts else np.zeros((0, dimension), dtype=np.float32)
+    else:
+        # Vocabulary sorted by UTF-8 bytes so readers can binary-search the blob
+        vocabulary = sorted(postings, key=lambda term: term.encode("utf-8"))
+        encoded_terms = [term.encode("utf-8") for term in vocabulary]
+        arrays["terms"] = np.frombuffer(b"".join(encoded_terms), dtype=np.uint8)
+        arrays["term_offsets"] = np.cumsum([0] + [len(term) for term in encoded_terms], dtype=np.int64)
+        arrays["posting_offsets"] = np.cumsum([0] + [len(postings[term]) for term in vocabulary], dtype=np.int64)
+        flat = [entry for term in vocabulary for entry in postings[term]]
+        arrays["posting_chunks"] = np.asarray([chunk_id for chunk_id, _ in flat], dtype=np.int32)
+        arrays["posting_tf"] = np.asarray([tf for _, tf in flat], dtype=np.int32)
+
+    layout = {}
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, 0, 0))
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            offset = -f.tell() % ALIGNMENT
+            f.write(b"\0" * offset)
+            layout[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": f.tell()}
+            f.write(array.data)
+        header = json.dumps({
+            "version": version,
+            "digest": digest,
+            "kind": kind,
+            "params": params,
+            "created_at": time.time(),
+            "missing": list(missing),
+            "total_length": total_length,
+            "documents": [asdict(doc) for doc in doc_table],
+            "arrays": layout,
+        }).encode("utf-8")
+        header_offset = f.tell()
+        f.write(header)
+        f.seek(0)
+        f.write(PREAMBLE.pack(MAGIC, header_offset, len(header)))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SnapshotStore:
+    """
+    A directory of versioned snapshot files plus a CURRENT pointer naming the
+    live one.
+
+    Writers build a new version under a temporary name, fsync it, rename it
+    into place and then atomically replace CURRENT, so readers only ever see
+    complete files. Readers check the pointer at most every check_interval
+    seconds and switch by swapping a reference; searches already running
+    keep the mapping they started with, and an unlinked old version stays
+    valid until its last reader lets go. Writers across processes are
+    serialized with an advisory file lock.
+    """
+
+    def __init__(self, directory: str, check_interval: float = 1.0, keep: int = 3):
+        self.directory = directory
+        self.check_interval = check_interval
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+        self._snapshot: Optional[KnowledgeBaseSnapshot] = None
+        self._pointer_state: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.switches = 0
+        self.published = 0
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.directory, POINTER_FILE)
+
+    @property
+    def version(self) -> int:
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else 0
+
+    def current(self, force: bool = False) -> Optional[KnowledgeBaseSnapshot]:
+        """The live snapshot, re-reading the pointer if check_interval has passed"""
+        now = time.monotonic()
+        if (force or now - self._checked_at >= self.check_interval) and self._lock.acquire(blocking=force):
+            # Whoever holds the lock refreshes; everyone else keeps using the current mapping
+            try:
+                self._checked_at = now
+                self._refresh()
+            finally:
+                self._lock.release()
+        return self._snapshot
+
+    async def current_async(self, force: bool = False) -> Optional[KnowledgeBaseSnapshot]:
+        """current() for the event loop: a due pointer check runs in a thread"""
+        if force or time.monotonic() - self._checked_at >= self.check_interval:
+            return await asyncio.to_thread(self.current, force)
+        return self._snapshot
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(self.pointer_path)
+        except FileNotFoundError:
+            return
+        state = (stat.st_ino, stat.st_mtime_ns)
+        if state == self._pointer_state:
+            return
+        with open(self.pointer_path) as f:
+            name = f.read().strip()
+        try:
+            snapshot = KnowledgeBaseSnapshot(os.path.join(self.directory, name))
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not open knowledge-base snapshot {name}: {str(e)}")
+            return
+        self._snapshot = snapshot
+        self._pointer_state = state
+        self.switches += 1
+        logger.info(f"Switched to knowledge-base snapshot {snapshot.version} ({len(snapshot)} chunks, {snapshot.size} bytes)")
+
+    @contextmanager
+    def writer_lock(self) -> Iterator[bool]:
+        """Non-blocking inter-process writer lock; yields whether it was acquired"""
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.directory, LOCK_FILE), "a") as f:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def publish(self, write: Callable[[str, int, Optional[KnowledgeBaseSnapshot]], None]) -> KnowledgeBaseSnapshot:
+        """
+        Publish the next version; write(path, version, previous) fills in the
+        file. Call with writer_lock held.
+        """
+        previous = self.current(force=True)
+        version = (previous.version if previous is not None else 0) + 1
+        name = f"kb-{version:010d}.snap"
+        temporary = os.path.join(self.directory, f".{name}.{os.getpid()}.tmp")
+        try:
+            write(temporary, version, previous)
+            os.replace(temporary, os.path.join(self.directory, name))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        pointer_temporary = f"{self.pointer_path}.{os.getpid()}.tmp"
+        with open(pointer_temporary, "w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_temporary, self.pointer_path)
+        self.published += 1
+        self._prune(version)
+        return self.current(force=True)
+
+    def _prune(self, version: int) -> None:
+        for name in os.listdir(self.directory):
+            if not (name.startswith("kb-") and name.endswith(".snap")):
+                continue
+            try:
+                if int(name[3:-5]) <= version - self.keep:
+                    os.remove(os.path.join(self.directory, name))
+            except (ValueError, OSError):
+                continue
+
+    def info(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot is not None else 0,
+            "chunks": len(snapshot) if snapshot is not None else 0,
+            "documents": len(snapshot.documents) if snapshot is not None else 0,
+            "bytes": snapshot.size if snapshot is not None else 0,
+            "switches": self.switches,
+            "published": self.published,
+        }
+
+
+class SnapshotPublisher:
+    """
+    Keeps a SnapshotStore in line with the knowledge base from one worker.
+
+    Each worker runs one. It wakes when marked dirty (an ingest finished or a
+    document was deleted here) or every refresh_seconds, waits debounce_seconds
+    so a burst of uploads becomes one version, and publishes when this
+    worker has seen a change (dirty, or source_version moved) and its listing
+    differs from the live snapshot's, or the snapshot still lacks text for
+    some documents. Workers only publish changes they have seen themselves,
+    so one whose listing lags behind never overwrites a newer snapshot.
+    Workers that find another holding the writer lock retry on their next
+    wake-up.
+
+    list_documents returns the current [(key, etag)] listing; load_text(key)
+    returns a document's extracted text or None if it has none yet.
+    """
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        list_documents: Callable[[], Awaitable[List[Tuple[str, str]]]],
+        load_text: Callable[[str], Awaitable[Optional[str]]],
+        source_version: Optional[Callable[[], Any]] = None,
+        chunk_words: int = 200,
+        overlap_words: int = 40,
+        embed: Optional[Callable[[List[str]], np.ndarray]] = None,
+        debounce_seconds: float = 1.0,
+        refresh_seconds: float = 30.0,
+        max_concurrent_loads: int = 16,
+    ):
+        self.store = store
+        self.list_documents = list_documents
+        self.load_text = load_text
+        self.source_version = source_version
+        self._seen_version: Any = object()
+        self.params = {"chunk_words": chunk_words, "overlap_words": overlap_words, "kind": "dense" if embed else "bm25"}
+        self.embed = embed
+        self.debounce_seconds = debounce_seconds
+        self.refresh_seconds = refresh_seconds
+        self.max_concurrent_loads = max_concurrent_loads
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self) -> None:
+        self._dirty.set()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.publish_if_changed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Knowledge-base snapshot publish failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._dirty.wait(), self.refresh_seconds)
+                await asyncio.sleep(self.debounce_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    async def publish_if_changed(self) -> bool:
+        """Publish a new version if needed; returns whether one was written"""
+        dirty = self._dirty.is_set()
+        self._dirty.clear()
+        source_version = self.source_version() if self.source_version is not None else None
+        changed = dirty or source_version != self._seen_version
+        self._seen_version = source_version
+        snapshot = await self.store.current_async()
+        if snapshot is not None and not changed:
+            return False
+        listing = await self.list_documents()
+        digest = listing_digest(listing, **self.params)
+        if snapshot is not None and snapshot.digest == digest and not (dirty and snapshot.missing):
+            return False
+        with self.store.writer_lock() as acquired:
+            if not acquired:
+                self._dirty.set()
+                return False
+            # Another worker may have published this listing while we waited
+            snapshot = await self.store.current_async(force=True)
+            if snapshot is not None and snapshot.digest == digest and not (dirty and snapshot.missing):
+                return False
+            documents, missing = await self._collect(listing, snapshot)
+
+            def write(path, version, previous):
+                write_snapshot(
+                    path, version, digest, documents, missing,
+                    chunk_words=self.params["chunk_words"],
+                    overlap_words=self.params["overlap_words"],
+                    embed=self.embed,
+                    previous=previous,
+                )
+
+            started = time.perf_counter()
+            published = await asyncio.to_thread(self.store.publish, write)
+        logger.info(f"Published knowledge-base snapshot {published.version}: {len(documents)} documents, "
+                    f"{len(published)} chunks, {len(missing)} without text, in {time.perf_counter() - started:.2f}s")
+        return True
+
+    async def _collect(self, listing, snapshot) -> Tuple[List[Tuple[str, str, str]], List[str]]:
+        """Texts for the listing; unchanged documents come from the previous snapshot, not storage"""
+        semaphore = asyncio.Semaphore(self.max_concurrent_loads)
+
+        async def load(key, etag):
+            old = snapshot.document(key, etag) if snapshot is not None else None
+            if old is not None:
+                return snapshot.document_text(old)
+            async with semaphore:
+                return await self.load_text(key)
+
+        texts = await asyncio.gather(*(load(key, etag) for key, etag in listing))
+        documents, missing = [], []
+        for (key, etag), text in zip(listing, texts):
+            if text is not None and text.strip():
+                documents.append((key, etag, text))
+            elif text is None:
+                missing.append(key)
+        return documents, missing
@@ -1,27 +1,47 @@
 import os
 import asyncio
-import requests
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, Body
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, Body, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Dict, Any, List
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import uuid
 from dotenv import load_dotenv
 import json
-import base64
 import time
-import websockets
-from datetime import datetime
+from datetime import datetime, timezone
+from decimal import Decimal
 import boto3.session
-from botocore.auth import SigV4Auth
-from botocore.awsrequest import AWSRequest
-from botocore.credentials import Credentials
 import aiohttp
 import logging
 import traceback
-import io
-from PyPDF2 import PdfReader
+import threading
+import bisect
+from contextlib import asynccontextmanager
+from aws_clients import LazyClient
+from aws_debug import WireDebug, WireDebugMiddleware
+from metrics import observe, registry, span
+from kb_cache import DocumentCache
+from kb_snapshot import SnapshotPublisher, SnapshotStore
+from retrieval import BM25Index
+from embeddings import BedrockEmbedder, DenseIndex, EmbeddingCache, HashingEmbedder, normalize_rows
+from ingest import IngestPipeline, IngestQueueFull
+from storage import LocalStorage, ObjectInfo, ObjectNotFound, S3Storage
+from catalog import KnowledgeBaseCatalog
+from context_packer import ContextPacker
+from conversation_memory import ConversationMemory
+from answer_cache import AnswerCache
+from speculation import SpeculativeRetriever
+from bedrock_limiter import PRIORITY_BACKGROUND, PRIORITY_CHAT, PRIORITY_LIVE, BedrockLimiter, is_throttling
+from assistance_worker import AssistanceWorker
+from call_analytics import CallAnalytics
+from call_sessions import CLOSE_TRY_AGAIN_LATER, CallCapacityExceeded, CallSessionManager
+from eventstream import AudioFrameCoalescer, decode_message, encode_audio_event
+from transcript_sender import TranscriptSender
+from transcript_store import DynamoTable, InMemoryTable, TranscriptWriter
+from transcription_jobs import AwsTranscribeBackend, FakeTranscribeBackend, TranscriptCache, TranscriptionJobManager
 
 # Load environment variables from both backend and root directories
 load_dotenv()  # Load from current directory (backend/)
@@ -31,7 +51,22 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))  # Load from
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_background_services()
+    warmup = asyncio.create_task(warm_up()) if WARMUP_ENABLED else None
+    if warmup is None:
+        readiness.update(status="ready")
+    try:
+        yield
+    finally:
+        readiness.update(status="stopping")
+        if warmup is not None:
+            warmup.cancel()
+            await asyncio.gather(warmup, return_exceptions=True)
+        await stop_background_services()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 FRONTEND_HOST = os.getenv('FRONTEND_HOST', 'http://localhost:5173')
@@ -56,8 +91,15 @@ AWS_REGION = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
 AWS_ACCESS_KEY = os.getenv('AWS_ACCESS_KEY_ID')
 AWS_SECRET_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 
-# Configure logging for AWS clients
-boto3.set_stream_logger('botocore', logging.DEBUG)
+# AWS wire logging is off by default and enabled per request with the
+# X-Debug-AWS: 1 header (or ?debug_aws=1) when AWS_WIRE_DEBUG_ALLOWED=true
+wire_debug = WireDebug()
+wire_debug.install()
+if os.getenv('AWS_WIRE_DEBUG_ALLOWED', 'false').lower() == 'true':
+    app.add_middleware(WireDebugMiddleware, wire_debug=wire_debug)
+
+live_sessions = registry.gauge("live_sessions", "Live calls admitted on /ws/transcribe")
+component_stats = registry.gauge("component_stat", "Counters and levels reported by internal components", ("component", "stat"))
 
 # Configure AWS clients with explicit credentials
 session = boto3.Session(
@@ -66,95 +108,558 @@ session = boto3.Session(
     region_name=AWS_REGION
 )
 
-# S3 client
-s3_client = session.client('s3')
+# AWS clients are built on first use (or by the warm-up below), not at import
+dynamodb = LazyClient(lambda: session.resource('dynamodb'), 'dynamodb')
 
-# DynamoDB client
-dynamodb = session.resource('dynamodb')
-conversation_table = dynamodb.Table('CallConversations')
+# Call persistence: one header item per call in CallConversations, and the
+# transcript as (ConversationId, Sequence) items written behind the live
+# stream. TRANSCRIPT_STORE=memory keeps both in process for local runs.
+TRANSCRIPT_SEGMENTS_TABLE = os.getenv('TRANSCRIPT_SEGMENTS_TABLE', 'CallTranscriptSegments')
+if os.getenv('TRANSCRIPT_STORE', 'dynamodb') == 'memory':
+    conversation_table = InMemoryTable('ConversationId')
+    segments_table = InMemoryTable('ConversationId', 'Sequence')
+else:
+    conversation_table = DynamoTable(LazyClient(lambda: dynamodb.Table('CallConversations')), 'ConversationId')
+    segments_table = DynamoTable(LazyClient(lambda: dynamodb.Table(TRANSCRIPT_SEGMENTS_TABLE)), 'ConversationId', 'Sequence')
+# Missing tables are created (on-demand billing) at startup unless
+# DYNAMODB_CREATE_TABLES=false
+DYNAMODB_CREATE_TABLES = os.getenv('DYNAMODB_CREATE_TABLES', 'true').lower() == 'true'
+TRANSCRIPT_FLUSH_SECONDS = float(os.getenv('TRANSCRIPT_FLUSH_SECONDS', 2))
+TRANSCRIPT_MAX_BUFFERED = int(os.getenv('TRANSCRIPT_MAX_BUFFERED', 1000))
 
 # Configure Amazon Transcribe
-transcribe_client = boto3.client(
-    'transcribe',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_DEFAULT_REGION')
-)
+transcribe_client = LazyClient(lambda: session.client('transcribe'), 'transcribe')
 
 BUCKET_NAME = os.getenv('S3_BUCKET_NAME', 'live-call-insight-db')
 KNOWLEDGE_BASE_PREFIX = "knowledge-base/"
+KNOWLEDGE_BASE_TEXT_PREFIX = "knowledge-base-text/"
 RECORDINGS_PREFIX = "recordings/"
 
+# Object storage: S3 by default, or a local directory (STORAGE_BACKEND=local)
+# so the API can run and be load-tested without network access
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 's3')
+if STORAGE_BACKEND == 'local':
+    storage = LocalStorage(
+        os.getenv('LOCAL_STORAGE_DIR', os.path.join(os.path.dirname(__file__), 'local-storage')),
+        max_workers=int(os.getenv('STORAGE_MAX_WORKERS', 8)),
+    )
+else:
+    storage = S3Storage(
+        session,
+        BUCKET_NAME,
+        max_workers=int(os.getenv('STORAGE_MAX_WORKERS', 16)),
+        max_pool_connections=int(os.getenv('STORAGE_MAX_POOL_CONNECTIONS', 0)) or None,
+    )
+
 # Bedrock config
 BEDROCK_MODEL_ID = os.getenv('BEDROCK_MODEL_ID')
 BEDROCK_EMBEDDING_MODEL_ID = os.getenv('BEDROCK_EMBEDDING_MODEL_ID')
 BEDROCK_KNOWLEDGE_BASE_ID = os.getenv('BEDROCK_KNOWLEDGE_BASE_ID')
 
-# Bedrock client with explicit configuration
-bedrock_runtime = session.client(
+# Process-wide admission control for model calls; live-call assistance is
+# admitted ahead of chatbot traffic
+bedrock_limiter = BedrockLimiter(
+    rate_per_second=float(os.getenv('BEDROCK_RATE_PER_SECOND', 10)),
+    burst=int(os.getenv('BEDROCK_BURST', 10)),
+    max_in_flight=int(os.getenv('BEDROCK_MAX_IN_FLIGHT', 16)),
+    max_retries=int(os.getenv('BEDROCK_MAX_RETRIES', 3)),
+)
+BEDROCK_BUSY_MESSAGE = "Assistance is busy right now. Please try again in a moment."
+
+# Bedrock client with explicit configuration. Retries are left to
+# bedrock_limiter so throttling feeds back into its concurrency limit.
+bedrock_runtime = LazyClient(lambda: session.client(
+    service_name='bedrock-runtime',
+    region_name=AWS_REGION,
+    aws_access_key_id=AWS_ACCESS_KEY,
+    aws_secret_access_key=AWS_SECRET_KEY,
+    config=Config(
+        retries={'total_max_attempts': 1, 'mode': 'standard'},
+        max_pool_connections=int(os.getenv('BEDROCK_MAX_IN_FLIGHT', 16)),
+    ),
+), 'bedrock-runtime')
+
+# Embedding calls run on index and query worker threads, outside
+# bedrock_limiter, so their client keeps botocore's own retries. Adaptive
+# mode also rate-limits client-side once Bedrock starts throttling.
+bedrock_embedding_runtime = LazyClient(lambda: session.client(
     service_name='bedrock-runtime',
     region_name=AWS_REGION,
     aws_access_key_id=AWS_ACCESS_KEY,
     aws_secret_access_key=AWS_SECRET_KEY,
+    config=Config(
+        retries={'total_max_attempts': int(os.getenv('BEDROCK_EMBEDDING_MAX_ATTEMPTS', 5)), 'mode': 'adaptive'},
+        max_pool_connections=8,
+    ),
+), 'bedrock-runtime-embeddings')
+
+# In-memory catalog of knowledge-base objects backing the dashboard endpoints
+# and the document listing used for assistance
+kb_catalog = KnowledgeBaseCatalog(
+    storage,
+    KNOWLEDGE_BASE_PREFIX,
+    presign_expires_in=int(os.getenv('PRESIGN_EXPIRES_SECONDS', 3600)),
+    reconcile_seconds=float(os.getenv('CATALOG_RECONCILE_SECONDS', 300)),
+)
+CATALOG_PAGE_LIMIT = int(os.getenv('CATALOG_PAGE_LIMIT', 100))
+CATALOG_MAX_PAGE_LIMIT = 1000
+
+# Extracted knowledge-base text, shared by every chat and transcription session
+document_cache = DocumentCache(
+    max_bytes=int(os.getenv('KB_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    revalidate_seconds=float(os.getenv('KB_CACHE_REVALIDATE_SECONDS', 300)),
+)
+
+# Retrieval index over the cached documents; only the best chunks go into prompts.
+# RETRIEVER=bm25 uses the lexical index, RETRIEVER=dense embeds chunks with
+# BEDROCK_EMBEDDING_MODEL_ID (or the local hashing embedder when it is unset).
+# RETRIEVAL_TOP_K candidates are handed to the context packer, which decides
+# how many of them fit in the prompt.
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', 20))
+RETRIEVAL_CHUNK_WORDS = int(os.getenv('RETRIEVAL_CHUNK_WORDS', 200))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv('RETRIEVAL_CHUNK_OVERLAP', 40))
+RETRIEVER = os.getenv('RETRIEVER', 'dense' if BEDROCK_EMBEDDING_MODEL_ID else 'bm25')
+
+if RETRIEVER == 'dense':
+    if BEDROCK_EMBEDDING_MODEL_ID:
+        embedder = BedrockEmbedder(bedrock_embedding_runtime, BEDROCK_EMBEDDING_MODEL_ID)
+    else:
+        embedder = HashingEmbedder()
+    kb_index = DenseIndex(
+        embedder,
+        cache=EmbeddingCache(max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 200000))),
+        chunk_words=RETRIEVAL_CHUNK_WORDS,
+        overlap_words=RETRIEVAL_CHUNK_OVERLAP,
+        batch_size=int(os.getenv('EMBEDDING_BATCH_SIZE', 32)),
+    )
+else:
+    kb_index = BM25Index(
+        chunk_words=RETRIEVAL_CHUNK_WORDS,
+        overlap_words=RETRIEVAL_CHUNK_OVERLAP,
+    )
+
+# With several uvicorn workers, KB_SNAPSHOT_DIR (a directory all of them can
+# reach) holds the processed knowledge base as a versioned, memory-mapped
+# snapshot: workers search the shared mapping instead of each keeping the
+# text and index in memory, and the worker that changes the knowledge base
+# publishes the next version. Until a first snapshot exists, retrieval falls
+# back to the per-process index above.
+KB_SNAPSHOT_DIR = os.getenv('KB_SNAPSHOT_DIR')
+kb_snapshots = SnapshotStore(
+    KB_SNAPSHOT_DIR,
+    check_interval=float(os.getenv('KB_SNAPSHOT_CHECK_SECONDS', 1)),
+) if KB_SNAPSHOT_DIR else None
+
+# Batch transcription jobs, tracked by one background poller.
+# TRANSCRIBE_BACKEND=fake swaps in a local stand-in for Amazon Transcribe.
+if os.getenv('TRANSCRIBE_BACKEND', 'aws') == 'fake':
+    transcribe_backend = FakeTranscribeBackend()
+else:
+    transcribe_backend = AwsTranscribeBackend(transcribe_client)
+transcription_jobs = TranscriptionJobManager(
+    transcribe_backend,
+    min_interval=float(os.getenv('TRANSCRIBE_POLL_MIN_SECONDS', 1)),
+    max_interval=float(os.getenv('TRANSCRIBE_POLL_MAX_SECONDS', 30)),
+    max_poll_errors=int(os.getenv('TRANSCRIBE_MAX_POLL_ERRORS', 10)),
+    max_job_seconds=float(os.getenv('TRANSCRIBE_MAX_JOB_SECONDS', 4 * 3600)),
+    cache=TranscriptCache(max_bytes=int(os.getenv('TRANSCRIPT_CACHE_MAX_BYTES', 64 * 1024 * 1024))),
 )
 
-def extract_text_from_pdf(pdf_content):
-    """Extract text from PDF content"""
+# Live transcription audio: incoming worklet frames are coalesced into
+# AUDIO_CHUNK_MS chunks and sent upstream as binary event stream messages.
+# TRANSCRIBE_SAMPLE_RATE is the rate the client actually sends (the browser
+# worklet, frontend/public/audio-processor.js, downsamples to 16 kHz); chunk
+# sizes, audio seconds and the rate declared to Transcribe all derive from it.
+TRANSCRIBE_SAMPLE_RATE = int(os.getenv('TRANSCRIBE_SAMPLE_RATE', 16000))
+AUDIO_CHUNK_MS = min(max(int(os.getenv('AUDIO_CHUNK_MS', 100)), 20), 200)
+AUDIO_CHUNK_BYTES = AudioFrameCoalescer.chunk_size(TRANSCRIBE_SAMPLE_RATE, AUDIO_CHUNK_MS)
+
+# Live calls: at most MAX_LIVE_CALLS at once, up to CALL_QUEUE_SIZE more wait
+# CALL_QUEUE_TIMEOUT_SECONDS for a slot and the rest are closed with 1013
+# (try again later). Each call buffers at most CALL_AUDIO_BUFFER_BYTES of
+# audio not yet sent upstream.
+call_sessions = CallSessionManager(
+    session,
+    AWS_REGION,
+    max_calls=int(os.getenv('MAX_LIVE_CALLS', 50)),
+    max_queued=int(os.getenv('CALL_QUEUE_SIZE', 10)),
+    queue_timeout=float(os.getenv('CALL_QUEUE_TIMEOUT_SECONDS', 10)),
+    max_audio_buffer_bytes=int(os.getenv('CALL_AUDIO_BUFFER_BYTES', 512 * 1024)),
+)
+CALL_DRAIN_SECONDS = float(os.getenv('CALL_DRAIN_SECONDS', 5))
+
+# Call analytics: a parallel Scan of CallConversations split into
+# ANALYTICS_SCAN_SEGMENTS segments over ANALYTICS_SCAN_WORKERS threads.
+# Aggregates of finished calls are checkpointed in storage, so each run only
+# aggregates calls that ended since the last one (the Scan still reads the
+# whole table). Calls open for ANALYTICS_OPEN_CALL_MAX_SECONDS are counted as
+# abandoned. ANALYTICS_INTERVAL_SECONDS > 0 also runs it on a schedule.
+CALL_ANALYTICS_CHECKPOINT_KEY = "analytics/call-stats.json"
+
+async def load_analytics_checkpoint():
     try:
-        # Create a PDF reader object
-        pdf_file = io.BytesIO(pdf_content)
-        pdf_reader = PdfReader(pdf_file)
-        
-        # Extract text from all pages
-        text = []
-        for page in pdf_reader.pages:
-            text.append(page.extract_text())
-        
-        return "\n".join(text)
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {str(e)}")
-        return ""
+        return json.loads(await storage.get(CALL_ANALYTICS_CHECKPOINT_KEY))
+    except ObjectNotFound:
+        return None
+
+async def save_analytics_checkpoint(checkpoint):
+    await storage.put(CALL_ANALYTICS_CHECKPOINT_KEY, json.dumps(checkpoint).encode('utf-8'), 'application/json')
+
+call_analytics = CallAnalytics(
+    conversation_table,
+    load_analytics_checkpoint,
+    save_analytics_checkpoint,
+    total_segments=int(os.getenv('ANALYTICS_SCAN_SEGMENTS', 8)),
+    workers=int(os.getenv('ANALYTICS_SCAN_WORKERS', 4)),
+    page_size=int(os.getenv('ANALYTICS_SCAN_PAGE_SIZE', 1000)),
+    settle_seconds=float(os.getenv('ANALYTICS_SETTLE_SECONDS', 300)),
+    open_call_max_seconds=float(os.getenv('ANALYTICS_OPEN_CALL_MAX_SECONDS', 6 * 3600)),
+    interval_seconds=float(os.getenv('ANALYTICS_INTERVAL_SECONDS', 0)),
+)
+
+# Per-session assistance generation runs off the transcript receive loop
+ASSISTANCE_COALESCE_SECONDS = float(os.getenv('ASSISTANCE_COALESCE_SECONDS', 0.4))
+ASSISTANCE_QUEUE_SIZE = int(os.getenv('ASSISTANCE_QUEUE_SIZE', 16))
+ASSISTANCE_STREAMING = os.getenv('ASSISTANCE_STREAMING', 'true').lower() == 'true'
+# Rolling call context given to live assistance: the last
+# CONVERSATION_WINDOW_TURNS finals verbatim, older ones folded into a summary
+# every CONVERSATION_FOLD_TURNS
+CONVERSATION_WINDOW_TURNS = int(os.getenv('CONVERSATION_WINDOW_TURNS', 6))
+CONVERSATION_FOLD_TURNS = int(os.getenv('CONVERSATION_FOLD_TURNS', 6))
+# Retrieval starts on stable partial transcripts once they have been
+# unchanged for SPECULATION_DEBOUNCE_SECONDS; counters are shared by all calls
+SPECULATION_DEBOUNCE_SECONDS = float(os.getenv('SPECULATION_DEBOUNCE_SECONDS', 0.15))
+speculation_stats: Dict[str, int] = {}
+# Partial transcripts go out at most once per PARTIAL_MIN_INTERVAL_SECONDS;
+# clients connecting with ?partials=delta receive only the changed suffix
+PARTIAL_MIN_INTERVAL_SECONDS = float(os.getenv('PARTIAL_MIN_INTERVAL_SECONDS', 0.2))
+
+# Generated answers keyed on the normalized question and knowledge-base version.
+# Live-call answers depend on the conversation so far and are never cached.
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv('ANSWER_CACHE_MAX_ENTRIES', 1024)),
+    ttl_seconds=float(os.getenv('ANSWER_CACHE_TTL_SECONDS', 600)),
+)
+
+def knowledge_base_version():
+    """Changes on every upload, delete, out-of-band change, completed ingest and snapshot switch"""
+    return (kb_catalog.version, ingest_pipeline.completed, kb_snapshots.version if kb_snapshots is not None else 0)
+
+# Streaming uploads: part size and number of parts in flight per upload
+UPLOAD_PART_SIZE = int(os.getenv('UPLOAD_PART_SIZE', 8 * 1024 * 1024))
+UPLOAD_MAX_CONCURRENCY = int(os.getenv('UPLOAD_MAX_CONCURRENCY', 4))
+CONTENT_INDEX_PREFIX = "content-index/"
+
+async def dedupe_upload(prefix, key, sha256):
+    """
+    Return the key of an existing object under prefix with the same content hash,
+    deleting the freshly uploaded duplicate, or None after recording key as the
+    owner of this hash.
+    """
+    marker_key = f"{CONTENT_INDEX_PREFIX}{prefix}{sha256}"
+    try:
+        existing_key = (await storage.get(marker_key)).decode('utf-8')
+        if existing_key != key:
+            await storage.head(existing_key)
+            await storage.delete(key)
+            return existing_key
+    except ObjectNotFound:
+        pass
+    await storage.put(marker_key, key.encode('utf-8'), 'text/plain')
+    await storage.put(f"{CONTENT_INDEX_PREFIX}by-key/{key}", sha256.encode('utf-8'), 'text/plain')
+    return None
+
+async def forget_content_hash(prefix, key):
+    """Drop a deleted object's content-index entries, so the same content can be uploaded again"""
+    index_key = f"{CONTENT_INDEX_PREFIX}by-key/{key}"
+    try:
+        sha256 = (await storage.get(index_key)).decode('utf-8')
+    except ObjectNotFound:
+        return
+    marker_key = f"{CONTENT_INDEX_PREFIX}{prefix}{sha256}"
+    try:
+        # A later upload of the same content may own the marker by now
+        if (await storage.get(marker_key)).decode('utf-8') == key:
+            await storage.delete(marker_key)
+    except ObjectNotFound:
+        pass
+    await storage.delete(index_key)
+
+async def content_hash_for(key):
+    """SHA-256 of a stored object, from the upload-time index or by hashing it once"""
+    index_key = f"{CONTENT_INDEX_PREFIX}by-key/{key}"
+    try:
+        return (await storage.get(index_key)).decode('utf-8')
+    except ObjectNotFound:
+        pass
+    # Streamed, so recordings that predate the index are never held in memory
+    sha256 = await storage.sha256(key)
+    await storage.put(index_key, sha256.encode('utf-8'), 'text/plain')
+    return sha256
+
+async def stream_upload(file, key):
+    return await storage.upload_stream(
+        key,
+        file.read,
+        content_type=file.content_type,
+        part_size=UPLOAD_PART_SIZE,
+        max_concurrency=UPLOAD_MAX_CONCURRENCY,
+    )
+
+def sidecar_key(key):
+    """S3 key of the extracted-text sidecar written for a knowledge-base object"""
+    return f"{KNOWLEDGE_BASE_TEXT_PREFIX}{os.path.basename(key)}.txt"
+
+async def write_sidecar(key, text):
+    await storage.put(sidecar_key(key), text.encode('utf-8'), 'text/plain; charset=utf-8')
+
+async def delete_sidecar(key):
+    await storage.delete(sidecar_key(key))
+
+async def on_document_ready(key, etag, text):
+    if kb_snapshots is not None:
+        kb_snapshot_publisher.mark_dirty()
+        return
+    document_cache.put(key, etag, text)
+    await asyncio.to_thread(kb_index.add_document, key, text, etag)
+
+async def backfill_document(key):
+    """Ingest an existing knowledge-base object that predates the pipeline"""
+    info = await storage.head(key)
+    ingest_pipeline.submit(key, info.etag)
+
+# Background extraction of uploaded documents; queries only read the text sidecars
+ingest_pipeline = IngestPipeline(
+    load_content=storage.get,
+    write_sidecar=write_sidecar,
+    delete_sidecar=delete_sidecar,
+    on_ready=on_document_ready,
+    max_queue=int(os.getenv('INGEST_MAX_QUEUE', 64)),
+    workers=int(os.getenv('INGEST_WORKERS', 2)),
+    process_workers=int(os.getenv('INGEST_PROCESS_WORKERS', 0)) or None,
+    max_pages=int(os.getenv('INGEST_MAX_PAGES', 500)),
+    timeout_seconds=float(os.getenv('INGEST_TIMEOUT_SECONDS', 120)),
+)
+
+async def list_documents():
+    await kb_catalog.ensure_loaded()
+    return kb_catalog.listing()
+
+async def load_document_text(key):
+    # Only pre-extracted sidecar text is read here; objects without one
+    # are handed to the ingest pipeline and skipped until it finishes
+    try:
+        return (await storage.get(sidecar_key(key))).decode('utf-8')
+    except ObjectNotFound:
+        ingest_pipeline.request_backfill(key)
+        return None
+
+def embed_query(query):
+    return normalize_rows(kb_index.embedder.embed([query]))[0]
+
+kb_snapshot_publisher = SnapshotPublisher(
+    kb_snapshots,
+    list_documents,
+    load_document_text,
+    source_version=lambda: kb_catalog.version,
+    chunk_words=RETRIEVAL_CHUNK_WORDS,
+    overlap_words=RETRIEVAL_CHUNK_OVERLAP,
+    embed=kb_index.embed_chunks if RETRIEVER == 'dense' else None,
+    debounce_seconds=float(os.getenv('KB_SNAPSHOT_DEBOUNCE_SECONDS', 1)),
+    refresh_seconds=float(os.getenv('KB_SNAPSHOT_REFRESH_SECONDS', 30)),
+) if kb_snapshots is not None else None
+
+def collect_component_stats():
+    components = {
+        "answer_cache": answer_cache.info(),
+        "bedrock_limiter": bedrock_limiter.info(),
+        "speculation": speculation_stats,
+        "document_cache": document_cache.stats(),
+        "kb_snapshot": kb_snapshots.info() if kb_snapshots is not None else {},
+        "call_sessions": call_sessions.info(),
+    }
+    for component, stats in components.items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                component_stats.set(value, component=component, stat=stat)
+    live_sessions.set(len(call_sessions.calls))
+    component_stats.set(len(kb_catalog), component="catalog", stat="objects")
+    component_stats.set(ingest_pipeline.completed, component="ingest", stat="completed")
+
+registry.add_collector(collect_component_stats)
+
+# With WARMUP_ENABLED (the default) /ready reports 503 until the AWS clients
+# are built, the knowledge base is loaded and indexed and the extraction
+# processes are running, so the first routed request doesn't pay for them.
+# A warm-up that fails or exceeds WARMUP_TIMEOUT_SECONDS is logged and the
+# app reports ready anyway; it still serves, only colder.
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+WARMUP_TIMEOUT_SECONDS = float(os.getenv('WARMUP_TIMEOUT_SECONDS', 120))
+readiness: Dict[str, Any] = {"status": "starting", "warmup": {}}
+background_tasks: List[asyncio.Task] = []
+
+def build_clients():
+    # Resolving credentials may go out to the instance metadata service
+    call_sessions.credentials()
+    for client in (bedrock_runtime, bedrock_embedding_runtime if RETRIEVER == 'dense' else None, transcribe_client, dynamodb, storage.client if isinstance(storage, S3Storage) else None):
+        if isinstance(client, LazyClient):
+            client.get()
+
+async def warm_up():
+    readiness.update(status="warming")
+    steps = readiness["warmup"]
+
+    async def step(name, warm):
+        started = time.perf_counter()
+        try:
+            await warm()
+            steps[name] = round(time.perf_counter() - started, 3)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            steps[name] = f"failed: {str(e)}"
+            logger.error(f"Warm-up step {name} failed: {str(e)}")
+
+    async def warm_knowledge_base():
+        if kb_snapshots is None:
+            documents = await load_knowledge_base()
+            await asyncio.to_thread(kb_index.sync, documents)
+            return
+        # One worker builds the first snapshot; the others wait for it. Waiting
+        # workers keep retrying the publish themselves, so if the one holding the
+        # writer lock fails, the next attempt here raises instead of timing out.
+        await kb_snapshot_publisher.publish_if_changed()
+        while (snapshot := await kb_snapshots.current_async()) is None:
+            await asyncio.sleep(kb_snapshots.check_interval or 0.1)
+            await kb_snapshot_publisher.publish_if_changed()
+        await asyncio.to_thread(snapshot.prefetch)
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(asyncio.gather(
+            # Connections can only be opened once the clients exist
+            step("clients", lambda: asyncio.to_thread(build_clients)),
+            step("extraction_processes", ingest_pipeline.warm_up),
+        ), WARMUP_TIMEOUT_SECONDS)
+        await asyncio.wait_for(asyncio.gather(
+            step("storage_connections", storage.warm_up),
+            step("knowledge_base", warm_knowledge_base),
+        ), max(0.0, WARMUP_TIMEOUT_SECONDS - (time.perf_counter() - started)))
+    except asyncio.TimeoutError:
+        logger.error(f"Warm-up did not finish within {WARMUP_TIMEOUT_SECONDS}s")
+    observe("warmup", time.perf_counter() - started)
+    readiness.update(status="ready")
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s: {steps}")
+
+async def ensure_call_tables():
+    for table in (conversation_table, segments_table):
+        try:
+            if await table.ensure_exists():
+                logger.info(f"Created DynamoDB table {table.table.name}")
+        except Exception as e:
+            logger.error(f"Could not check or create call table: {str(e)}")
+
+async def start_background_services():
+    if DYNAMODB_CREATE_TABLES:
+        # In the background, so a slow table creation never delays startup
+        background_tasks.append(asyncio.create_task(ensure_call_tables()))
+    await ingest_pipeline.start(backfill=backfill_document)
+    await kb_catalog.start()
+    await transcription_jobs.start()
+    await call_analytics.start()
+    if kb_snapshot_publisher is not None:
+        await kb_snapshot_publisher.start()
+
+async def stop_background_services():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    if kb_snapshot_publisher is not None:
+        await kb_snapshot_publisher.stop()
+    await ingest_pipeline.stop()
+    await kb_catalog.stop()
+    await transcription_jobs.stop()
+    await call_analytics.stop()
+    storage.close()
+    bedrock_limiter.close()
+    conversation_table.close()
+    segments_table.close()
+    for client in (bedrock_runtime, bedrock_embedding_runtime, transcribe_client, dynamodb):
+        if isinstance(client, LazyClient):
+            client.close()
+    await call_sessions.close()
 
 @app.get("/")
 async def root():
     return {"message": "Call Insights API"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until startup and warm-up are done, and again while shutting down"""
+    if readiness["status"] != "ready":
+        return JSONResponse(readiness, status_code=503)
+    return readiness
+
 @app.post("/api/upload")
 async def upload_file(file: UploadFile = File(...)):
     try:
+        if ingest_pipeline.full():
+            raise HTTPException(status_code=503, detail="Ingest queue is full, please retry shortly")
+
         # Generate a unique filename
         file_extension = os.path.splitext(file.filename)[1]
         unique_filename = f"{KNOWLEDGE_BASE_PREFIX}{uuid.uuid4()}{file_extension}"
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=unique_filename,
-            Body=file_content,
-            ContentType=file.content_type
-        )
+        # Stream the upload to storage in parts, hashing as we go
+        upload = await stream_upload(file, unique_filename)
+        existing_key = await dedupe_upload(KNOWLEDGE_BASE_PREFIX, unique_filename, upload.sha256)
+        if existing_key:
+            job = ingest_pipeline.get_job(os.path.basename(existing_key))
+            return {
+                "message": "File already exists in the knowledge base",
+                "filename": existing_key,
+                "url": await kb_catalog.presigned_url(existing_key),
+                "deduplicated": True,
+                "ingest": job.to_dict() if job else {"file_id": os.path.basename(existing_key), "key": existing_key, "status": "ready"}
+            }
+        kb_catalog.upsert(ObjectInfo(unique_filename, upload.size, upload.etag, datetime.now(timezone.utc)))
+        document_cache.invalidate(unique_filename)
+
+        # Extraction, chunking and indexing continue in the background
+        try:
+            job = ingest_pipeline.submit(unique_filename, upload.etag)
+            ingest = job.to_dict()
+        except IngestQueueFull:
+            # Picked up later by the query-time backfill
+            ingest = {"file_id": os.path.basename(unique_filename), "key": unique_filename, "status": "deferred"}
         
         # Generate a pre-signed URL for viewing/downloading (valid for 1 hour)
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params={'Bucket': BUCKET_NAME, 'Key': unique_filename},
-            ExpiresIn=3600
-        )
+        url = await kb_catalog.presigned_url(unique_filename)
         
         return {
             "message": "File uploaded successfully",
             "filename": unique_filename,
-            "url": url
+            "url": url,
+            "deduplicated": False,
+            "ingest": ingest
         }
         
+    except HTTPException:
+        raise
     except ClientError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/ingest/{file_id}")
+async def get_ingest_status(file_id: str):
+    """Poll the background ingest status of an uploaded knowledge-base document"""
+    job = ingest_pipeline.get_job(file_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No ingest job for this file")
+    return job.to_dict()
+
 @app.post("/api/upload-audio")
 async def upload_audio(file: UploadFile = File(...)):
     try:
@@ -162,16 +667,15 @@ async def upload_audio(file: UploadFile = File(...)):
         file_extension = os.path.splitext(file.filename)[1]
         unique_filename = f"{RECORDINGS_PREFIX}{uuid.uuid4()}{file_extension}"
         
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload to S3
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=unique_filename,
-            Body=file_content,
-            ContentType=file.content_type
-        )
+        # Stream the upload to storage in parts, hashing as we go
+        upload = await stream_upload(file, unique_filename)
+        existing_key = await dedupe_upload(RECORDINGS_PREFIX, unique_filename, upload.sha256)
+        if existing_key:
+            return {
+                "message": "Audio already uploaded",
+                "filename": existing_key,
+                "deduplicated": True
+            }
         
         return {
             "message": "Audio uploaded successfully",
@@ -181,8 +685,9 @@ async def upload_audio(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/transcribe")
+@app.post("/api/transcribe", status_code=202)
 async def transcribe_audio(request: Dict[str, Any]):
+    """Start a batch transcription job and return its id immediately"""
     try:
         audio_key = request.get('audioKey')
         if not audio_key:
@@ -190,84 +695,74 @@ async def transcribe_audio(request: Dict[str, Any]):
 
         # Get the S3 URI for the audio file
         s3_uri = f"s3://{BUCKET_NAME}/{audio_key}"
-        
-        # Start the transcription job
-        job_name = f"transcription_{uuid.uuid4()}"
-        response = transcribe_client.start_transcription_job(
-            TranscriptionJobName=job_name,
-            Media={'MediaFileUri': s3_uri},
-            MediaFormat='wav',
-            LanguageCode='en-US',
-            Settings={
-                'ShowSpeakerLabels': True,
-                'MaxSpeakerLabels': 2,
-            }
-        )
-        
-        # Wait for the transcription job to complete
-        while True:
-            status = transcribe_client.get_transcription_job(TranscriptionJobName=job_name)
-            if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                break
-            await asyncio.sleep(1)  # Wait for 1 second before checking again
-            
-        if status['TranscriptionJob']['TranscriptionJobStatus'] == 'FAILED':
-            raise HTTPException(status_code=500, detail="Transcription failed")
-            
-        # Get the transcription results
-        transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-        transcript_response = requests.get(transcript_uri)
-        transcript_data = transcript_response.json()
-        
-        # Process the results to separate speakers
-        items = transcript_data['results']['items']
-        speakers = []
-        current_speaker = None
-        current_text = []
-        
-        for item in items:
-            if 'speaker_label' in item:
-                speaker = f"Speaker {item['speaker_label']}"
-                if current_speaker and speaker != current_speaker and current_text:
-                    speakers.append({
-                        'speaker': 'Agent' if current_speaker == 'Speaker 1' else 'Customer',
-                        'text': ' '.join(current_text)
-                    })
-                    current_text = []
-                current_speaker = speaker
-            
-            if 'alternatives' in item and item['alternatives']:
-                current_text.append(item['alternatives'][0]['content'])
-                
-        if current_text:
-            speakers.append({
-                'speaker': 'Agent' if current_speaker == 'Speaker 1' else 'Customer',
-                'text': ' '.join(current_text)
-            })
-        
+        settings = {
+            'MediaFormat': 'wav',
+            'LanguageCode': 'en-US',
+            'ShowSpeakerLabels': True,
+            'MaxSpeakerLabels': 2,
+        }
+        try:
+            content_hash = await content_hash_for(audio_key)
+        except ObjectNotFound:
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        job = await transcription_jobs.submit(audio_key, s3_uri, settings, content_hash=content_hash)
+        if job.status == "FAILED":
+            raise HTTPException(status_code=500, detail=job.error or "Transcription failed")
+
         return {
-            "message": "Transcription completed successfully",
-            "results": speakers
+            "message": "Transcription completed successfully" if job.cached else "Transcription started",
+            "jobId": job.job_id,
+            "status": job.status,
+            "cached": job.cached,
+            "results": job.results
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Transcription error: {str(e)}")  # Debug log
+        logger.error(f"Transcription error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/transcribe/{job_id}")
+async def get_transcription(job_id: str):
+    """Current status of a transcription job, with speaker-separated results once completed"""
+    job = await transcription_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Transcription job not found")
+    return job.to_dict()
+
+@app.get("/api/transcribe/{job_id}/events")
+async def stream_transcription(job_id: str):
+    """Server-sent events with a job snapshot on every status change, ending when the job finishes"""
+    if await transcription_jobs.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Transcription job not found")
+
+    async def events():
+        async for job in transcription_jobs.subscribe(job_id):
+            yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.delete("/api/delete/{file_id}")
 async def delete_file(file_id: str):
     try:
         # Construct the full key with the knowledge-base prefix
         full_key = f"{KNOWLEDGE_BASE_PREFIX}{file_id}"
-        print(f"Attempting to delete file with key: {full_key}")  # Debug log
+        logger.info(f"Attempting to delete file with key: {full_key}")
         
         # Try to delete the file directly
         try:
-            s3_client.delete_object(
-                Bucket=BUCKET_NAME,
-                Key=full_key
-            )
-            print(f"Successfully deleted file: {full_key}")  # Debug log
+            # Forgotten first, so an ingest still running writes no sidecar
+            ingest_pipeline.forget(file_id)
+            await storage.delete(full_key)
+            await storage.delete(sidecar_key(full_key))
+            await forget_content_hash(KNOWLEDGE_BASE_PREFIX, full_key)
+            kb_catalog.remove(full_key)
+            document_cache.invalidate(full_key)
+            kb_index.remove_document(full_key)
+            if kb_snapshot_publisher is not None:
+                kb_snapshot_publisher.mark_dirty()
+            logger.info(f"Successfully deleted file: {full_key}")
             return {"message": "File deleted successfully"}
         except ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchKey':
@@ -275,80 +770,44 @@ async def delete_file(file_id: str):
             raise HTTPException(status_code=500, detail=str(e))
             
     except Exception as e:
-        print(f"Error deleting file: {str(e)}")  # Debug log
+        logger.error(f"Error deleting file: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def catalog_page_params(cursor, limit):
+    limit = CATALOG_PAGE_LIMIT if limit is None else limit
+    if limit < 1 or limit > CATALOG_MAX_PAGE_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {CATALOG_MAX_PAGE_LIMIT}")
+    try:
+        return kb_catalog.page(cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/api/analysis")
-async def get_analysis():
+async def get_analysis(cursor: Optional[str] = None, limit: Optional[int] = None):
     try:
-        print(f"Fetching files from bucket: {BUCKET_NAME}, prefix: {KNOWLEDGE_BASE_PREFIX}")  # Debug log
-        print(f"AWS Region: {os.getenv('AWS_DEFAULT_REGION')}")  # Debug log
-        print(f"AWS Access Key ID: {os.getenv('AWS_ACCESS_KEY_ID')[:10]}..." if os.getenv('AWS_ACCESS_KEY_ID') else "No AWS_ACCESS_KEY_ID")  # Debug log
-        
-        # First, let's try to list all buckets to verify connectivity
-        try:
-            buckets_response = s3_client.list_buckets()
-            print(f"Available buckets: {[bucket['Name'] for bucket in buckets_response['Buckets']]}")
-        except Exception as bucket_error:
-            print(f"Error listing buckets: {bucket_error}")
-            raise HTTPException(status_code=500, detail=f"AWS S3 connection error: {str(bucket_error)}")
-        
-        # Check if our specific bucket exists
-        try:
-            s3_client.head_bucket(Bucket=BUCKET_NAME)
-            print(f"Bucket '{BUCKET_NAME}' exists and is accessible")
-        except ClientError as bucket_error:
-            error_code = bucket_error.response['Error']['Code']
-            if error_code == '404':
-                available_buckets = [bucket['Name'] for bucket in s3_client.list_buckets()['Buckets']]
-                raise HTTPException(status_code=500, detail=f"Bucket '{BUCKET_NAME}' does not exist. Available buckets: {available_buckets}")
-            elif error_code == '403':
-                raise HTTPException(status_code=500, detail=f"Access denied to bucket '{BUCKET_NAME}'. Check your AWS permissions.")
-            else:
-                raise HTTPException(status_code=500, detail=f"Error accessing bucket '{BUCKET_NAME}': {str(bucket_error)}")
-        
-        # Get all objects in the knowledge_base folder
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=KNOWLEDGE_BASE_PREFIX
-        )
-        
-        print("S3 Response:", response)  # Debug log
+        # Served from the in-memory catalog; only the first call lists the bucket
+        await kb_catalog.ensure_loaded()
+        objects, next_cursor = catalog_page_params(cursor, limit)
         
         analysis_data = {
-            "totalFiles": 0,
-            "totalSize": 0,
-            "files": []
+            "totalFiles": len(kb_catalog),
+            "totalSize": kb_catalog.total_size,
+            "files": [],
+            "nextCursor": next_cursor
         }
         
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                # Skip the folder itself
-                if obj['Key'] == KNOWLEDGE_BASE_PREFIX:
-                    continue
-                    
-                analysis_data["totalFiles"] += 1
-                analysis_data["totalSize"] += obj['Size']
-                
-                # Get the original filename without the prefix
-                filename = os.path.basename(obj['Key'])
-                
-                # Generate a pre-signed URL
-                url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': BUCKET_NAME, 'Key': obj['Key']},
-                    ExpiresIn=3600
-                )
-                
-                analysis_data["files"].append({
-                    "id": filename,
-                    "name": filename,
-                    "size": obj['Size'],
-                    "url": url,
-                    "lastModified": obj['LastModified'].isoformat()
-                })
+        for obj in objects:
+            # Get the original filename without the prefix
+            filename = os.path.basename(obj.key)
+            
+            analysis_data["files"].append({
+                "id": filename,
+                "name": filename,
+                "size": obj.size,
+                "url": await kb_catalog.presigned_url(obj.key),
+                "lastModified": obj.last_modified.isoformat()
+            })
         
-        print("Analysis Data:", analysis_data)  # Debug log
         return analysis_data
         
     except HTTPException:
@@ -357,10 +816,10 @@ async def get_analysis():
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_message = e.response['Error']['Message']
-        print(f"AWS ClientError: {error_code} - {error_message}")
+        logger.error(f"AWS ClientError: {error_code} - {error_message}")
         raise HTTPException(status_code=500, detail=f"AWS S3 Error ({error_code}): {error_message}")
     except Exception as e:
-        print(f"Unexpected error fetching analysis: {str(e)}")  # Debug log
+        logger.error(f"Unexpected error fetching analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
 # WebSocket endpoint for real-time transcription
@@ -368,126 +827,245 @@ async def get_analysis():
 async def websocket_transcribe(websocket: WebSocket):
     await websocket.accept()
     logger.info("WebSocket connection accepted")
-    
+
+    async def send_message(message):
+        async with span("websocket_send", message.get("type", "error")):
+            await websocket.send_json(message)
+
+    async def notify_queued(position):
+        await send_message({"type": "queued", "data": {"position": position}})
+
     # Create unique conversation ID
     conversation_id = str(uuid.uuid4())
-    conversation_data = {
-        "id": conversation_id,
-        "timestamp": datetime.now().isoformat(),
-        "transcript": []
-    }
+    client = f"{websocket.client.host}:{websocket.client.port}" if websocket.client else ""
+    try:
+        call = await call_sessions.admit(conversation_id, client, on_queued=notify_queued)
+    except CallCapacityExceeded as e:
+        logger.warning(f"Refused call from {client}: {str(e)}")
+        await websocket.close(code=CLOSE_TRY_AGAIN_LATER, reason="Call capacity reached, try again later")
+        return
+    started_at = datetime.now(timezone.utc).isoformat()
+    transcript_writer = TranscriptWriter(
+        segments_table,
+        conversation_id,
+        flush_seconds=TRANSCRIPT_FLUSH_SECONDS,
+        max_buffered=TRANSCRIPT_MAX_BUFFERED,
+    )
+    transcript_writer.start()
+    header_saves = []
+
+    async def save_conversation(status, ended_at=None):
+        item = {
+            "ConversationId": conversation_id,
+            "Timestamp": started_at,
+            "Status": status,
+            "SegmentsTable": TRANSCRIPT_SEGMENTS_TABLE,
+            "SegmentCount": transcript_writer.sequence,
+            # DynamoDB takes numbers as Decimal, not float
+            "AudioSeconds": Decimal(str(round(call.audio_seconds, 3))),
+            "TalkSeconds": Decimal(str(round(call.talk_seconds, 3))),
+        }
+        if ended_at:
+            item["EndedAt"] = ended_at
+        await conversation_table.put(item)
 
     try:
-        # Create a presigned URL for the transcribe streaming API
-        aws_session = session  # Use the global boto3 session
-        transcribe_client = aws_session.client('transcribe')
-        
-        # Get credentials for SigV4 signing
-        credentials = aws_session.get_credentials()
-        creds = credentials.get_frozen_credentials()
-        
-        # Create a request for the websocket URL
-        request = AWSRequest(
-            method='GET',
-            url=f'wss://transcribestreaming.{AWS_REGION}.amazonaws.com:8443/stream-transcription-websocket',
-            params={
-                'language-code': 'en-US',
-                'media-encoding': 'pcm',
-                'sample-rate': '44100'
-            }
-        )
-        
-        # Sign the request with SigV4
-        auth = SigV4Auth(creds, 'transcribe', AWS_REGION)
-        auth.add_auth(request)
-        
-        # Get the presigned URL
-        presigned_url = request.url
-        
+        # Presigned with the manager's cached credentials; the connection
+        # comes from the shared upstream session
+        presigned_url = call_sessions.transcribe_url(TRANSCRIBE_SAMPLE_RATE)
         logger.info(f"Created presigned URL for Transcribe streaming")
-        
+
         # Create a connection to AWS Transcribe streaming service
-        async with aiohttp.ClientSession() as http_session:  # Renamed to http_session
-            async with http_session.ws_connect(presigned_url) as aws_ws:
-                logger.info("Connected to AWS Transcribe streaming service")
-                
-                # Start two tasks: one for receiving audio from client and sending to AWS,
-                # and another for receiving transcription from AWS and sending to client
-                
-                # Task 1: Receive audio from client and send to AWS
-                async def forward_audio():
-                    try:
-                        while True:
-                            # Process audio data
-                            audio_data = await websocket.receive_bytes()
-                            
-                            # Create the event message for AWS Transcribe
-                            message = {
-                                "audio_event": {
-                                    "audio_chunk": base64.b64encode(audio_data).decode('utf-8')
-                                }
-                            }
+        async with call_sessions.http.ws_connect(presigned_url) as aws_ws:
+            logger.info("Connected to AWS Transcribe streaming service")
+
+            conversation_memory = ConversationMemory(
+                summarize_conversation,
+                window_turns=CONVERSATION_WINDOW_TURNS,
+                fold_turns=CONVERSATION_FOLD_TURNS,
+            )
+
+            transcript_sender = TranscriptSender(
+                send_message,
+                min_interval=PARTIAL_MIN_INTERVAL_SECONDS,
+                delta=websocket.query_params.get('partials') == 'delta',
+            )
+
+            speculation = SpeculativeRetriever(
+                retrieve_candidates,
+                debounce_seconds=SPECULATION_DEBOUNCE_SECONDS,
+                stats=speculation_stats,
+            )
+
+            async def generate_assistance(text):
+                conversation = conversation_memory.render(text)
+                if not ASSISTANCE_STREAMING:
+                    return {"suggestion": await get_bedrock_assistance(text, PRIORITY_LIVE, conversation, speculation.resolve)}
+                # Stream tokens as assistance_delta messages; the full
+                # suggestion still follows as a regular assistance message
+                suggestion_id = str(uuid.uuid4())
+                parts = []
+                async for delta in stream_bedrock_assistance(text, PRIORITY_LIVE, conversation, speculation.resolve):
+                    parts.append(delta)
+                    await send_message({
+                        "type": "assistance_delta",
+                        "data": {
+                            "id": suggestion_id,
+                            "delta": delta
+                        }
+                    })
+                return {"suggestion": "".join(parts), "id": suggestion_id}
+
+            async def send_assistance(assistance):
+                await send_message({
+                    "type": "assistance",
+                    "data": assistance
+                })
+                logger.info(f"Sent assistance: {assistance['suggestion']}")
+
+            # Assistance is generated in the background so a slow model
+            # never holds up the transcript stream
+            assistance_worker = AssistanceWorker(
+                generate_assistance,
+                send_assistance,
+                max_queue=ASSISTANCE_QUEUE_SIZE,
+                coalesce_seconds=ASSISTANCE_COALESCE_SECONDS,
+            )
+            assistance_worker.start()
+            call.watch("assistancePending", lambda: assistance_worker.pending)
+            call.watch("transcriptPending", lambda: transcript_writer.pending)
+            
+            # Start two tasks: one for receiving audio from client and sending to AWS,
+            # and another for receiving transcription from AWS and sending to client
+            
+            # Audio offset (seconds into the stream) after each chunk
+            # sent, with when it was sent; a result's EndTime maps back
+            # to the chunk that completed it for the round-trip latency
+            sent_offsets: List[float] = []
+            sent_times: List[float] = []
+
+            def audio_sent(chunk):
+                offset = (sent_offsets[-1] if sent_offsets else 0.0) + len(chunk) / (TRANSCRIBE_SAMPLE_RATE * 2)
+                sent_offsets.append(offset)
+                sent_times.append(time.perf_counter())
+                call.audio_seconds = offset
+
+            def observe_round_trip(result, is_final):
+                end_time = result.get('EndTime')
+                if end_time is None or not sent_offsets:
+                    return
+                index = min(bisect.bisect_left(sent_offsets, end_time), len(sent_offsets) - 1)
+                observe("transcribe_stream", time.perf_counter() - sent_times[index], "final" if is_final else "partial")
+
+            # Task 1: Receive audio from client and send to AWS
+            async def forward_audio():
+                coalescer = AudioFrameCoalescer(AUDIO_CHUNK_BYTES)
+                try:
+                    while True:
+                        # Process audio data
+                        audio_data = await websocket.receive_bytes()
+                        
+                        # Completed chunks wait in the call's bounded audio buffer
+                        for chunk in coalescer.feed(audio_data):
+                            call.audio.put(chunk)
+                except Exception as e:
+                    logger.error(f"Error in forward_audio: {str(e)}")
+                    logger.error(traceback.format_exc())
+                finally:
+                    remainder = coalescer.flush()
+                    if remainder:
+                        call.audio.put(remainder)
+                    call.audio.close()
+
+            # Drains the audio buffer upstream, each chunk as a binary AudioEvent
+            async def send_audio():
+                try:
+                    while (chunk := await call.audio.get()) is not None:
+                        if aws_ws.closed:
+                            return
+                        await aws_ws.send_bytes(encode_audio_event(chunk))
+                        audio_sent(chunk)
+                    # An empty AudioEvent ends the stream: Transcribe sends
+                    # its last results and closes, freeing the call slot
+                    if not aws_ws.closed:
+                        await aws_ws.send_bytes(encode_audio_event(b""))
+                except Exception as e:
+                    logger.error(f"Error in send_audio: {str(e)}")
+            
+            # Task 2: Receive transcription from AWS and send to client
+            async def receive_transcription():
+                try:
+                    async for msg in aws_ws:
+                        if msg.type == aiohttp.WSMsgType.BINARY:
+                            headers, payload = decode_message(msg.data)
+                            if headers.get(':message-type') != 'event':
+                                logger.error(f"Transcribe stream error: {headers.get(':exception-type')}: {payload.decode('utf-8', 'replace')}")
+                                continue
+                            data = {headers.get(':event-type', 'TranscriptEvent'): json.loads(payload)}
+                        elif msg.type == aiohttp.WSMsgType.TEXT:
+                            data = json.loads(msg.data)
+                        else:
+                            continue
+                        logger.debug("Received data from AWS: %s", data)
+
+                        if 'Transcript' in data.get('TranscriptEvent', {}):
+                            results = data['TranscriptEvent']['Transcript'].get('Results', [])
                             
-                            await aws_ws.send_json(message)
-                    except Exception as e:
-                        logger.error(f"Error in forward_audio: {str(e)}")
-                        logger.error(traceback.format_exc())
-                
-                # Task 2: Receive transcription from AWS and send to client
-                async def receive_transcription():
-                    try:
-                        async for msg in aws_ws:
-                            if msg.type == aiohttp.WSMsgType.TEXT:
-                                data = json.loads(msg.data)
-                                logger.debug(f"Received data from AWS: {data}")
-                                
-                                if 'Transcript' in data.get('TranscriptEvent', {}):
-                                    results = data['TranscriptEvent']['Transcript'].get('Results', [])
-                                    
-                                    for result in results:
-                                        alternatives = result.get('Alternatives', [])
-                                        if alternatives:
-                                            transcript = alternatives[0].get('Transcript', '')
-                                            is_final = not result.get('IsPartial', True)
-
-                                            if transcript.strip():
-                                                # Send transcript to client (both partial and final)
-                                                await websocket.send_json({
-                                                    "type": "transcript",
-                                                    "data": {
-                                                        "text": transcript,
-                                                        "is_final": is_final
-                                                    }
-                                                })
-                                                logger.info(f"Sent transcript (is_final={is_final}): {transcript}")
-
-                                                if is_final:
-                                                    # Save to conversation data
-                                                    conversation_data["transcript"].append({
-                                                        "text": transcript,
-                                                        "timestamp": datetime.now().isoformat()
-                                                    })
-                                                    
-                                                    # Get AI assistance
-                                                    assistance_text = await get_bedrock_assistance(transcript)
-                                                    
-                                                    # Send assistance to client
-                                                    await websocket.send_json({
-                                                        "type": "assistance",
-                                                        "data": {
-                                                            "suggestion": assistance_text
-                                                        }
-                                                    })
-                                                    logger.info(f"Sent assistance: {assistance_text}")
-                    except Exception as e:
-                        logger.error(f"Error in receive_transcription: {str(e)}")
-                        logger.error(traceback.format_exc())
-                
-                # Run both tasks concurrently
-                await asyncio.gather(
-                    forward_audio(),
-                    receive_transcription()
-                )
+                            for result in results:
+                                alternatives = result.get('Alternatives', [])
+                                if alternatives:
+                                    transcript = alternatives[0].get('Transcript', '')
+                                    is_final = not result.get('IsPartial', True)
+                                    observe_round_trip(result, is_final)
+
+                                    if transcript.strip():
+                                        call.stats["finals" if is_final else "partials"] += 1
+                                        # Send transcript to client: finals right away,
+                                        # partials rate-limited
+                                        if is_final:
+                                            await transcript_sender.final(transcript)
+                                        else:
+                                            await transcript_sender.partial(transcript)
+
+                                        if is_final:
+                                            call.talk_seconds += max(0.0, result.get('EndTime', 0.0) - result.get('StartTime', 0.0))
+                                            # Persisted in the background by the write-behind buffer
+                                            if transcript_writer.sequence == 0:
+                                                # The header marks the call as in progress, so a
+                                                # crashed worker still leaves a findable call
+                                                header_saves.append(asyncio.create_task(save_conversation("active")))
+                                            transcript_writer.append(transcript)
+                                            
+                                            # Hand off to the assistance worker
+                                            speculation.on_final(transcript)
+                                            conversation_memory.add(transcript)
+                                            assistance_worker.submit(transcript)
+                                        else:
+                                            # Start retrieval early on the stable part of the utterance
+                                            speculation.on_partial(transcript)
+                except Exception as e:
+                    logger.error(f"Error in receive_transcription: {str(e)}")
+                    logger.error(traceback.format_exc())
+            
+            # Run the audio and transcription tasks concurrently
+            receiving = asyncio.create_task(receive_transcription())
+            try:
+                await asyncio.gather(forward_audio(), send_audio())
+                # Once the client is gone, give Transcribe a bounded time
+                # to flush its final results before dropping the stream
+                try:
+                    await asyncio.wait_for(asyncio.shield(receiving), CALL_DRAIN_SECONDS)
+                except asyncio.TimeoutError:
+                    await aws_ws.close()
+                    await receiving
+            finally:
+                receiving.cancel()
+                await asyncio.gather(receiving, return_exceptions=True)
+                await assistance_worker.stop()
+                await conversation_memory.close()
+                await speculation.close()
+                await transcript_sender.close()
+                logger.info(f"Transcript delivery for {conversation_id}: {transcript_sender.stats}")
 
     except Exception as e:
         error_msg = f"Transcription error: {str(e)}"
@@ -498,105 +1076,263 @@ async def websocket_transcribe(websocket: WebSocket):
         except:
             pass
     finally:
-        # Save conversation to DynamoDB
+        call_sessions.release(call)
+        # Flush the remaining transcript segments and close out the call
         try:
-            if conversation_data["transcript"]:
-                conversation_table.put_item(Item={
-                    "ConversationId": conversation_id,
-                    "Timestamp": conversation_data["timestamp"],
-                    "Transcript": conversation_data["transcript"]
-                })
-                logger.info(f"Saved conversation {conversation_id} to DynamoDB")
+            flushed = await transcript_writer.close()
+            await asyncio.gather(*header_saves, return_exceptions=True)
+            if transcript_writer.sequence:
+                await save_conversation("completed" if flushed else "incomplete", datetime.now(timezone.utc).isoformat())
+                logger.info(f"Saved conversation {conversation_id} ({transcript_writer.sequence} segments) to DynamoDB")
         except Exception as e:
             logger.error(f"Error saving to DynamoDB: {str(e)}")
 
         # Cleanup
         await websocket.close()
 
-async def get_bedrock_assistance(user_message: str) -> str:
+ASSISTANCE_PROMPT = """You are a helpful AI assistant. Use the following context to answer the question.
+        If you cannot find the answer in the context, say so.
+{conversation}
+        Context:
+        {context}
+
+        Question: {question}
+
+        Answer:"""
+CONVERSATION_SECTION = """
+        Conversation on the call so far:
+        {conversation}
+"""
+ASSISTANCE_MAX_TOKENS = int(os.getenv('ASSISTANCE_MAX_TOKENS', 512))
+
+def format_assistance_prompt(user_message: str, context: str, conversation: str = "") -> str:
+    return ASSISTANCE_PROMPT.format(
+        conversation=CONVERSATION_SECTION.format(conversation=conversation) if conversation else "",
+        context=context,
+        question=user_message,
+    )
+
+SUMMARY_PROMPT = """Update the running summary of a customer call with the new turns.
+Keep names, numbers, problems raised and anything already agreed. Reply with the summary only.
+
+Current summary: {summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+async def summarize_conversation(summary: str, turns: List[str]) -> str:
+    """Folds turns into the call summary; runs behind live and chat traffic"""
+    request_body = json.dumps({
+        "inputText": SUMMARY_PROMPT.format(summary=summary or "(none)", turns="\n".join(f"- {turn}" for turn in turns)),
+        "textGenerationConfig": {
+            "maxTokenCount": 256,
+            "temperature": 0.2,
+            "topP": 0.9,
+            "stopSequences": []
+        }
+    })
+
+    def invoke_bedrock():
+        with span("bedrock", "invoke_model"):
+            return bedrock_runtime.invoke_model(
+                modelId=BEDROCK_MODEL_ID,
+                body=request_body,
+                accept='application/json',
+                contentType='application/json'
+            )
+
+    response = await bedrock_limiter.call(invoke_bedrock, PRIORITY_BACKGROUND)
+    results = json.loads(response.get('body').read()).get('results', [])
+    if not results:
+        raise RuntimeError("Bedrock returned no summary")
+    return results[0].get('outputText', '').strip()
+
+# Bounds the prompt: retrieved passages are packed best-first into the
+# smaller of CONTEXT_TOKEN_BUDGET and what the model's context window leaves
+# after the question and the answer's maxTokenCount
+context_packer = ContextPacker(
+    context_window=int(os.getenv('BEDROCK_CONTEXT_WINDOW', 8000)),
+    max_output_tokens=ASSISTANCE_MAX_TOKENS,
+    budget_tokens=int(os.getenv('CONTEXT_TOKEN_BUDGET', 3000)),
+)
+
+NO_DOCUMENTS_MESSAGE = "I apologize, but I couldn't find any readable documents in the knowledge base to help answer your question."
+
+async def load_knowledge_base() -> List[Tuple[str, str, str]]:
     """
-    Queries the S3 knowledge base, invokes Bedrock, and returns assistance.
+    [(key, etag, text)] for every readable knowledge-base document, served
+    from the document cache unless the listing has expired or changed
     """
-    try:
-        # Get relevant documents from S3 knowledge base
-        def get_s3_docs():
-            response = s3_client.list_objects_v2(
-                Bucket=BUCKET_NAME,
-                Prefix=KNOWLEDGE_BASE_PREFIX
-            )
-            
-            context_docs = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    if obj['Key'] == KNOWLEDGE_BASE_PREFIX:
-                        continue
-                    
-                    doc_response = s3_client.get_object(
-                        Bucket=BUCKET_NAME,
-                        Key=obj['Key']
-                    )
-                    doc_content = doc_response['Body'].read()
-                    
-                    if obj['Key'].lower().endswith('.pdf'):
-                        doc_text = extract_text_from_pdf(doc_content)
-                    else:
-                        try:
-                            doc_text = doc_content.decode('utf-8')
-                        except UnicodeDecodeError:
-                            logger.warning(f"Could not decode file as text: {obj['Key']}")
-                            continue
-                    
-                    if doc_text.strip():
-                        context_docs.append(doc_text)
-            return context_docs
+    async with span("retrieval", "documents"):
+        return await document_cache.get_documents(list_documents, load_document_text)
 
-        context_docs = await asyncio.to_thread(get_s3_docs)
-        
-        context = "\n\n".join(context_docs)
-        
-        if not context.strip():
-            return "I apologize, but I couldn't find any readable documents in the knowledge base to help answer your question."
+async def retrieve_candidates(query: str) -> Optional[List[str]]:
+    """
+    Returns the best-ranked knowledge-base chunks for query, or None when the
+    knowledge base has no readable documents.
+    """
+    snapshot = await kb_snapshots.current_async() if kb_snapshots is not None else None
+    if snapshot is not None:
+        def search_snapshot():
+            if not snapshot.documents:
+                return None
+            return [chunk.text for _, chunk in snapshot.search(query, RETRIEVAL_TOP_K, embed_query)]
 
-        prompt = f"""You are a helpful AI assistant. Use the following context to answer the question.
-        If you cannot find the answer in the context, say so.
+        async with span("retrieval", "snapshot_search"):
+            return await asyncio.to_thread(search_snapshot)
 
-        Context:
-        {context}
+    documents = await load_knowledge_base()
 
-        Question: {user_message}
+    def retrieve_chunks():
+        # Only documents added or removed since the last call are re-indexed
+        kb_index.sync(documents)
+        if not documents:
+            return None
+        return [chunk.text for _, chunk in kb_index.search(query, RETRIEVAL_TOP_K)]
 
-        Answer:"""
+    async with span("retrieval", "search"):
+        return await asyncio.to_thread(retrieve_chunks)
 
-        request_payload = {
+async def retrieve_context(
+    user_message: str,
+    conversation: str = "",
+    retrieve: Optional[Callable[[str], Awaitable[Optional[List[str]]]]] = None,
+) -> Optional[List[str]]:
+    """
+    Returns the best knowledge-base chunks for user_message packed into the
+    prompt budget, or None when the knowledge base has no readable documents.
+    retrieve replaces retrieve_candidates, e.g. to reuse a speculative lookup.
+    """
+    candidates = await (retrieve or retrieve_candidates)(user_message)
+    if candidates is None:
+        return None
+    with span("prompt_build", "pack"):
+        overhead = format_assistance_prompt(user_message, "", conversation)
+        return context_packer.pack(candidates, overhead).passages
+
+def build_assistance_request(user_message: str, context_chunks: List[str], conversation: str = "") -> str:
+    """Bedrock request body for a question, its retrieved context and the call so far"""
+    with span("prompt_build", "build"):
+        prompt = format_assistance_prompt(user_message, "\n\n".join(context_chunks), conversation)
+
+        return json.dumps({
             "inputText": prompt,
             "textGenerationConfig": {
-                "maxTokenCount": 512,
+                "maxTokenCount": ASSISTANCE_MAX_TOKENS,
                 "temperature": 0.7,
                 "topP": 0.9,
                 "stopSequences": []
             }
-        }
+        })
+
+async def generate_answer(user_message: str, priority: int = PRIORITY_CHAT, conversation: str = "", retrieve=None) -> str:
+    """Retrieves context and invokes Bedrock; errors are raised to the caller"""
+    context_chunks = await retrieve_context(user_message, conversation, retrieve)
+    
+    if context_chunks is None:
+        return NO_DOCUMENTS_MESSAGE
+
+    request_body = build_assistance_request(user_message, context_chunks, conversation)
 
-        def invoke_bedrock():
+    def invoke_bedrock():
+        with span("bedrock", "invoke_model"):
             return bedrock_runtime.invoke_model(
                 modelId=BEDROCK_MODEL_ID,
-                body=json.dumps(request_payload),
+                body=request_body,
                 accept='application/json',
                 contentType='application/json'
             )
 
-        response = await asyncio.to_thread(invoke_bedrock)
-        
-        response_body = json.loads(response.get('body').read())
-        
-        if 'results' in response_body and len(response_body['results']) > 0:
-            answer = response_body['results'][0].get('outputText', '')
-        else:
-            answer = "I apologize, but I couldn't generate a proper response at the moment."
-        
-        return answer
+    response = await bedrock_limiter.call(invoke_bedrock, priority)
+    
+    response_body = json.loads(response.get('body').read())
+    
+    if 'results' in response_body and len(response_body['results']) > 0:
+        answer = response_body['results'][0].get('outputText', '')
+    else:
+        answer = "I apologize, but I couldn't generate a proper response at the moment."
+    
+    return answer
+
+async def stream_answer(user_message: str, priority: int = PRIORITY_CHAT, conversation: str = "", retrieve=None) -> AsyncIterator[str]:
+    """Yields answer text deltas via invoke_model_with_response_stream; errors are raised to the caller"""
+    context_chunks = await retrieve_context(user_message, conversation, retrieve)
+
+    if context_chunks is None:
+        yield NO_DOCUMENTS_MESSAGE
+        return
+
+    request_body = build_assistance_request(user_message, context_chunks, conversation)
+    loop = asyncio.get_running_loop()
+    deltas: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    # The event stream is a blocking iterator, so it is drained on a
+    # limiter thread that hands each delta back to the event loop. The whole
+    # stream holds one in-flight slot; throttling surfaces when the stream is
+    # opened, before any delta, so the limiter can retry it safely.
+    def pump():
+        with span("bedrock", "invoke_model_with_response_stream") as stream_span:
+            response = bedrock_runtime.invoke_model_with_response_stream(
+                modelId=BEDROCK_MODEL_ID,
+                body=request_body,
+                accept='application/json',
+                contentType='application/json'
+            )
+            first_token = True
+            for event in response['body']:
+                if stop.is_set():
+                    break
+                if 'chunk' in event:
+                    text = json.loads(event['chunk']['bytes']).get('outputText', '')
+                    if text:
+                        if first_token:
+                            observe("bedrock", time.perf_counter() - stream_span.started, "first_token")
+                            first_token = False
+                        loop.call_soon_threadsafe(deltas.put_nowait, text)
+                else:
+                    error_type, error = next(iter(event.items()))
+                    raise RuntimeError(f"{error_type}: {error.get('message', '')}")
+
+    def pumped(task):
+        if task.cancelled():
+            return
+        deltas.put_nowait(task.exception())
+
+    pump_task = asyncio.ensure_future(bedrock_limiter.call(pump, priority))
+    pump_task.add_done_callback(pumped)
+    try:
+        while True:
+            delta = await deltas.get()
+            if delta is None:
+                break
+            if isinstance(delta, Exception):
+                raise delta
+            yield delta
+    finally:
+        stop.set()
+        pump_task.cancel()
+
+async def get_bedrock_assistance(user_message: str, priority: int = PRIORITY_CHAT, conversation: str = "", retrieve=None) -> str:
+    """
+    Queries the S3 knowledge base, invokes Bedrock, and returns assistance.
+    Answers are cached, and identical concurrent questions share one Bedrock call.
+    Live answers depend on the call so far and would never be asked again, so
+    they bypass the cache instead of pushing reusable answers out of it.
+    """
+    try:
+        if conversation:
+            return await generate_answer(user_message, priority, conversation, retrieve)
+        return await answer_cache.get_or_compute(
+            user_message, knowledge_base_version(), lambda: generate_answer(user_message, priority, conversation, retrieve)
+        )
 
     except ClientError as e:
+        if is_throttling(e):
+            logger.warning("Bedrock still throttling after retries in get_bedrock_assistance")
+            return BEDROCK_BUSY_MESSAGE
         error_code = e.response['Error'].get('Code', 'Unknown')
         error_message = e.response['Error'].get('Message', str(e))
         logger.error(f"AWS Error in get_bedrock_assistance ({error_code}): {error_message}")
@@ -606,6 +1342,33 @@ async def get_bedrock_assistance(user_message: str) -> str:
         logger.error(traceback.format_exc())
         return "An unexpected error occurred while getting assistance."
 
+async def stream_bedrock_assistance(user_message: str, priority: int = PRIORITY_CHAT, conversation: str = "", retrieve=None) -> AsyncIterator[str]:
+    """
+    Streaming variant of get_bedrock_assistance: yields text deltas as Bedrock
+    produces them. A cached answer is yielded whole, identical concurrent
+    questions share one Bedrock stream, and a completed stream populates the
+    answer cache. Live answers (with a conversation) bypass the cache.
+    """
+    try:
+        produce = lambda: stream_answer(user_message, priority, conversation, retrieve)
+        deltas = produce() if conversation else answer_cache.stream(user_message, knowledge_base_version(), produce)
+        async for delta in deltas:
+            yield delta
+
+    except ClientError as e:
+        if is_throttling(e):
+            logger.warning("Bedrock still throttling after retries in stream_bedrock_assistance")
+            yield BEDROCK_BUSY_MESSAGE
+            return
+        error_code = e.response['Error'].get('Code', 'Unknown')
+        error_message = e.response['Error'].get('Message', str(e))
+        logger.error(f"AWS Error in stream_bedrock_assistance ({error_code}): {error_message}")
+        yield f"An AWS error occurred: {error_message}"
+    except Exception as e:
+        logger.error(f"Unexpected error in stream_bedrock_assistance: {str(e)}")
+        logger.error(traceback.format_exc())
+        yield "An unexpected error occurred while getting assistance."
+
 @app.post("/api/chat")
 async def chat_with_knowledge_base(payload: dict = Body(...)):
     """
@@ -631,12 +1394,35 @@ async def chat_with_knowledge_base(payload: dict = Body(...)):
             detail="An unexpected error occurred. Please check the server logs for more details."
         )
 
+@app.post("/api/chat/stream")
+async def chat_with_knowledge_base_stream(payload: dict = Body(...)):
+    """
+    Streaming chat endpoint using server-sent events.
+    Expects: { "message": "..." }
+    Emits: "delta" events with { "delta": "..." }, then a "done" event with { "response": "..." }
+    """
+    user_message = payload.get("message")
+    if not user_message:
+        raise HTTPException(status_code=400, detail="Missing 'message' in request body")
+
+    async def events():
+        parts = []
+        async for delta in stream_bedrock_assistance(user_message):
+            parts.append(delta)
+            yield f"event: delta\ndata: {json.dumps({'delta': delta})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'response': ''.join(parts)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.get("/api/debug/aws")
 async def debug_aws():
     """Debug endpoint to test AWS S3 connectivity"""
     try:
+        if not isinstance(storage, S3Storage):
+            return {"storage_backend": storage.name, "storage_root": storage.root}
+
         # Test basic AWS connectivity
-        response = s3_client.list_buckets()
+        response = await storage.call('list_buckets')
         
         debug_info = {
             "aws_region": os.getenv('AWS_DEFAULT_REGION'),
@@ -649,12 +1435,12 @@ async def debug_aws():
         # If bucket exists, try to access it
         if debug_info["bucket_exists"]:
             try:
-                s3_client.head_bucket(Bucket=BUCKET_NAME)
+                await storage.check()
                 debug_info["bucket_accessible"] = True
                 
                 # Try to list objects
-                objects_response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, MaxKeys=5)
-                debug_info["sample_objects"] = [obj['Key'] for obj in objects_response.get('Contents', [])]
+                sample_objects, _ = await storage.list_page('', max_keys=5)
+                debug_info["sample_objects"] = [obj.key for obj in sample_objects]
                 
             except ClientError as e:
                 debug_info["bucket_accessible"] = False
@@ -665,6 +1451,37 @@ async def debug_aws():
     except Exception as e:
         return {"error": str(e), "aws_credentials_set": bool(os.getenv('AWS_ACCESS_KEY_ID'))}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/calls/stats")
+async def live_call_stats(details: bool = False):
+    """Live-call capacity for load balancers; details=true adds per-call stats"""
+    stats = call_sessions.info()
+    if details:
+        stats["calls"] = call_sessions.calls_info()
+    return stats
+
+@app.get("/api/analytics/calls")
+async def call_analytics_report():
+    """Call volume, duration and talk time from the last analytics run"""
+    report = await call_analytics.latest()
+    return {**call_analytics.status(), "report": report}
+
+@app.post("/api/analytics/calls/run")
+async def run_call_analytics(full: bool = False, wait: bool = False):
+    """Start an analytics run (full=true ignores the checkpoint); wait=true returns its report"""
+    run = call_analytics.trigger(full)
+    if not wait:
+        return JSONResponse(call_analytics.status(), status_code=202)
+    try:
+        report = await asyncio.shield(run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Call analytics failed: {str(e)}")
+    return {**call_analytics.status(), "report": report}
+
 @app.get("/api/debug/config")
 async def debug_config():
     """Debug endpoint to check AWS configuration"""
@@ -674,44 +1491,38 @@ async def debug_config():
         "aws_secret_key_present": bool(AWS_SECRET_KEY),
         "bedrock_model_id": BEDROCK_MODEL_ID,
         "knowledge_base_id": BEDROCK_KNOWLEDGE_BASE_ID,
-        "s3_bucket": BUCKET_NAME
+        "s3_bucket": BUCKET_NAME,
+        "storage_backend": storage.name,
+        "answer_cache": answer_cache.info(),
+        "bedrock_limiter": bedrock_limiter.info(),
+        "speculation": speculation_stats
     }
 
 @app.get("/api/knowledge-base")
-async def list_knowledge_base():
-    """List all documents in the knowledge base"""
+async def list_knowledge_base(cursor: Optional[str] = None, limit: Optional[int] = None):
+    """List documents in the knowledge base, one cursor page at a time"""
     try:
-        response = s3_client.list_objects_v2(
-            Bucket=BUCKET_NAME,
-            Prefix=KNOWLEDGE_BASE_PREFIX
-        )
+        await kb_catalog.ensure_loaded()
+        objects, next_cursor = catalog_page_params(cursor, limit)
         
         documents = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                if obj['Key'] == KNOWLEDGE_BASE_PREFIX:  # Skip the folder itself
-                    continue
-                
-                # Generate a pre-signed URL for viewing/downloading
-                url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': BUCKET_NAME, 'Key': obj['Key']},
-                    ExpiresIn=3600  # URL valid for 1 hour
-                )
-                
-                documents.append({
-                    'id': os.path.basename(obj['Key']),
-                    'name': os.path.basename(obj['Key']),
-                    'size': obj['Size'],
-                    'lastModified': obj['LastModified'].isoformat(),
-                    'url': url
-                })
+        for obj in objects:
+            documents.append({
+                'id': os.path.basename(obj.key),
+                'name': os.path.basename(obj.key),
+                'size': obj.size,
+                'lastModified': obj.last_modified.isoformat(),
+                'url': await kb_catalog.presigned_url(obj.key)
+            })
         
         return {
-            "total": len(documents),
-            "documents": documents
+            "total": len(kb_catalog),
+            "documents": documents,
+            "nextCursor": next_cursor
         }
         
+    except HTTPException:
+        raise
     except ClientError as e:
         error_code = e.response['Error'].get('Code', 'Unknown')
         error_message = e.response['Error'].get('Message', str(e))
@@ -734,6 +1545,16 @@ async def list_knowledge_base():
             detail="An unexpected error occurred while listing knowledge base documents."
         )
 
+@app.get("/api/storage/{key:path}")
+async def get_local_object(key: str):
+    """Serve objects for the local storage backend, standing in for presigned S3 URLs"""
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        return Response(content=await storage.get(key), media_type="application/octet-stream")
+    except (ObjectNotFound, ValueError):
+        raise HTTPException(status_code=404, detail="File not found")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv('PORT', 8000))
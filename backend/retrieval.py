@@ -0,0 +1,213 @@
+import re
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by for from has have how i if in into is it its
+me my of on or our so that the their them then there these they this to
+was we were what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens with stopwords removed"""
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def chunk_spans(word_count: int, chunk_words: int = 200, overlap_words: int = 40) -> List[Tuple[int, int]]:
+    """[start, stop) word ranges of the overlapping windows chunk_text produces"""
+    step = max(1, chunk_words - overlap_words)
+    spans = []
+    for start in range(0, word_count, step):
+        spans.append((start, min(start + chunk_words, word_count)))
+        if start + chunk_words >= word_count:
+            break
+    return spans
+
+
+def chunk_text(text: str, chunk_words: int = 200, overlap_words: int = 40) -> List[str]:
+    """Split text into overlapping windows of roughly chunk_words words"""
+    words = text.split()
+    return [" ".join(words[start:stop]) for start, stop in chunk_spans(len(words), chunk_words, overlap_words)]
+
+
+def bm25_scores(
+    postings: Iterable[Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    n: int,
+    size: int,
+    total_length: float,
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> Optional[np.ndarray]:
+    """
+    BM25 scores indexed by chunk id (ids below size), given each query term's
+    postings as (chunk ids, term frequencies, chunk lengths) arrays, the
+    latter two as float64. n is the number of live chunks. None if no term
+    matched.
+    """
+    avg_length = (total_length / n if n else 0.0) or 1.0
+    scores = None
+    for ids, tf, lengths in postings:
+        df = len(ids)
+        if not df:
+            continue
+        idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        # idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length)), in place
+        norm = lengths * (k1 * b / avg_length)
+        norm += k1 * (1.0 - b)
+        norm += tf
+        weights = tf * (idf * (k1 + 1.0))
+        weights /= norm
+        term_scores = np.bincount(ids, weights, minlength=size)
+        if scores is None:
+            scores = term_scores
+        else:
+            scores += term_scores
+    return scores
+
+
+def top_scores(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Ids of the top_k positive scores, best first"""
+    candidates = np.flatnonzero(scores > 0)
+    if top_k <= 0 or not len(candidates):
+        return candidates[:0]
+    if len(candidates) > top_k:
+        candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+@dataclass
+class Chunk:
+    chunk_id: int
+    doc_id: str
+    position: int
+    text: str
+    length: int
+
+
+class BM25Index:
+    """
+    In-memory inverted index over knowledge-base chunks with BM25 scoring.
+
+    Documents are added and removed individually, so uploads and deletes only
+    touch the postings of the affected document instead of rebuilding the
+    whole index. Search scores with numpy: each term's postings are compiled
+    into arrays of chunk ids, term frequencies and chunk lengths on first use
+    after a change. Ids of removed chunks are reused, so the score array
+    stays as large as the index.
+    """
+
+    def __init__(self, chunk_words: int = 200, overlap_words: int = 40, k1: float = 1.5, b: float = 0.75):
+        self.chunk_words = chunk_words
+        self.overlap_words = overlap_words
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._next_chunk_id = 0
+        self._free_ids: List[int] = []
+        self._chunks: Dict[int, Chunk] = {}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # Compiled postings of terms unchanged since their last search
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._doc_chunks: Dict[str, List[int]] = {}
+        self._doc_versions: Dict[str, str] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def has_document(self, doc_id: str, version: Optional[str] = None) -> bool:
+        with self._lock:
+            if doc_id not in self._doc_chunks:
+                return False
+            return version is None or self._doc_versions.get(doc_id) == version
+
+    def _allocate_id(self) -> int:
+        if self._free_ids:
+            return self._free_ids.pop()
+        self._next_chunk_id += 1
+        return self._next_chunk_id - 1
+
+    def add_document(self, doc_id: str, text: str, version: str = "") -> List[Chunk]:
+        chunks = chunk_text(text, self.chunk_words, self.overlap_words)
+        with self._lock:
+            self.remove_document(doc_id)
+            added = []
+            for position, chunk_body in enumerate(chunks):
+                terms = tokenize(chunk_body)
+                chunk = Chunk(self._allocate_id(), doc_id, position, chunk_body, len(terms))
+                self._chunks[chunk.chunk_id] = chunk
+                self._total_length += chunk.length
+                frequencies: Dict[str, int] = {}
+                for term in terms:
+                    frequencies[term] = frequencies.get(term, 0) + 1
+                for term, tf in frequencies.items():
+                    self._postings.setdefault(term, {})[chunk.chunk_id] = tf
+                    self._arrays.pop(term, None)
+                added.append(chunk)
+            self._doc_chunks[doc_id] = [c.chunk_id for c in added]
+            self._doc_versions[doc_id] = version
+            return added
+
+    def remove_document(self, doc_id: str) -> None:
+        with self._lock:
+            chunk_ids = self._doc_chunks.pop(doc_id, None)
+            self._doc_versions.pop(doc_id, None)
+            if not chunk_ids:
+                return
+            for chunk_id in chunk_ids:
+                chunk = self._chunks.pop(chunk_id)
+                self._total_length -= chunk.length
+                self._free_ids.append(chunk_id)
+                for term in set(tokenize(chunk.text)):
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        continue
+                    postings.pop(chunk_id, None)
+                    self._arrays.pop(term, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def sync(self, documents: Iterable[Tuple[str, str, str]]) -> None:
+        """Bring the index in line with [(doc_id, version, text)], touching only changed documents"""
+        with self._lock:
+            seen = set()
+            for doc_id, version, text in documents:
+                seen.add(doc_id)
+                if not self.has_document(doc_id, version):
+                    self.add_document(doc_id, text, version)
+            for doc_id in [d for d in self._doc_chunks if d not in seen]:
+                self.remove_document(doc_id)
+
+    def _term_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            count = len(postings)
+            arrays = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=count),
+                np.fromiter(postings.values(), dtype=np.float64, count=count),
+                np.fromiter((self._chunks[chunk_id].length for chunk_id in postings), dtype=np.float64, count=count),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, Chunk]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self._chunks)
+            if not n or not terms:
+                return []
+            postings = [arrays for arrays in map(self._term_arrays, terms) if arrays is not None]
+            scores = bm25_scores(postings, n, self._next_chunk_id, self._total_length, self.k1, self.b)
+            if scores is None:
+                return []
+            return [(float(scores[i]), self._chunks[int(i)]) for i in top_scores(scores, top_k)]
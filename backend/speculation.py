@@ -0,0 +1,135 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+def common_prefix(a: List[str], b: List[str]) -> List[str]:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return a[:length]
+
+
+def words_of(text: str) -> List[str]:
+    return text.lower().split()
+
+
+class SpeculativeRetriever:
+    """
+    Starts knowledge-base retrieval for an utterance before it is final.
+
+    Each partial transcript is compared with the previous one; the words they
+    share at the start are treated as stable. Once the stable prefix has at
+    least min_words words and stops changing for debounce_seconds, retrieval
+    runs for it, and a newer stable prefix cancels a lookup that hasn't
+    finished. A final with no matching speculation starts its own lookup
+    straight away, ahead of the assistance worker's coalescing window.
+
+    A speculative lookup matches a text when its query is a prefix covering
+    at least min_coverage of the text's words. Each final counts as a hit if
+    one matches and a miss otherwise. resolve(text) is the retrieval entry
+    point for assistance and reuses whichever lookup matches.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str], Awaitable[Any]],
+        debounce_seconds: float = 0.15,
+        min_words: int = 3,
+        min_coverage: float = 0.7,
+        max_lookups: int = 4,
+        stats: Optional[Dict[str, int]] = None,
+    ):
+        self.retrieve = retrieve
+        self.debounce_seconds = debounce_seconds
+        self.min_words = min_words
+        self.min_coverage = min_coverage
+        self.max_lookups = max_lookups
+        # May be shared between sessions to aggregate counters
+        self.stats = stats if stats is not None else {}
+        for name in ("speculated", "cancelled", "hits", "misses"):
+            self.stats.setdefault(name, 0)
+        self._previous: List[str] = []
+        self._scheduled: List[str] = []
+        self._debounce: Optional[asyncio.Task] = None
+        self._speculative: Optional[asyncio.Task] = None
+        self._lookups: "OrderedDict[str, asyncio.Task]" = OrderedDict()
+
+    def on_partial(self, text: str) -> None:
+        words = words_of(text)
+        stable = common_prefix(self._previous, words)
+        self._previous = words
+        if len(stable) < self.min_words or stable == self._scheduled:
+            return
+        self._scheduled = stable
+        if self._debounce is not None:
+            self._debounce.cancel()
+        self._debounce = asyncio.create_task(self._speculate(" ".join(stable)))
+
+    async def _speculate(self, query: str) -> None:
+        await asyncio.sleep(self.debounce_seconds)
+        self._debounce = None
+        if self._speculative is not None and not self._speculative.done():
+            # Superseded by a longer stable prefix
+            self._speculative.cancel()
+            self._lookups = OrderedDict((q, t) for q, t in self._lookups.items() if t is not self._speculative)
+            self.stats["cancelled"] += 1
+        self._speculative = self._start(query)
+        self.stats["speculated"] += 1
+
+    def on_final(self, text: str) -> None:
+        if self._debounce is not None:
+            self._debounce.cancel()
+            self._debounce = None
+        self._previous = []
+        self._scheduled = []
+        if self._match(text) is not None:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            self._start(" ".join(words_of(text)))
+        self._speculative = None
+
+    def _start(self, query: str) -> asyncio.Task:
+        lookup = self._lookups.pop(query, None)
+        if lookup is None or lookup.cancelled():
+            lookup = asyncio.create_task(self.retrieve(query))
+        self._lookups[query] = lookup
+        while len(self._lookups) > self.max_lookups:
+            _, oldest = self._lookups.popitem(last=False)
+            if not oldest.done():
+                oldest.cancel()
+        return lookup
+
+    def _match(self, text: str) -> Optional[asyncio.Task]:
+        words = words_of(text)
+        best, best_length = None, 0
+        for query, lookup in self._lookups.items():
+            if lookup.cancelled() or (lookup.done() and lookup.exception() is not None):
+                continue
+            query_words = query.split()
+            if len(query_words) <= best_length or len(query_words) < self.min_coverage * len(words):
+                continue
+            if words[:len(query_words)] == query_words:
+                best, best_length = lookup, len(query_words)
+        return best
+
+    async def resolve(self, text: str) -> Any:
+        lookup = self._match(text)
+        if lookup is not None:
+            try:
+                return await asyncio.shield(lookup)
+            except asyncio.CancelledError:
+                if not lookup.cancelled():
+                    raise
+                # Evicted while we waited; fall through to a fresh lookup
+        return await self.retrieve(text)
+
+    async def close(self) -> None:
+        tasks = [task for task in [self._debounce, *self._lookups.values()] if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._lookups.clear()
@@ -0,0 +1,427 @@
+import os
+import asyncio
+import hashlib
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, List, Optional, Tuple
+from urllib.parse import quote
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from aws_clients import LazyClient
+from aws_debug import in_context
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class ObjectNotFound(Exception):
+    """Raised when a storage key does not exist"""
+
+
+@dataclass
+class ObjectInfo:
+    key: str
+    size: int
+    etag: str
+    last_modified: datetime
+
+
+@dataclass
+class UploadResult:
+    etag: str
+    size: int
+    sha256: str
+
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+class Storage:
+    """
+    Async object storage used by every endpoint that touches the bucket.
+
+    Implementations must never block the event loop: S3Storage runs boto3 on
+    its own bounded executor and LocalStorage does file I/O the same way.
+    """
+
+    name = "storage"
+
+    async def put(self, key: str, body: bytes, content_type: Optional[str] = None) -> str:
+        """Store body under key and return its ETag"""
+        raise NotImplementedError
+
+    async def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def sha256(self, key: str, chunk_size: int = 1024 * 1024) -> str:
+        """SHA-256 of a stored object, read chunk by chunk rather than held in memory"""
+        raise NotImplementedError
+
+    async def head(self, key: str) -> ObjectInfo:
+        raise NotImplementedError
+
+    async def upload_stream(
+        self,
+        key: str,
+        read: Callable[[int], Awaitable[bytes]],
+        content_type: Optional[str] = None,
+        part_size: int = 8 * 1024 * 1024,
+        max_concurrency: int = 4,
+    ) -> UploadResult:
+        """
+        Store the bytes produced by read(n) under key without buffering the whole body.
+
+        At most max_concurrency parts are in flight plus the one being read, so
+        peak memory per upload is bounded by (max_concurrency + 1) * part_size.
+        The SHA-256 of the content is computed on the fly.
+        """
+        raise NotImplementedError
+
+    async def list_page(
+        self, prefix: str, continuation_token: Optional[str] = None, max_keys: int = 1000
+    ) -> Tuple[List[ObjectInfo], Optional[str]]:
+        """Return one page of objects under prefix and the token for the next page (None when done)"""
+        raise NotImplementedError
+
+    async def list(self, prefix: str) -> List[ObjectInfo]:
+        """Return every object under prefix, following pagination"""
+        objects, token = await self.list_page(prefix)
+        while token:
+            page, token = await self.list_page(prefix, token)
+            objects.extend(page)
+        return objects
+
+    async def presign(self, key: str, expires_in: int = 3600) -> str:
+        raise NotImplementedError
+
+    async def check(self) -> None:
+        """Raise if the backing bucket or directory is not reachable"""
+        raise NotImplementedError
+
+    async def warm_up(self) -> None:
+        """Open connections ahead of the first request"""
+
+    def close(self) -> None:
+        pass
+
+
+class S3Storage(Storage):
+    """S3 backend running boto3 calls on a dedicated, bounded thread pool"""
+
+    name = "s3"
+
+    def __init__(self, session, bucket: str, max_workers: int = 16, max_pool_connections: Optional[int] = None):
+        self.bucket = bucket
+        self.client = LazyClient(
+            lambda: session.client('s3', config=Config(max_pool_connections=max_pool_connections or max_workers)),
+            's3',
+        )
+        self._warm_connections = min(max_workers, 4)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3-storage')
+
+    async def call(self, method: str, **kwargs):
+        """Run any S3 client method on the storage executor"""
+        operation = functools.partial(getattr(self.client, method), **kwargs)
+
+        def run():
+            with span("s3", method):
+                return operation()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, in_context(run))
+
+    async def put(self, key: str, body: bytes, content_type: Optional[str] = None) -> str:
+        params = {'Bucket': self.bucket, 'Key': key, 'Body': body}
+        if content_type:
+            params['ContentType'] = content_type
+        response = await self.call('put_object', **params)
+        return response['ETag']
+
+    async def get(self, key: str) -> bytes:
+        def read():
+            with span("s3", "get_object"):
+                try:
+                    response = self.client.get_object(Bucket=self.bucket, Key=key)
+                except ClientError as e:
+                    if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                        raise ObjectNotFound(key)
+                    raise
+                return response['Body'].read()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, in_context(read))
+
+    async def delete(self, key: str) -> None:
+        await self.call('delete_object', Bucket=self.bucket, Key=key)
+
+    async def sha256(self, key: str, chunk_size: int = 1024 * 1024) -> str:
+        def digest():
+            with span("s3", "get_object"):
+                try:
+                    response = self.client.get_object(Bucket=self.bucket, Key=key)
+                except ClientError as e:
+                    if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                        raise ObjectNotFound(key)
+                    raise
+                hasher = hashlib.sha256()
+                for chunk in response['Body'].iter_chunks(chunk_size):
+                    hasher.update(chunk)
+                return hasher.hexdigest()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, in_context(digest))
+
+    async def head(self, key: str) -> ObjectInfo:
+        try:
+            response = await self.call('head_object', Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                raise ObjectNotFound(key)
+            raise
+        return ObjectInfo(key, response['ContentLength'], response['ETag'], response['LastModified'])
+
+    async def upload_stream(self, key, read, content_type=None, part_size=8 * 1024 * 1024, max_concurrency=4):
+        part_size = max(part_size, MIN_PART_SIZE)
+        loop = asyncio.get_running_loop()
+        hasher = hashlib.sha256()
+
+        chunk = await read(part_size)
+        await loop.run_in_executor(self._executor, hasher.update, chunk)
+        size = len(chunk)
+        if size < part_size:
+            # Fits in a single part, a plain put is cheaper than a multipart upload
+            etag = await self.put(key, chunk, content_type)
+            return UploadResult(etag, size, hasher.hexdigest())
+
+        params = {'Bucket': self.bucket, 'Key': key}
+        if content_type:
+            params['ContentType'] = content_type
+        upload_id = (await self.call('create_multipart_upload', **params))['UploadId']
+        in_flight = asyncio.Semaphore(max_concurrency)
+        parts = []
+        tasks = []
+
+        async def send_part(number, body):
+            try:
+                response = await self.call(
+                    'upload_part', Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+                )
+                parts.append({'PartNumber': number, 'ETag': response['ETag']})
+            finally:
+                in_flight.release()
+
+        try:
+            number = 1
+            while chunk:
+                await in_flight.acquire()
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+                tasks.append(asyncio.create_task(send_part(number, chunk)))
+                number += 1
+                chunk = await read(part_size)
+                if chunk:
+                    await loop.run_in_executor(self._executor, hasher.update, chunk)
+                    size += len(chunk)
+            await asyncio.gather(*tasks)
+            parts.sort(key=lambda part: part['PartNumber'])
+            response = await self.call(
+                'complete_multipart_upload', Bucket=self.bucket, Key=key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            try:
+                await self.call('abort_multipart_upload', Bucket=self.bucket, Key=key, UploadId=upload_id)
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload {upload_id} for {key}: {str(e)}")
+            raise
+        return UploadResult(response['ETag'], size, hasher.hexdigest())
+
+    async def list_page(self, prefix, continuation_token=None, max_keys=1000):
+        params = {'Bucket': self.bucket, 'Prefix': prefix, 'MaxKeys': max_keys}
+        if continuation_token:
+            params['ContinuationToken'] = continuation_token
+        response = await self.call('list_objects_v2', **params)
+        objects = [
+            ObjectInfo(obj['Key'], obj['Size'], obj['ETag'], obj['LastModified'])
+            for obj in response.get('Contents', [])
+        ]
+        token = response.get('NextContinuationToken') if response.get('IsTruncated') else None
+        return objects, token
+
+    async def presign(self, key: str, expires_in: int = 3600) -> str:
+        if isinstance(self.client, LazyClient) and not self.client.built:
+            # Used before warm-up: build the client on the executor, not the event loop
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.client.get)
+        # Presigning is local computation, no request is made
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=expires_in
+        )
+
+    async def check(self) -> None:
+        await self.call('head_bucket', Bucket=self.bucket)
+
+    async def warm_up(self) -> None:
+        # Concurrent requests each leave a TLS connection in the pool
+        await asyncio.gather(*[self.call('head_bucket', Bucket=self.bucket) for _ in range(self._warm_connections)])
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        if isinstance(self.client, LazyClient):
+            self.client.close()
+
+
+class LocalStorage(Storage):
+    """
+    Directory-backed storage with the same semantics as S3Storage.
+
+    Lets the whole API run and be load-tested without network access. Keys map
+    to paths under root; presigned URLs point at base_url, which the app serves
+    from /api/storage/{key}.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str = "/api/storage", max_workers: int = 8):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip('/')
+        os.makedirs(self.root, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='local-storage')
+
+    def path_for(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    @staticmethod
+    def _info(key: str, path: str) -> ObjectInfo:
+        stat = os.stat(path)
+        # Size and mtime stand in for the content hash to keep listings cheap
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        modified = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+        return ObjectInfo(key, stat.st_size, etag, modified)
+
+    async def put(self, key: str, body: bytes, content_type: Optional[str] = None) -> str:
+        def write():
+            path = self.path_for(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp-{os.getpid()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            return self._info(key, path).etag
+        return await self._run(write)
+
+    async def upload_stream(self, key, read, content_type=None, part_size=8 * 1024 * 1024, max_concurrency=4):
+        path = self.path_for(key)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{id(read):x}"
+        hasher = hashlib.sha256()
+        size = 0
+
+        def write_part(f, chunk):
+            hasher.update(chunk)
+            f.write(chunk)
+
+        await self._run(functools.partial(os.makedirs, os.path.dirname(path), exist_ok=True))
+        f = await self._run(open, tmp_path, 'wb')
+        try:
+            while True:
+                chunk = await read(part_size)
+                if not chunk:
+                    break
+                await self._run(write_part, f, chunk)
+                size += len(chunk)
+            await self._run(f.close)
+            await self._run(os.replace, tmp_path, path)
+        except BaseException:
+            f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        info = await self.head(key)
+        return UploadResult(info.etag, size, hasher.hexdigest())
+
+    async def get(self, key: str) -> bytes:
+        def read():
+            try:
+                with open(self.path_for(key), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                raise ObjectNotFound(key)
+        return await self._run(read)
+
+    async def delete(self, key: str) -> None:
+        def remove():
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+        await self._run(remove)
+
+    async def sha256(self, key: str, chunk_size: int = 1024 * 1024) -> str:
+        def digest():
+            hasher = hashlib.sha256()
+            try:
+                with open(self.path_for(key), 'rb') as f:
+                    while chunk := f.read(chunk_size):
+                        hasher.update(chunk)
+            except FileNotFoundError:
+                raise ObjectNotFound(key)
+            return hasher.hexdigest()
+        return await self._run(digest)
+
+    async def head(self, key: str) -> ObjectInfo:
+        def stat():
+            try:
+                return self._info(key, self.path_for(key))
+            except FileNotFoundError:
+                raise ObjectNotFound(key)
+        return await self._run(stat)
+
+    def _scan(self, prefix: str) -> List[ObjectInfo]:
+        objects = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if not key.startswith(prefix) or '.tmp-' in filename:
+                    continue
+                objects.append(self._info(key, path))
+        objects.sort(key=lambda o: o.key)
+        return objects
+
+    async def list_page(self, prefix, continuation_token=None, max_keys=1000):
+        objects = await self._run(self._scan, prefix)
+        if continuation_token:
+            objects = [o for o in objects if o.key > continuation_token]
+        page = objects[:max_keys]
+        token = page[-1].key if len(objects) > max_keys else None
+        return page, token
+
+    async def presign(self, key: str, expires_in: int = 3600) -> str:
+        return f"{self.base_url}/{quote(key)}"
+
+    async def check(self) -> None:
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(self.root)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,95 @@
+import asyncio
+
+from answer_cache import AnswerCache
+from assistance_worker import AssistanceWorker
+
+
+class SlowAnswer:
+    """An answer generator that streams until stopped and records how it ended"""
+
+    def __init__(self):
+        self.started = 0
+        self.stopped = 0
+        self.finished = 0
+
+    async def produce(self):
+        self.started += 1
+        try:
+            for word in ("one", "two", "three"):
+                await asyncio.sleep(0.05)
+                yield word + " "
+            self.finished += 1
+        finally:
+            self.stopped += 1
+
+
+def test_superseded_request_stops_the_generator():
+    cache = AnswerCache()
+    answer = SlowAnswer()
+    sent = []
+
+    async def generate(text):
+        return "".join([delta async for delta in cache.stream(text, 1, answer.produce)])
+
+    async def send(suggestion):
+        sent.append(suggestion)
+
+    async def main():
+        worker = AssistanceWorker(generate, send, coalesce_seconds=0)
+        worker.start()
+        worker.submit("first question")
+        await asyncio.sleep(0.07)
+        # Newer speech cancels the in-flight request for "first question"
+        worker.submit("and more")
+        await asyncio.sleep(0.3)
+        await worker.stop()
+
+    asyncio.run(main())
+    # The superseded generation was stopped mid-stream; only the restart finished
+    assert (answer.started, answer.stopped, answer.finished) == (2, 2, 1)
+    assert sent == ["one two three "]
+    assert cache.stats["abandoned"] == 1
+    assert cache.info()["inFlight"] == 0
+
+
+def test_stream_keeps_running_while_another_caller_follows():
+    cache = AnswerCache()
+    answer = SlowAnswer()
+
+    async def read():
+        return "".join([delta async for delta in cache.stream("question", 1, answer.produce)])
+
+    async def main():
+        first = asyncio.create_task(read())
+        second = asyncio.create_task(read())
+        await asyncio.sleep(0.07)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return await second
+
+    assert asyncio.run(main()) == "one two three "
+    assert (answer.started, answer.finished) == (1, 1)
+    assert cache.get("question", 1) == "one two three "
+
+
+def test_abandoned_computation_is_cancelled():
+    cache = AnswerCache()
+    cancelled = []
+
+    async def compute():
+        try:
+            await asyncio.sleep(1)
+            return "answer"
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        caller = asyncio.create_task(cache.get_or_compute("question", 1, compute))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        return list(cancelled), cache.info()["inFlight"]
+
+    assert asyncio.run(main()) == ([True], 0)
@@ -0,0 +1,46 @@
+import asyncio
+
+from call_sessions import AudioBuffer
+from eventstream import AudioFrameCoalescer
+
+
+def test_queued_coalesced_chunks_keep_their_audio():
+    # Several chunks are queued before the upstream sender drains any of them,
+    # as happens whenever the Transcribe stream falls behind the browser
+    coalescer = AudioFrameCoalescer(8)
+    buffer = AudioBuffer(max_bytes=1024)
+    frames = [bytes([i]) * 6 for i in range(1, 7)]
+    for frame in frames:
+        for chunk in coalescer.feed(frame):
+            buffer.put(chunk)
+    remainder = coalescer.flush()
+    if remainder:
+        buffer.put(remainder)
+    buffer.close()
+
+    async def drain():
+        chunks = []
+        while (chunk := await buffer.get()) is not None:
+            chunks.append(chunk)
+        return chunks
+
+    chunks = asyncio.run(drain())
+    assert [len(chunk) for chunk in chunks] == [8, 8, 8, 8, 4]
+    assert b"".join(chunks) == b"".join(frames)
+
+
+def test_overflow_drops_oldest_chunks():
+    buffer = AudioBuffer(max_bytes=10)
+    for i in range(4):
+        buffer.put(bytes([i]) * 4)
+    buffer.close()
+
+    async def drain():
+        chunks = []
+        while (chunk := await buffer.get()) is not None:
+            chunks.append(chunk)
+        return chunks
+
+    assert asyncio.run(drain()) == [b"\x02" * 4, b"\x03" * 4]
+    assert buffer.dropped_bytes == 8
+    assert buffer.total_bytes == 16
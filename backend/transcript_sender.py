@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptSender:
+    """
+    Per-session outbound coalescer for transcript messages.
+
+    Partials are sent at most once per min_interval; one arriving sooner is
+    held and only the newest held partial goes out when the interval is up.
+    Finals are sent immediately and drop any held partial. With delta=True a
+    partial is sent as a transcript_delta message carrying how many leading
+    characters of the previous partial to keep plus the new suffix, instead
+    of the whole text; clients opt in to that format.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        min_interval: float = 0.2,
+        delta: bool = False,
+    ):
+        self.send = send
+        self.min_interval = min_interval
+        self.delta = delta
+        self._lock = asyncio.Lock()
+        self._pending: Optional[str] = None
+        self._last_partial = ""
+        self._last_sent_at = float("-inf")
+        self._timer: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"partials": 0, "partials_sent": 0, "finals": 0, "chars_sent": 0}
+
+    async def partial(self, text: str) -> None:
+        self.stats["partials"] += 1
+        self._pending = text
+        if self._timer is not None:
+            return
+        wait = self._last_sent_at + self.min_interval - asyncio.get_running_loop().time()
+        if wait <= 0 and not self._lock.locked():
+            await self._flush_partial()
+        else:
+            self._timer = asyncio.create_task(self._flush_later(max(wait, 0)))
+
+    async def _flush_later(self, wait: float) -> None:
+        await asyncio.sleep(wait)
+        self._timer = None
+        await self._flush_partial()
+
+    async def _flush_partial(self) -> None:
+        async with self._lock:
+            text, self._pending = self._pending, None
+            if text is None or text == self._last_partial:
+                return
+            if self.delta:
+                keep = len(os.path.commonprefix([self._last_partial, text]))
+                message = {"type": "transcript_delta", "data": {"keep": keep, "text": text[keep:]}}
+                sent_chars = len(text) - keep
+            else:
+                message = {"type": "transcript", "data": {"text": text, "is_final": False}}
+                sent_chars = len(text)
+            self._last_partial = text
+            self._last_sent_at = asyncio.get_running_loop().time()
+            await self.send(message)
+            self.stats["partials_sent"] += 1
+            self.stats["chars_sent"] += sent_chars
+
+    async def final(self, text: str) -> None:
+        self._pending = None
+        async with self._lock:
+            self._last_partial = ""
+            await self.send({"type": "transcript", "data": {"text": text, "is_final": True}})
+            self.stats["finals"] += 1
+            self.stats["chars_sent"] += len(text)
+        logger.debug("Sent final transcript: %s", text)
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
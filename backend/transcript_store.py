@@ -0,0 +1,299 @@
+import zlib
+import random
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from aws_debug import in_context
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# DynamoDB accepts at most 25 put requests per BatchWriteItem call
+BATCH_WRITE_LIMIT = 25
+
+
+class Table:
+    """Minimal async item-table interface used for call persistence"""
+
+    def __init__(self, hash_key: str, range_key: Optional[str] = None):
+        self.hash_key = hash_key
+        self.range_key = range_key
+
+    async def put(self, item: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def batch_write(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write up to BATCH_WRITE_LIMIT items and return the ones that were not processed"""
+        raise NotImplementedError
+
+    async def query(self, hash_value: str) -> List[Dict[str, Any]]:
+        """All items under hash_value, ordered by the range key"""
+        raise NotImplementedError
+
+    def scan_pages(self, segment: int = 0, total_segments: int = 1, **kwargs: Any) -> Iterator[List[Dict[str, Any]]]:
+        """
+        One segment of a parallel scan, a page at a time. Blocking, so it is
+        meant to run on a worker thread; kwargs (FilterExpression,
+        ProjectionExpression, ...) go to the Scan call.
+        """
+        raise NotImplementedError
+
+    async def ensure_exists(self, hash_type: str = 'S', range_type: str = 'N') -> bool:
+        """Create the table if it is missing; True if it was created"""
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+class DynamoTable(Table):
+    def __init__(self, table, hash_key: str, range_key: Optional[str] = None, max_workers: int = 8):
+        super().__init__(hash_key, range_key)
+        # A boto3 Table resource; its client converts native Python types
+        self.table = table
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dynamodb")
+
+    async def _run(self, fn, *args, **kwargs):
+        def run():
+            with span("dynamodb", getattr(fn, "__name__", "")):
+                return fn(*args, **kwargs)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, in_context(run))
+
+    async def put(self, item: Dict[str, Any]) -> None:
+        await self._run(self.table.put_item, Item=item)
+
+    async def batch_write(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        response = await self._run(
+            self.table.meta.client.batch_write_item,
+            RequestItems={self.table.name: [{'PutRequest': {'Item': item}} for item in items]},
+        )
+        unprocessed = response.get('UnprocessedItems', {}).get(self.table.name, [])
+        return [request['PutRequest']['Item'] for request in unprocessed]
+
+    async def query(self, hash_value: str) -> List[Dict[str, Any]]:
+        items = []
+        kwargs = {'KeyConditionExpression': Key(self.hash_key).eq(hash_value)}
+        while True:
+            response = await self._run(self.table.query, **kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def scan_pages(self, segment: int = 0, total_segments: int = 1, **kwargs: Any) -> Iterator[List[Dict[str, Any]]]:
+        kwargs.update(Segment=segment, TotalSegments=total_segments)
+        while True:
+            with span("dynamodb", "scan"):
+                response = self.table.scan(**kwargs)
+            yield response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    async def ensure_exists(self, hash_type: str = 'S', range_type: str = 'N') -> bool:
+        def create():
+            client = self.table.meta.client
+            name = self.table.name
+            try:
+                client.describe_table(TableName=name)
+                return False
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                    raise
+            keys = [(self.hash_key, 'HASH', hash_type)]
+            if self.range_key:
+                keys.append((self.range_key, 'RANGE', range_type))
+            client.create_table(
+                TableName=name,
+                KeySchema=[{'AttributeName': key, 'KeyType': kind} for key, kind, _ in keys],
+                AttributeDefinitions=[{'AttributeName': key, 'AttributeType': type_} for key, _, type_ in keys],
+                BillingMode='PAY_PER_REQUEST',
+            )
+            client.get_waiter('table_exists').wait(TableName=name)
+            return True
+
+        return await self._run(create)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+class InMemoryTable(Table):
+    """
+    Dict-backed table for tests and local runs. max_batch_accept simulates
+    DynamoDB returning UnprocessedItems: only that many items of each batch
+    are written and the rest are handed back.
+    """
+
+    def __init__(self, hash_key: str, range_key: Optional[str] = None, max_batch_accept: Optional[int] = None):
+        super().__init__(hash_key, range_key)
+        self.max_batch_accept = max_batch_accept
+        self.items: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+        self.batch_calls = 0
+
+    def _key(self, item: Dict[str, Any]) -> Tuple[Any, Any]:
+        return item[self.hash_key], item.get(self.range_key) if self.range_key else None
+
+    async def put(self, item: Dict[str, Any]) -> None:
+        self.items[self._key(item)] = dict(item)
+
+    async def batch_write(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if len(items) > BATCH_WRITE_LIMIT:
+            raise ValueError(f"Too many items in batch: {len(items)}")
+        self.batch_calls += 1
+        accept = len(items) if self.max_batch_accept is None else self.max_batch_accept
+        for item in items[:accept]:
+            await self.put(item)
+        return items[accept:]
+
+    async def query(self, hash_value: str) -> List[Dict[str, Any]]:
+        matches = [item for (hash_key, _), item in self.items.items() if hash_key == hash_value]
+        if self.range_key:
+            matches.sort(key=lambda item: item[self.range_key])
+        return matches
+
+    def scan_pages(self, segment: int = 0, total_segments: int = 1, **kwargs: Any) -> Iterator[List[Dict[str, Any]]]:
+        """Segments split on a hash of the hash key; expressions are ignored, so callers filter for themselves"""
+        page_size = kwargs.get('Limit') or 1000
+        page = []
+        for (hash_key, _), item in list(self.items.items()):
+            if zlib.crc32(str(hash_key).encode('utf-8')) % total_segments != segment:
+                continue
+            page.append(dict(item))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+
+class TranscriptWriter:
+    """
+    Write-behind persistence of one call's transcript segments.
+
+    append() only buffers the segment under the next sequence number; a
+    background task writes buffered segments as (ConversationId, Sequence)
+    items with BatchWriteItem once flush_items are waiting or flush_seconds
+    have passed. Unprocessed items and failed batches are retried with
+    jittered backoff. The buffer holds at most max_buffered segments; if the
+    table stays unavailable the oldest are dropped (and counted) rather than
+    letting a long call grow without bound.
+    """
+
+    def __init__(
+        self,
+        table: Table,
+        conversation_id: str,
+        flush_items: int = BATCH_WRITE_LIMIT,
+        flush_seconds: float = 2.0,
+        max_buffered: int = 1000,
+        max_retries: int = 5,
+        base_delay: float = 0.1,
+        max_delay: float = 2.0,
+    ):
+        self.table = table
+        self.conversation_id = conversation_id
+        self.flush_items = min(flush_items, BATCH_WRITE_LIMIT)
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sequence = 0
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"appended": 0, "written": 0, "batches": 0, "retried": 0, "dropped": 0}
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    def append(self, text: str, timestamp: Optional[str] = None, **attributes: Any) -> int:
+        """Buffer a final segment and return its sequence number"""
+        sequence = self.sequence
+        self.sequence += 1
+        self._buffer.append({
+            "ConversationId": self.conversation_id,
+            "Sequence": sequence,
+            "Text": text,
+            "Timestamp": timestamp or datetime.now(timezone.utc).isoformat(),
+            **attributes,
+        })
+        self.stats["appended"] += 1
+        while len(self._buffer) > self.max_buffered:
+            self._buffer.popleft()
+            self.stats["dropped"] += 1
+        if len(self._buffer) >= self.flush_items:
+            self._wakeup.set()
+        return sequence
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> bool:
+        """Write everything buffered; returns False if some segments are still pending"""
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(self.flush_items, len(self._buffer)))]
+            try:
+                remaining = await self._write(batch)
+            except asyncio.CancelledError:
+                # Rewriting a segment is idempotent, so the whole batch goes back
+                self._buffer.extendleft(reversed(batch))
+                raise
+            if remaining:
+                # Put them back in order for the next flush
+                self._buffer.extendleft(reversed(remaining))
+                while len(self._buffer) > self.max_buffered:
+                    self._buffer.popleft()
+                    self.stats["dropped"] += 1
+                return False
+        return True
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        attempt = 0
+        while True:
+            try:
+                unprocessed = await self.table.batch_write(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Transcript batch write for {self.conversation_id} failed: {str(e)}")
+                unprocessed = batch
+            self.stats["batches"] += 1
+            self.stats["written"] += len(batch) - len(unprocessed)
+            if not unprocessed or attempt >= self.max_retries:
+                return unprocessed
+            self.stats["retried"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+            batch = unprocessed
+            attempt += 1
+
+    async def close(self) -> bool:
+        """Stop the background flusher and write whatever is still buffered"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        flushed = await self.flush()
+        if not flushed:
+            logger.error(f"{len(self._buffer)} transcript segments for {self.conversation_id} could not be saved")
+        return flushed
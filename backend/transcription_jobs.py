@@ -0,0 +1,446 @@
+import json
+import time
+import hashlib
+import uuid
+import asyncio
+import logging
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+
+def segment_speakers(items: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Merge Transcribe result items into consecutive Agent/Customer turns"""
+    speakers = []
+    current_speaker = None
+    current_text = []
+
+    for item in items:
+        if 'speaker_label' in item:
+            speaker = f"Speaker {item['speaker_label']}"
+            if current_speaker and speaker != current_speaker and current_text:
+                speakers.append({
+                    'speaker': 'Agent' if current_speaker == 'Speaker 1' else 'Customer',
+                    'text': ' '.join(current_text)
+                })
+                current_text = []
+            current_speaker = speaker
+
+        if 'alternatives' in item and item['alternatives']:
+            current_text.append(item['alternatives'][0]['content'])
+
+    if current_text:
+        speakers.append({
+            'speaker': 'Agent' if current_speaker == 'Speaker 1' else 'Customer',
+            'text': ' '.join(current_text)
+        })
+    return speakers
+
+
+@dataclass
+class TranscriptionJob:
+    job_id: str
+    audio_key: str
+    media_uri: str
+    settings: Dict[str, Any]
+    status: str = "QUEUED"
+    provider_job_name: Optional[str] = None
+    results: Optional[List[Dict[str, str]]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    cached: bool = False
+    cache_key: Optional[str] = None
+    poll_interval: float = 0.0
+    next_poll_at: float = 0.0
+    poll_errors: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for internal in ("poll_interval", "next_poll_at", "poll_errors", "media_uri", "cache_key"):
+            data.pop(internal)
+        return data
+
+
+class JobStore:
+    """Registry backend for transcription jobs"""
+
+    async def save(self, job: TranscriptionJob) -> None:
+        raise NotImplementedError
+
+    async def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        raise NotImplementedError
+
+    async def active(self) -> List[TranscriptionJob]:
+        raise NotImplementedError
+
+
+class InMemoryJobStore(JobStore):
+    """Keeps every outstanding job plus the most recent finished ones"""
+
+    def __init__(self, max_finished: int = 1000):
+        self.max_finished = max_finished
+        self._active: Dict[str, TranscriptionJob] = {}
+        self._finished: "OrderedDict[str, TranscriptionJob]" = OrderedDict()
+
+    async def save(self, job: TranscriptionJob) -> None:
+        if job.status in TERMINAL_STATUSES:
+            self._active.pop(job.job_id, None)
+            self._finished[job.job_id] = job
+            self._finished.move_to_end(job.job_id)
+            while len(self._finished) > self.max_finished:
+                self._finished.popitem(last=False)
+        else:
+            self._active[job.job_id] = job
+
+    async def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        return self._active.get(job_id) or self._finished.get(job_id)
+
+    async def active(self) -> List[TranscriptionJob]:
+        return list(self._active.values())
+
+
+def transcript_cache_key(content_hash: str, settings: Dict[str, Any]) -> str:
+    """Key finished transcripts by the audio content plus every setting that affects the output"""
+    material = json.dumps({"audio": content_hash, "settings": settings}, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class TranscriptCache:
+    """LRU cache of speaker-segmented transcripts, bounded by their serialized size"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[List[Dict[str, str]], int]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: str, results: List[Dict[str, str]]) -> None:
+        size = len(json.dumps(results))
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.total_bytes -= previous[1]
+        self._entries[key] = (results, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+
+class TranscribeBackend:
+    """Starts batch transcription jobs and reports on them"""
+
+    async def start(self, job_name: str, media_uri: str, settings: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    async def status(self, job_name: str) -> Tuple[str, Optional[str], Optional[str]]:
+        """Return (status, transcript_uri, failure_reason)"""
+        raise NotImplementedError
+
+    async def fetch_transcript(self, transcript_uri: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class AwsTranscribeBackend(TranscribeBackend):
+    """Amazon Transcribe; boto3 calls run off the event loop and transcripts are fetched with aiohttp"""
+
+    def __init__(self, client, http_timeout: float = 60.0):
+        self.client = client
+        self.http_timeout = http_timeout
+        self._http: Optional[aiohttp.ClientSession] = None
+
+    async def start(self, job_name, media_uri, settings):
+        async with span("transcribe", "start_transcription_job"):
+            await asyncio.to_thread(
+                self.client.start_transcription_job,
+                TranscriptionJobName=job_name,
+                Media={'MediaFileUri': media_uri},
+                MediaFormat=settings.get('MediaFormat', 'wav'),
+                LanguageCode=settings.get('LanguageCode', 'en-US'),
+                Settings={
+                    'ShowSpeakerLabels': settings.get('ShowSpeakerLabels', True),
+                    'MaxSpeakerLabels': settings.get('MaxSpeakerLabels', 2),
+                }
+            )
+
+    async def status(self, job_name):
+        async with span("transcribe", "get_transcription_job"):
+            response = await asyncio.to_thread(self.client.get_transcription_job, TranscriptionJobName=job_name)
+        job = response['TranscriptionJob']
+        transcript_uri = job.get('Transcript', {}).get('TranscriptFileUri')
+        return job['TranscriptionJobStatus'], transcript_uri, job.get('FailureReason')
+
+    async def fetch_transcript(self, transcript_uri):
+        if self._http is None or self._http.closed:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.http_timeout))
+        async with span("transcribe", "fetch_transcript"), self._http.get(transcript_uri) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+
+
+class FakeTranscribeBackend(TranscribeBackend):
+    """
+    Local stand-in for Transcribe: each job completes after polls_to_complete
+    status checks with a canned transcript, so the job API runs without AWS.
+    """
+
+    def __init__(self, transcript: Optional[Dict[str, Any]] = None, polls_to_complete: int = 2, fail: bool = False):
+        self.transcript = transcript or {
+            "results": {"items": [
+                {"speaker_label": "spk_0", "alternatives": [{"content": "Hello"}]},
+                {"speaker_label": "spk_1", "alternatives": [{"content": "Hi"}]},
+            ]}
+        }
+        self.polls_to_complete = polls_to_complete
+        self.fail = fail
+        self.polls: Dict[str, int] = {}
+
+    async def start(self, job_name, media_uri, settings):
+        self.polls[job_name] = 0
+
+    async def status(self, job_name):
+        self.polls[job_name] += 1
+        if self.polls[job_name] < self.polls_to_complete:
+            return "IN_PROGRESS", None, None
+        if self.fail:
+            return "FAILED", None, "Fake failure"
+        return "COMPLETED", f"fake://{job_name}", None
+
+    async def fetch_transcript(self, transcript_uri):
+        return self.transcript
+
+
+class TranscriptionJobManager:
+    """
+    Tracks batch transcription jobs with a single background poller.
+
+    Each outstanding job is polled with exponential backoff between
+    min_interval and max_interval. Finished transcripts are fetched, split
+    into speaker turns and stored; subscribers get a snapshot on every status
+    change. A job is marked FAILED once max_poll_errors status checks in a row
+    have failed, or once it has been outstanding for max_job_seconds, so a
+    job the backend has lost is not polled forever.
+
+    When the caller supplies the audio content hash, finished transcripts are
+    cached by (content, settings): repeat submissions complete immediately and
+    identical submissions made while a job is starting or running share that
+    job.
+
+    A job is registered (visible to get() and the poller) only once the
+    backend has accepted it. A submission whose start fails is returned
+    FAILED and not kept.
+    """
+
+    def __init__(
+        self,
+        backend: TranscribeBackend,
+        store: Optional[JobStore] = None,
+        min_interval: float = 1.0,
+        max_interval: float = 30.0,
+        backoff: float = 2.0,
+        max_concurrent_polls: int = 10,
+        cache: Optional[TranscriptCache] = None,
+        max_poll_errors: int = 10,
+        max_job_seconds: float = 4 * 3600.0,
+    ):
+        self.backend = backend
+        self.store = store or InMemoryJobStore()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.max_concurrent_polls = max_concurrent_polls
+        self.max_poll_errors = max_poll_errors
+        self.max_job_seconds = max_job_seconds
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.cache = cache or TranscriptCache()
+        self._in_flight: Dict[str, str] = {}
+        # Cache key -> outcome of the identical submission still being started
+        self._starting: Dict[str, asyncio.Future] = {}
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.backend.close()
+
+    async def submit(
+        self, audio_key: str, media_uri: str, settings: Dict[str, Any], content_hash: Optional[str] = None
+    ) -> TranscriptionJob:
+        job = TranscriptionJob(job_id=str(uuid.uuid4()), audio_key=audio_key, media_uri=media_uri, settings=settings)
+        if content_hash is not None:
+            job.cache_key = transcript_cache_key(content_hash, settings)
+            results = self.cache.get(job.cache_key)
+            if results is not None:
+                job.status = "COMPLETED"
+                job.results = results
+                job.cached = True
+                await self._update(job)
+                return job
+            starting = self._starting.get(job.cache_key)
+            if starting is not None:
+                return await asyncio.shield(starting)
+            in_flight_id = self._in_flight.get(job.cache_key)
+            if in_flight_id is not None:
+                existing = await self.store.get(in_flight_id)
+                if existing is not None and existing.status not in TERMINAL_STATUSES:
+                    return existing
+
+        starting = None
+        if job.cache_key is not None:
+            # Concurrent duplicates wait for this start instead of starting their own
+            starting = asyncio.get_running_loop().create_future()
+            self._starting[job.cache_key] = starting
+        job.provider_job_name = f"transcription_{job.job_id}"
+        try:
+            await self.backend.start(job.provider_job_name, media_uri, settings)
+        except Exception as e:
+            # Never registered, so no poll or poller ever sees a half-started job
+            job.status = "FAILED"
+            job.error = str(e)
+            job.updated_at = time.time()
+        else:
+            job.status = "IN_PROGRESS"
+            job.poll_interval = self.min_interval
+            job.next_poll_at = time.monotonic() + self.min_interval
+            if job.cache_key is not None:
+                self._in_flight[job.cache_key] = job.job_id
+            await self._update(job)
+            self._wakeup.set()
+        finally:
+            if starting is not None:
+                del self._starting[job.cache_key]
+                if job.status == "QUEUED":
+                    # This submission was cancelled mid-start
+                    starting.cancel()
+                else:
+                    starting.set_result(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        return await self.store.get(job_id)
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[TranscriptionJob]:
+        """Yield the job now and after every status change until it finishes"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, set()).add(queue)
+        try:
+            job = await self.store.get(job_id)
+            if job is None:
+                return
+            yield job
+            while job.status not in TERMINAL_STATUSES:
+                job = await queue.get()
+                yield job
+        finally:
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+    async def _update(self, job: TranscriptionJob) -> None:
+        job.updated_at = time.time()
+        if job.status in TERMINAL_STATUSES and job.cache_key is not None:
+            if self._in_flight.get(job.cache_key) == job.job_id:
+                del self._in_flight[job.cache_key]
+            if job.status == "COMPLETED" and not job.cached:
+                self.cache.put(job.cache_key, job.results)
+        await self.store.save(job)
+        for queue in self._subscribers.get(job.job_id, ()):
+            queue.put_nowait(job)
+
+    async def _poll_loop(self) -> None:
+        semaphore = asyncio.Semaphore(self.max_concurrent_polls)
+
+        async def poll_guarded(job):
+            async with semaphore:
+                await self._poll(job)
+
+        while True:
+            try:
+                active = await self.store.active()
+                now = time.monotonic()
+                due = [job for job in active if job.next_poll_at <= now]
+                if due:
+                    await asyncio.gather(*(poll_guarded(job) for job in due))
+                    continue
+                self._wakeup.clear()
+                timeout = min((job.next_poll_at for job in active), default=now + 60.0) - now
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Transcription poller error: {str(e)}")
+                logger.error(traceback.format_exc())
+                await asyncio.sleep(self.min_interval)
+
+    async def _poll(self, job: TranscriptionJob) -> None:
+        if time.time() - job.created_at > self.max_job_seconds:
+            job.status = "FAILED"
+            job.error = f"Transcription did not finish within {self.max_job_seconds:.0f}s"
+            await self._update(job)
+            return
+        try:
+            status, transcript_uri, failure_reason = await self.backend.status(job.provider_job_name)
+            job.poll_errors = 0
+            if status == "COMPLETED":
+                transcript_data = await self.backend.fetch_transcript(transcript_uri)
+                job.results = segment_speakers(transcript_data['results']['items'])
+                job.status = "COMPLETED"
+            elif status == "FAILED":
+                job.status = "FAILED"
+                job.error = failure_reason or "Transcription failed"
+            else:
+                job.poll_interval = min(max(job.poll_interval, self.min_interval) * self.backoff, self.max_interval)
+                job.next_poll_at = time.monotonic() + job.poll_interval
+                if job.status != status:
+                    job.status = status
+                    await self._update(job)
+                return
+        except Exception as e:
+            logger.error(f"Error polling transcription job {job.job_id}: {str(e)}")
+            job.poll_errors += 1
+            if job.poll_errors < self.max_poll_errors:
+                job.poll_interval = min(max(job.poll_interval, self.min_interval) * self.backoff, self.max_interval)
+                job.next_poll_at = time.monotonic() + job.poll_interval
+                return
+            job.status = "FAILED"
+            job.error = f"Giving up after {job.poll_errors} failed status checks: {str(e)}"
+        await self._update(job)
@@ -6,6 +6,7 @@ class AudioProcessor extends AudioWorkletProcessor {
   process(inputs, outputs, parameters) {
     const input = inputs[0];
     if (input.length > 0) {
+      // Must match the backend's TRANSCRIBE_SAMPLE_RATE
       const pcmData = this.floatTo16BitPCM(this.downsampleBuffer(input[0], 16000));
       this.port.postMessage(pcmData.buffer, [pcmData.buffer]);
     }
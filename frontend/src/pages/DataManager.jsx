@@ -53,11 +53,19 @@ export default function DataManager() {
   const fetchS3Files = async () => {
     try {
       setLoading(true);
-      const response = await fetch('/api/analysis');
-      if (!response.ok) {
-        throw new Error('Failed to fetch files');
-      }
-      const data = await response.json();
+      // The listing is paginated; follow nextCursor until every page is in
+      let data = null;
+      let cursor = null;
+      do {
+        const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+        const response = await fetch(`/api/analysis${query}`);
+        if (!response.ok) {
+          throw new Error('Failed to fetch files');
+        }
+        const page = await response.json();
+        data = data ? { ...page, files: [...data.files, ...page.files] } : page;
+        cursor = page.nextCursor;
+      } while (cursor);
       console.log('API Response:', data);
       setS3Files(data);
     } catch (err) {